@@ -0,0 +1,347 @@
+"""
+Headless HTTP API for CarbonX9's calculations, for systems such as a TMS that cannot drive the Streamlit UI.
+
+Every endpoint takes a batch of items, as NDJSON (Content-Type application/x-ndjson) or as a JSON array or
+{"items": [...]} object, and streams back one NDJSON result per item in input order. Each result carries the
+item's position in the batch as "index" (its line number for NDJSON, where blank lines are skipped), its "id" if
+it had one, and an "error" that is null for items that could be calculated. Batches are split into chunks that
+run on a bounded pool of worker processes, so large CPU-bound batches do not block the event loop or each other,
+and results are flushed as chunks finish.
+
+    POST /v1/emissions[?save=true]         source_country, source_city, dest_country, dest_city, transport_mode, weight_tons[, timestamp]
+    POST /v1/routes[?prioritize_green=true] source_country, source_city, dest_country, dest_city, weight_tons[, distance_km]
+    POST /v1/warehouse-savings             warehouse_size_m2, led_percentage, solar_percentage (fractions 0-1)
+    POST /v1/load-optimization             weight_tons, vehicle_capacity_tons[, avg_trip_distance_km]
+    POST /v1/energy-savings                facility_size_m2, smart_system_usage (fraction 0-1)
+    GET  /health, /metrics
+
+The service uses the same SQLite database as the UI; with save=true, calculated emissions are stored there.
+
+    python api.py --port 8600 --workers 4
+    curl -H 'Content-Type: application/x-ndjson' --data-binary @shipments.ndjson localhost:8600/v1/emissions
+"""
+import argparse
+import asyncio
+import collections
+import contextlib
+import inspect
+import io
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import tornado.httpserver
+import tornado.ioloop
+import tornado.iostream
+import tornado.locks
+import tornado.web
+
+import streamlit.logger
+streamlit.logger.set_log_level('error')  # silence bare-mode cache warnings
+import app  # noqa: E402
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8600
+DEFAULT_WORKERS = os.cpu_count() or 1
+CHUNK_ITEMS = 25000  # items per worker task; also the granularity of streamed output
+MAX_QUEUED_CHUNKS_PER_WORKER = 2  # chunks waiting for the pool across all requests, per worker
+MAX_BODY_BYTES = 512 * 1024 * 1024
+NDJSON_CONTENT_TYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl', 'application/json-lines')
+PASSTHROUGH_FIELDS = ('id',)
+ROUTE_COLUMNS = ['distance_km', 'mode1', 'ratio1', 'mode2', 'ratio2', 'dist1', 'dist2', 'optimized_co2', 'current_co2']
+
+# Endpoints; each maps a DataFrame of items and the request options to a result frame aligned with the items
+def emissions(items, options):
+    """Distance and CO2 per shipment, as calculate_distance and calculate_co2 give them; optionally stored."""
+    result = app.calculate_emissions_bulk(items)
+    if options.get('save'):
+        result = app.store_emissions(result)
+    return result[['distance_km', 'co2_kg', 'error']]
+
+def routes(items, options):
+    """optimize_route per shipment; distance_km defaults to the great-circle distance between the locations."""
+    missing = [column for column in ('source_country', 'dest_country', 'weight_tons') if column not in items.columns]
+    if missing:
+        raise ValueError(f"Missing route fields: {', '.join(missing)}")
+    distance_km = pd.to_numeric(items['distance_km'], errors='coerce') if 'distance_km' in items.columns \
+        else pd.Series(np.nan, index=items.index)
+    errors = pd.Series(np.full(len(items), None, dtype=object), index=items.index)
+    unknown = distance_km.isna()
+    if unknown.any():
+        priced = app.calculate_emissions_bulk(items[unknown].assign(transport_mode='Truck'))
+        distance_km[unknown] = priced['distance_km']
+        errors[unknown] = priced['error']
+    optimized = app.optimize_routes_bulk(items.assign(distance_km=distance_km), options.get('prioritize_green', False))
+    errors = errors.where(errors.notna(), optimized['error'])
+    result = optimized.assign(distance_km=distance_km)[ROUTE_COLUMNS]
+    result.loc[errors.notna(), ROUTE_COLUMNS] = None
+    return result.assign(error=errors)
+
+def _evaluate(model, arguments, rows, outputs, errors):
+    """Run model over rows; when it rejects the batch, split it to find the offending items and their messages."""
+    try:
+        savings = model(*(argument[rows] for argument in arguments))
+    except ValueError as e:
+        if len(rows) == 1:
+            errors[rows[0]] = str(e)
+            return
+        half = len(rows) // 2
+        _evaluate(model, arguments, rows[:half], outputs, errors)
+        _evaluate(model, arguments, rows[half:], outputs, errors)
+        return
+    for name, values in outputs.items():
+        values[rows] = savings[name]
+
+def savings_endpoint(model, float_outputs=(), integer_outputs=()):
+    """Endpoint over a vectorized savings model, rounded like its scalar calculate_* wrapper."""
+    parameters = inspect.signature(model).parameters
+
+    def endpoint(items, options):
+        missing = [name for name, p in parameters.items() if p.default is p.empty and name not in items.columns]
+        if missing:
+            raise ValueError(f"Missing fields: {', '.join(missing)}")
+        arguments = [pd.to_numeric(items[name], errors='coerce').fillna(p.default if p.default is not p.empty else np.nan)
+                     .to_numpy(dtype=float) if name in items.columns else np.full(len(items), p.default, dtype=float)
+                     for name, p in parameters.items()]
+        outputs = {name: np.full(len(items), np.nan) for name in float_outputs + integer_outputs}
+        errors = np.full(len(items), None, dtype=object)
+        if len(items):
+            _evaluate(model, arguments, np.arange(len(items)), outputs, errors)
+        result = pd.DataFrame(index=items.index)
+        for name in float_outputs:
+            result[name] = app._round_like_builtin(outputs[name])
+        for name in integer_outputs:
+            result[name] = pd.array(outputs[name], dtype='Float64').astype('Int64')
+        result['error'] = errors
+        return result
+
+    return endpoint
+
+ENDPOINTS = {
+    'emissions': emissions,
+    'routes': routes,
+    'warehouse-savings': savings_endpoint(app.warehouse_savings_model, ('co2_savings_kg', 'energy_savings_kwh')),
+    'load-optimization': savings_endpoint(app.load_optimization_model, ('co2_savings_kg',), ('trips_saved',)),
+    'energy-savings': savings_endpoint(app.energy_savings_model, ('co2_savings_kg', 'energy_savings_kwh')),
+}
+ENDPOINT_OPTIONS = {
+    'emissions': ('save',),
+    'routes': ('prioritize_green',),
+}
+
+# Worker processes
+def _init_worker(db_path):
+    app.DB_PATH = db_path
+
+def _items(chunk):
+    """
+    Decode a chunk of NDJSON lines (bytes) or of decoded items into a DataFrame, with each item's position in the
+    chunk. Blank NDJSON lines are skipped but keep their line number, so positions are line numbers.
+    """
+    if isinstance(chunk, bytes):
+        lines = chunk.split(b'\n')
+        positions = np.array([i for i, line in enumerate(lines) if line.strip()], dtype=np.int64)
+        if len(positions) < len(lines) - (not lines[-1].strip()):
+            chunk = b'\n'.join(lines[i] for i in positions)
+        items = pd.read_json(io.BytesIO(chunk), lines=True, dtype=False, convert_dates=False) if len(positions) else pd.DataFrame()
+        return items, positions
+    if not all(isinstance(item, dict) for item in chunk):
+        raise ValueError("Every item must be a JSON object.")
+    return pd.DataFrame.from_records(chunk), np.arange(len(chunk))
+
+def run_chunk(name, chunk, offset, options):
+    """
+    Calculate one chunk of a batch in a worker process. Returns the item count and the results as NDJSON bytes,
+    indexed from offset, the chunk's first position in the batch.
+    """
+    items, positions = _items(chunk)
+    if items.empty:
+        return 0, b''
+    result = ENDPOINTS[name](items, options).reset_index(drop=True)
+    result.insert(0, 'index', offset + positions)
+    for position, field in enumerate(field for field in PASSTHROUGH_FIELDS if field in items.columns):
+        result.insert(1 + position, field, items[field].to_numpy())
+    return len(items), result.to_json(orient='records', lines=True).encode('utf-8')
+
+class BatchRunner:
+    """Process pool for batch chunks shared by all requests, with a bound on the chunks queued for it."""
+
+    def __init__(self, workers, db_path, max_queued_per_worker=MAX_QUEUED_CHUNKS_PER_WORKER):
+        self.workers = workers
+        self.executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'),
+                                            initializer=_init_worker, initargs=(db_path,))
+        self._slots = tornado.locks.Semaphore(workers * max_queued_per_worker)
+
+    async def run(self, name, chunk, offset, options):
+        async with self._slots:
+            return await tornado.ioloop.IOLoop.current().run_in_executor(self.executor, run_chunk, name, chunk, offset, options)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+# HTTP handlers
+def _flag(value):
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+def _decode_json(pieces):
+    payload = json.loads(b''.join(pieces) or b'null')
+    if isinstance(payload, dict):
+        payload = payload.get('items')
+    if not isinstance(payload, list):
+        raise ValueError('Expected NDJSON, a JSON array of items or an {"items": [...]} object.')
+    return payload
+
+@tornado.web.stream_request_body
+class BatchHandler(tornado.web.RequestHandler):
+    """
+    Runs one batch. NDJSON bodies are cut into chunks at line boundaries as they arrive and handed to the pool
+    straight away, so the body is never held or split in one piece; JSON bodies are decoded off the event loop.
+    """
+
+    def initialize(self, runner, chunk_items):
+        self.runner = runner
+        self.chunk_items = chunk_items
+        self.streaming = False
+        self.pending = collections.deque()
+        self.pieces = []  # body received but not yet dispatched
+        self.piece_lines = 0
+        self.dispatched_lines = 0
+
+    def prepare(self):
+        self.name = self.path_args[0]
+        if self.name not in ENDPOINTS:
+            raise tornado.web.HTTPError(404)
+        self.options = {option: _flag(self.get_argument(option, 'false')) for option in ENDPOINT_OPTIONS.get(self.name, ())}
+        content_type = self.request.headers.get('Content-Type', '').split(';')[0].strip().lower()
+        self.ndjson = content_type in NDJSON_CONTENT_TYPES
+
+    def _dispatch(self, chunk, offset):
+        self.pending.append(asyncio.ensure_future(self.runner.run(self.name, chunk, offset, self.options)))
+
+    def data_received(self, data):
+        self.pieces.append(data)
+        if not self.ndjson:
+            return
+        self.piece_lines += data.count(b'\n')
+        if self.piece_lines >= self.chunk_items:
+            body = b''.join(self.pieces)
+            cut = body.rfind(b'\n') + 1
+            self._dispatch(body[:cut], self.dispatched_lines)
+            self.dispatched_lines += self.piece_lines
+            self.pieces, self.piece_lines = [body[cut:]], 0
+
+    def on_connection_close(self):
+        self._cancel()
+
+    def _cancel(self):
+        while self.pending:
+            future = self.pending.popleft()
+            if not future.cancel() and not future.cancelled():
+                future.exception()  # retrieved, so a failed chunk nobody waits for is not logged twice
+
+    def _fail(self, status, message):
+        """Report an error as the response if nothing was sent yet, else as a final NDJSON line."""
+        if self.streaming:
+            self.write(json.dumps({'error': message}) + '\n')
+        else:
+            self.set_status(status)
+            self.set_header('Content-Type', 'application/json')
+            self.write(json.dumps({'error': message}))
+
+    async def _send(self, data):
+        self.write(data)
+        await self.flush()
+        self.streaming = True
+
+    async def post(self, name):
+        try:
+            with app.metrics().timer(f"api_{name.replace('-', '_')}"):
+                if self.ndjson:
+                    tail = b''.join(self.pieces)
+                    if tail.strip():
+                        self._dispatch(tail, self.dispatched_lines)
+                else:
+                    payload = await tornado.ioloop.IOLoop.current().run_in_executor(None, _decode_json, self.pieces)
+                    for start in range(0, len(payload), self.chunk_items):
+                        self._dispatch(payload[start:start + self.chunk_items], start)
+                self.pieces = []
+                self.set_header('Content-Type', 'application/x-ndjson')
+                # Results are written in input order as each chunk completes
+                while self.pending:
+                    items, data = await self.pending.popleft()
+                    app.metrics().increment('api_items', items)
+                    await self._send(data)
+        except (ValueError, TypeError, KeyError) as e:
+            app.metrics().increment('api_rejected_batches')
+            self._fail(400, str(e) if not isinstance(e, KeyError) else f"Missing field: {e}")
+        except tornado.iostream.StreamClosedError:
+            logging.info(f"Client disconnected during /v1/{name}")
+        except Exception as e:
+            app.metrics().increment('api_errors')
+            logging.exception(f"Batch /v1/{name} failed: {e}")
+            self._fail(500, "Internal error.")
+        finally:
+            self._cancel()
+
+class HealthHandler(tornado.web.RequestHandler):
+    def initialize(self, runner):
+        self.runner = runner
+
+    def get(self):
+        self.write({'status': 'ok', 'workers': self.runner.workers, 'database': app.DB_PATH})
+
+class MetricsHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.set_header('Content-Type', 'text/plain; version=0.0.4')
+        self.write(app.metrics().prometheus())
+
+def make_application(runner, chunk_items=CHUNK_ITEMS):
+    return tornado.web.Application([
+        (r'/v1/([a-z-]+)', BatchHandler, {'runner': runner, 'chunk_items': chunk_items}),
+        (r'/health', HealthHandler, {'runner': runner}),
+        (r'/metrics', MetricsHandler),
+    ])
+
+async def serve(args):
+    app.DB_PATH = args.db
+    if not app.init_db():
+        return 1
+    # Fill the shared distance matrix once so workers start from it; later additions by workers, or by the
+    # Streamlit process, go through DistanceMatrix's file lock
+    app.distance_matrix()
+    runner = BatchRunner(args.workers, args.db)
+    server = tornado.httpserver.HTTPServer(make_application(runner, args.chunk_items), max_body_size=args.max_body_bytes)
+    server.listen(args.port, args.host)
+    logging.info(f"CarbonX9 API listening on http://{args.host}:{args.port} with {args.workers} workers ({args.db})")
+    stop = asyncio.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        with contextlib.suppress(NotImplementedError):  # no signal handlers on Windows event loops
+            asyncio.get_running_loop().add_signal_handler(signum, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        server.stop()
+        runner.shutdown()
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve CarbonX9's batch calculations over HTTP.")
+    parser.add_argument('--host', default=DEFAULT_HOST, help="Interface to listen on.")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="Port to listen on.")
+    parser.add_argument('--db', default=app.DB_PATH, help="SQLite database shared with the Streamlit UI.")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help="Worker processes for batch chunks.")
+    parser.add_argument('--chunk-items', type=int, default=CHUNK_ITEMS, help="Items per worker task.")
+    parser.add_argument('--max-body-bytes', type=int, default=MAX_BODY_BYTES, help="Largest accepted request body.")
+    args = parser.parse_args(argv)
+    if args.workers < 1 or args.chunk_items < 1:
+        parser.error("--workers and --chunk-items must be positive.")
+    return asyncio.run(serve(args))
+
+if __name__ == "__main__":
+    sys.exit(main())
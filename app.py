@@ -1,82 +1,455 @@
 import streamlit as st
 import sqlite3
 import pandas as pd
-import folium
-from streamlit_folium import folium_static
+import numpy as np
+import streamlit.components.v1 as components
+import plotly.graph_objects as go  # already loaded by Streamlit and itself lazy
 import uuid
 import math
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 import time
 import datetime
 import logging
-from geopy.geocoders import Nominatim
-from folium.plugins import MarkerCluster
+import queue
+import collections
+import threading
+import contextlib
+import itertools
+import functools
+import bisect
+import os
+import json
+import csv
+import io
+import gzip
+import importlib
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory file locks, so distance matrices stay private to each process
+    fcntl = None
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Heavy libraries load on first use, so pages that do not draw maps or charts never import them
+class LazyModule:
+    """Module proxy that imports the module on first attribute access."""
+
+    def __init__(self, name):
+        self._name = name
+
+    def __getattr__(self, attr):
+        return getattr(importlib.import_module(self._name), attr)
+
+folium = LazyModule('folium')
+px = LazyModule('plotly.express')
+
+def folium_static(fig, width=700, height=500):
+    """Render a Folium map with streamlit_folium (imported on first use)."""
+    from streamlit_folium import folium_static as render
+    return render(fig, width=width, height=height)
+
+# Database connection management
+DB_PATH = 'emissions.db'
+DB_POOL_SIZE = 8
+DB_BUSY_TIMEOUT_MS = 5000
+DB_STATEMENT_CACHE_SIZE = 256
+DB_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': DB_BUSY_TIMEOUT_MS,
+    'temp_store': 'MEMORY',
+    'cache_size': -65536,  # 64 MB page cache per connection
+    'mmap_size': 268435456
+}
+
+class ConnectionPool:
+    """Process-wide pool of SQLite connections shared by Streamlit's script threads."""
+
+    def __init__(self, db_path, size=DB_POOL_SIZE):
+        self.db_path = db_path
+        self.size = size
+        self._idle = queue.LifoQueue()
+
+    def _open(self):
+        # Connections are handed between threads but only ever used by one at a time
+        conn = sqlite3.connect(self.db_path, timeout=DB_BUSY_TIMEOUT_MS / 1000, check_same_thread=False,
+                               cached_statements=DB_STATEMENT_CACHE_SIZE)
+        for pragma, value in DB_PRAGMAS.items():
+            conn.execute(f'PRAGMA {pragma}={value}')
+        return conn
+
+    @contextlib.contextmanager
+    def connection(self):
+        """Borrow a connection; the block runs as one transaction (commit on success, rollback on error)."""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._open()
+        try:
+            with conn:
+                yield conn
+        finally:
+            if self._idle.qsize() < self.size:
+                self._idle.put(conn)
+            else:
+                conn.close()
+
+    def close(self):
+        """Close all idle connections."""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+@st.cache_resource(show_spinner=False)
+def _connection_pool(db_path):
+    return ConnectionPool(db_path)
+
+def db_connection():
+    """Borrow a pooled connection to DB_PATH for use in a with-block."""
+    return _connection_pool(DB_PATH).connection()
+
+# Instrumentation
+METRICS_WINDOW = 2048  # most recent durations kept per timer for percentiles
+METRICS_QUANTILES = (0.5, 0.9, 0.99)
+METRICS_PREFIX = 'carbonx9'
+# File for a local scraper to poll (.json, otherwise Prometheus text), from CARBONX9_METRICS_DUMP; unset disables
+METRICS_DUMP_PATH = os.environ.get('CARBONX9_METRICS_DUMP') or None
+METRICS_DUMP_INTERVAL_SECONDS = 15
+
+class Metrics:
+    """Thread-safe process-wide counters and timers; timers keep a count, a total and a window of recent durations."""
+
+    def __init__(self, window=METRICS_WINDOW):
+        self.window = window
+        self.started_at = time.time()
+        self._counters = collections.Counter()
+        self._timers = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self._counters[name] += value
+
+    def observe(self, name, seconds):
+        with self._lock:
+            timer = self._timers.get(name)
+            if timer is None:
+                timer = self._timers[name] = [0, 0.0, collections.deque(maxlen=self.window)]
+            timer[0] += 1
+            timer[1] += seconds
+            timer[2].append(seconds)
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        """Time the with-block under name."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def snapshot(self):
+        """Counters, and per timer the call count, total and the max and quantiles of recent durations (seconds)."""
+        with self._lock:
+            counters = dict(self._counters)
+            timers = {name: (count, total, np.array(recent)) for name, (count, total, recent) in self._timers.items()}
+        summary = {}
+        for name, (count, total, recent) in sorted(timers.items()):
+            quantiles = np.quantile(recent, METRICS_QUANTILES)
+            summary[name] = {'count': count, 'total_s': total, 'max_s': float(recent.max()),
+                             **{f"p{round(q * 100)}_s": float(v) for q, v in zip(METRICS_QUANTILES, quantiles)}}
+        return {'uptime_s': time.time() - self.started_at, 'counters': dict(sorted(counters.items())), 'timers': summary}
+
+    def prometheus(self):
+        """The snapshot in Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = [f"# TYPE {METRICS_PREFIX}_uptime_seconds gauge", f"{METRICS_PREFIX}_uptime_seconds {snapshot['uptime_s']:.3f}"]
+        for name, value in snapshot['counters'].items():
+            metric = f"{METRICS_PREFIX}_{name}_total"
+            lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+        for name, timer in snapshot['timers'].items():
+            metric = f"{METRICS_PREFIX}_{name}_seconds"
+            lines.append(f"# TYPE {metric} summary")
+            lines += [f'{metric}{{quantile="{q}"}} {timer[f"p{round(q * 100)}_s"]:.6f}' for q in METRICS_QUANTILES]
+            lines += [f"{metric}_sum {timer['total_s']:.6f}", f"{metric}_count {timer['count']}"]
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._timers.clear()
+            self.started_at = time.time()
+
+def write_metrics(registry, path):
+    """Atomically write a metrics dump to path: JSON for .json files, Prometheus text otherwise."""
+    payload = json.dumps(registry.snapshot(), indent=2) if path.endswith('.json') else registry.prometheus()
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(payload)
+    os.replace(tmp_path, path)
+
+def _metrics_dump_loop(registry, path, interval_seconds):
+    while True:
+        try:
+            write_metrics(registry, path)
+        except OSError:
+            logging.exception("Metrics dump failed")
+        time.sleep(interval_seconds)
+
+@st.cache_resource(show_spinner=False)
+def metrics():
+    """Process-wide metrics registry; also starts the periodic dump when METRICS_DUMP_PATH is set."""
+    registry = Metrics()
+    if METRICS_DUMP_PATH:
+        threading.Thread(target=_metrics_dump_loop, args=(registry, METRICS_DUMP_PATH, METRICS_DUMP_INTERVAL_SECONDS),
+                         name='carbonx9-metrics', daemon=True).start()
+    return registry
+
+def instrumented(fn):
+    """Decorator recording each call's duration (and so the call count) under the function's name."""
+    registry = metrics()  # looked up once here rather than through the resource cache on every call
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with registry.timer(fn.__name__):
+            return fn(*args, **kwargs)
+    return wrapper
+
+# Schema migrations
+# Each migration runs once, in order, and bumps PRAGMA user_version inside its own transaction
+SAMPLE_SUPPLIERS = [
+    ('UK Steel Co', 'United Kingdom', 'London', 'Steel', 85, 50000, 'Renewable energy'),
+    ('London Tech Supplies', 'United Kingdom', 'London', 'Electronics', 70, 20000, 'Recycling'),
+    ('British Textiles Ltd', 'United Kingdom', 'London', 'Textiles', 65, 30000, 'Sustainable sourcing'),
+    ('French Steelworks', 'France', 'Paris', 'Steel', 80, 45000, 'Energy-efficient manufacturing'),
+    ('Paris Electronics Hub', 'France', 'Paris', 'Electronics', 75, 25000, 'Carbon offsetting'),
+    ('ChemFrance', 'France', 'Paris', 'Chemicals', 60, 40000, 'Waste reduction'),
+    ('American Steel Corp', 'USA', 'New York', 'Steel', 75, 60000, 'Renewable energy'),
+    ('NY Tech Innovate', 'USA', 'New York', 'Electronics', 80, 30000, 'Sustainable packaging'),
+    ('US Textile Giants', 'USA', 'New York', 'Textiles', 70, 35000, 'Recycling'),
+    ('China Steel Group', 'China', 'Shanghai', 'Steel', 65, 80000, 'Energy-efficient manufacturing'),
+    ('Shanghai Electronics', 'China', 'Shanghai', 'Electronics', 60, 50000, 'Carbon offsetting'),
+    ('EastChem Co', 'China', 'Shanghai', 'Chemicals', 55, 60000, 'Waste reduction'),
+    ('Nippon Steel', 'Japan', 'Tokyo', 'Steel', 80, 55000, 'Renewable energy'),
+    ('Tokyo Tech Solutions', 'Japan', 'Tokyo', 'Electronics', 85, 40000, 'Sustainable packaging'),
+    ('Japan Textiles', 'Japan', 'Tokyo', 'Textiles', 70, 30000, 'Recycling'),
+    ('Aussie Steelworks', 'Australia', 'Sydney', 'Steel', 75, 40000, 'Sustainable sourcing'),
+    ('Sydney Chem Supplies', 'Australia', 'Sydney', 'Chemicals', 65, 35000, 'Energy-efficient manufacturing'),
+    ('Aus Textiles', 'Australia', 'Sydney', 'Textiles', 70, 25000, 'Carbon offsetting')
+]
+
+def _migration_initial_schema(c):
+    """Create suppliers, emissions, packaging, offsets and coordinates tables with indexes and sample suppliers."""
+    # Create suppliers table
+    c.execute('''CREATE TABLE IF NOT EXISTS suppliers 
+                (id TEXT PRIMARY KEY, supplier_name TEXT, country TEXT, city TEXT, 
+                 material TEXT, green_score INTEGER, annual_capacity_tons INTEGER, 
+                 sustainable_practices TEXT, created_at DATETIME DEFAULT CURRENT_TIMESTAMP)''')
+    # Create emissions table
+    c.execute('''CREATE TABLE IF NOT EXISTS emissions 
+                (id TEXT PRIMARY KEY, source TEXT, destination TEXT, 
+                 transport_mode TEXT, distance_km REAL, co2_kg REAL, 
+                 weight_tons REAL, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)''')
+    # Create packaging table
+    c.execute('''CREATE TABLE IF NOT EXISTS packaging 
+                (id TEXT PRIMARY KEY, material_type TEXT, weight_kg REAL, 
+                 co2_kg REAL, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)''')
+    # Create offsets table
+    c.execute('''CREATE TABLE IF NOT EXISTS offsets 
+                (id TEXT PRIMARY KEY, project_type TEXT, co2_offset_tons REAL, 
+                 cost_usd REAL, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)''')
+    # Create coordinates table for geocoding cache
+    c.execute('''CREATE TABLE IF NOT EXISTS coordinates 
+                (country TEXT, city TEXT, lat REAL, lon REAL, PRIMARY KEY (country, city))''')
+    # Add indexes
+    c.execute('CREATE INDEX IF NOT EXISTS idx_suppliers_country ON suppliers(country)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_emissions_timestamp ON emissions(timestamp)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_packaging_timestamp ON packaging(timestamp)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_offsets_timestamp ON offsets(timestamp)')
+    # Insert sample supplier data (databases created before migrations already have it)
+    if c.execute('SELECT COUNT(*) FROM suppliers').fetchone()[0] == 0:
+        c.executemany('INSERT INTO suppliers (id, supplier_name, country, city, material, green_score, annual_capacity_tons, sustainable_practices) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                      [(str(uuid.uuid4()),) + supplier for supplier in SAMPLE_SUPPLIERS])
+
+# Tables whose writes are tracked in data_versions
+VERSIONED_TABLES = ['suppliers', 'emissions', 'packaging', 'offsets', 'coordinates', 'market_prices']
+
+def _migration_data_versions(c):
+    """Per-table write sequence, bumped once per write transaction, used to stamp cached results."""
+    c.execute('''CREATE TABLE IF NOT EXISTS data_versions 
+                (table_name TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0)''')
+    c.executemany('INSERT OR IGNORE INTO data_versions (table_name, version) VALUES (?, 0)', [(table,) for table in VERSIONED_TABLES])
+
+# Rollup tables maintained alongside emissions/offsets writes: (table, key columns, key expressions over the source table)
+EMISSION_ROLLUPS = [
+    ('emission_totals_by_mode', ('transport_mode',), ('transport_mode',)),
+    ('emission_totals_by_day', ('day',), ('substr(timestamp, 1, 10)',)),
+    ('emission_totals_by_month', ('month',), ('substr(timestamp, 1, 7)',)),
+    ('emission_totals_by_lane', ('source_location_id', 'dest_location_id'), ('source_location_id', 'dest_location_id')),
+]
+OFFSET_ROLLUPS = [
+    ('offset_totals_by_project', ('project_type',), ('project_type',)),
+]
+
+def _rollup_emissions(conn, where, params=(), sign=1, rollups=None):
+    """
+    Add (sign=1) or subtract (sign=-1) the emissions rows matching `where` to every rollup table (or just `rollups`).
+    Must run in the same transaction as the insert, or before the delete, it accounts for.
+    """
+    for table, keys, expressions in rollups or EMISSION_ROLLUPS:
+        key_columns, key_expressions = ', '.join(keys), ', '.join(expressions)
+        conn.execute(f'''INSERT INTO {table} ({key_columns}, shipments, co2_kg, weight_tons, ton_km)
+                        SELECT {key_expressions}, ? * COUNT(*), ? * SUM(co2_kg), ? * TOTAL(weight_tons), ? * TOTAL(distance_km * weight_tons)
+                        FROM emissions WHERE {where} GROUP BY {key_expressions}
+                        ON CONFLICT ({key_columns}) DO UPDATE SET shipments = shipments + excluded.shipments, co2_kg = co2_kg + excluded.co2_kg,
+                            weight_tons = weight_tons + excluded.weight_tons, ton_km = ton_km + excluded.ton_km''',
+                     (sign, sign, sign, sign, *params))
+        if sign < 0:
+            conn.execute(f'DELETE FROM {table} WHERE shipments <= 0')
+
+def _rollup_offsets(conn, where, params=(), sign=1):
+    """Add or subtract the offsets rows matching `where` to the offset rollup tables (see _rollup_emissions)."""
+    for table, keys, expressions in OFFSET_ROLLUPS:
+        key_columns, key_expressions = ', '.join(keys), ', '.join(expressions)
+        conn.execute(f'''INSERT INTO {table} ({key_columns}, projects, co2_offset_tons, cost_usd)
+                        SELECT {key_expressions}, ? * COUNT(*), ? * SUM(co2_offset_tons), ? * SUM(cost_usd) FROM offsets WHERE {where} GROUP BY {key_expressions}
+                        ON CONFLICT ({key_columns}) DO UPDATE SET projects = projects + excluded.projects,
+                            co2_offset_tons = co2_offset_tons + excluded.co2_offset_tons, cost_usd = cost_usd + excluded.cost_usd''',
+                     (sign, sign, sign, *params))
+        if sign < 0:
+            conn.execute(f'DELETE FROM {table} WHERE projects <= 0')
+
+def _key_definitions(keys):
+    return ', '.join(f"{key} {'INTEGER' if key.endswith('_id') else 'TEXT'}" for key in keys)
+
+def _create_emission_rollups(c, rollups):
+    for table, keys, _ in rollups:
+        c.execute(f'''CREATE TABLE IF NOT EXISTS {table} 
+                    ({_key_definitions(keys)}, shipments INTEGER NOT NULL, co2_kg REAL NOT NULL, 
+                     weight_tons REAL NOT NULL DEFAULT 0, ton_km REAL NOT NULL DEFAULT 0, 
+                     PRIMARY KEY ({', '.join(keys)}))''')
+    _rollup_emissions(c, '1', rollups=rollups)
+
+def _migration_rollups(c):
+    """Create emission and offset rollup tables and backfill them from existing rows."""
+    # Lanes were keyed on the location labels until migration 4 introduced location ids
+    _create_emission_rollups(c, EMISSION_ROLLUPS[:3] + [('emission_totals_by_lane', ('source', 'destination'), ('source', 'destination'))])
+    for table, keys, _ in OFFSET_ROLLUPS:
+        c.execute(f'''CREATE TABLE IF NOT EXISTS {table} 
+                    ({_key_definitions(keys)}, projects INTEGER NOT NULL, co2_offset_tons REAL NOT NULL, 
+                     cost_usd REAL NOT NULL, PRIMARY KEY ({', '.join(keys)}))''')
+    _rollup_offsets(c, '1')
+
+def _migration_locations(c):
+    """
+    Create the locations dimension, reference it from emissions by id and re-key the lane rollup on location ids.
+    Existing rows are linked by splitting their "City, Country" labels once, here.
+    """
+    c.execute('''CREATE TABLE IF NOT EXISTS locations 
+                (id INTEGER PRIMARY KEY, country TEXT NOT NULL, city TEXT NOT NULL, UNIQUE (country, city))''')
+    c.execute('ALTER TABLE emissions ADD COLUMN source_location_id INTEGER REFERENCES locations(id)')
+    c.execute('ALTER TABLE emissions ADD COLUMN dest_location_id INTEGER REFERENCES locations(id)')
+    labels = [row[0] for row in c.execute('SELECT source FROM emissions UNION SELECT destination FROM emissions') if row[0] is not None]
+    c.execute('CREATE TEMP TABLE legacy_locations (label TEXT PRIMARY KEY, location_id INTEGER)')
+    for label in labels:
+        city, _, country = label.rpartition(', ')
+        if not city:
+            city, country = label, ''
+        c.execute('INSERT OR IGNORE INTO locations (country, city) VALUES (?, ?)', (country, city))
+        c.execute('INSERT INTO legacy_locations (label, location_id) SELECT ?, id FROM locations WHERE country = ? AND city = ?',
+                  (label, country, city))
+    c.execute('''UPDATE emissions SET 
+                   source_location_id = (SELECT location_id FROM legacy_locations WHERE label = emissions.source),
+                   dest_location_id = (SELECT location_id FROM legacy_locations WHERE label = emissions.destination)''')
+    c.execute('DROP TABLE legacy_locations')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_emissions_lane ON emissions(source_location_id, dest_location_id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_emissions_dest_location ON emissions(dest_location_id)')
+    c.execute('DROP TABLE IF EXISTS emission_totals_by_lane')
+    _create_emission_rollups(c, [rollup for rollup in EMISSION_ROLLUPS if rollup[0] == 'emission_totals_by_lane'])
+
+def _location_ids(conn, pairs):
+    """Return the locations id of each (country, city) pair, adding unknown locations."""
+    pairs = list(pairs)
+    ids = {}
+    for country, city in dict.fromkeys(pairs):
+        conn.execute('INSERT OR IGNORE INTO locations (country, city) VALUES (?, ?)', (country, city))
+        ids[(country, city)] = conn.execute('SELECT id FROM locations WHERE country = ? AND city = ?', (country, city)).fetchone()[0]
+    return [ids[pair] for pair in pairs]
+
+def _migration_market_prices(c):
+    """Create the market_prices time series of carbon price and exchange rate quotes."""
+    c.execute('''CREATE TABLE IF NOT EXISTS market_prices 
+                (symbol TEXT NOT NULL, observed_at DATETIME NOT NULL, price REAL NOT NULL, 
+                 PRIMARY KEY (symbol, observed_at))''')
+    # Databases past migration 2 were stamped before market_prices was versioned
+    c.execute("INSERT OR IGNORE INTO data_versions (table_name, version) VALUES ('market_prices', 0)")
+
+def _migration_rollup_tonnage(c):
+    """Add shipped tons and ton-km to the emission rollups and rebuild them from the emissions table."""
+    for table, _, _ in EMISSION_ROLLUPS:
+        columns = {row[1] for row in c.execute(f'PRAGMA table_info({table})')}
+        # Rollups created after this migration was written already have the columns
+        for column in ('weight_tons', 'ton_km'):
+            if column not in columns:
+                c.execute(f'ALTER TABLE {table} ADD COLUMN {column} REAL NOT NULL DEFAULT 0')
+        c.execute(f'DELETE FROM {table}')
+    _rollup_emissions(c, '1')
+    _bump_data_version(c, 'emissions')
+
+SCHEMA_MIGRATIONS = [
+    (1, "initial schema", _migration_initial_schema),
+    (2, "data version stamps", _migration_data_versions),
+    (3, "emission and offset rollups", _migration_rollups),
+    (4, "locations dimension", _migration_locations),
+    (5, "market price history", _migration_market_prices),
+    (6, "tonnage in emission rollups", _migration_rollup_tonnage),
+]
+
+def migrate_db():
+    """Apply pending schema migrations in order. Raises sqlite3.Error on failure."""
+    with db_connection() as conn:
+        for version, description, migrate in SCHEMA_MIGRATIONS:
+            if version <= conn.execute('PRAGMA user_version').fetchone()[0]:
+                continue
+            # Take the write lock before re-checking so concurrent processes apply each migration once
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                if version > conn.execute('PRAGMA user_version').fetchone()[0]:
+                    migrate(conn.cursor())
+                    conn.execute(f'PRAGMA user_version = {version}')
+                    logging.info(f"Applied schema migration {version}: {description}")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+def _bump_data_version(conn, *tables):
+    """Advance the write sequence of tables inside the caller's write transaction."""
+    conn.executemany('UPDATE data_versions SET version = version + 1 WHERE table_name = ?', [(table,) for table in tables])
+
+@instrumented
+def get_data_version(*tables):
+    """Return a stamp that changes whenever any of the given tables (default: all) is written."""
+    tables = tables or tuple(VERSIONED_TABLES)
+    with db_connection() as conn:
+        versions = dict(conn.execute(f'SELECT table_name, version FROM data_versions WHERE table_name IN ({", ".join("?" * len(tables))})',
+                                     tables).fetchall())
+    return tuple(versions.get(table, 0) for table in tables)
+
 # Initialize SQLite database
 def init_db():
     """
-    Initialize the SQLite database with suppliers, emissions, packaging, offsets, and coordinates tables.
-    Adds indexes and inserts sample supplier data.
+    Initialize the SQLite database with suppliers, emissions, packaging, offsets, and coordinates tables
+    by applying any pending schema migrations.
     """
     try:
-        with sqlite3.connect('emissions.db') as conn:
-            c = conn.cursor()
-            # Create suppliers table
-            c.execute('''CREATE TABLE IF NOT EXISTS suppliers 
-                        (id TEXT PRIMARY KEY, supplier_name TEXT, country TEXT, city TEXT, 
-                         material TEXT, green_score INTEGER, annual_capacity_tons INTEGER, 
-                         sustainable_practices TEXT, created_at DATETIME DEFAULT CURRENT_TIMESTAMP)''')
-            # Create emissions table
-            c.execute('''CREATE TABLE IF NOT EXISTS emissions 
-                        (id TEXT PRIMARY KEY, source TEXT, destination TEXT, 
-                         transport_mode TEXT, distance_km REAL, co2_kg REAL, 
-                         weight_tons REAL, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)''')
-            # Create packaging table
-            c.execute('''CREATE TABLE IF NOT EXISTS packaging 
-                        (id TEXT PRIMARY KEY, material_type TEXT, weight_kg REAL, 
-                         co2_kg REAL, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)''')
-            # Create offsets table
-            c.execute('''CREATE TABLE IF NOT EXISTS offsets 
-                        (id TEXT PRIMARY KEY, project_type TEXT, co2_offset_tons REAL, 
-                         cost_usd REAL, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)''')
-            # Create coordinates table for geocoding cache
-            c.execute('''CREATE TABLE IF NOT EXISTS coordinates 
-                        (country TEXT, city TEXT, lat REAL, lon REAL, PRIMARY KEY (country, city))''')
-            # Add indexes
-            c.execute('CREATE INDEX IF NOT EXISTS idx_suppliers_country ON suppliers(country)')
-            c.execute('CREATE INDEX IF NOT EXISTS idx_emissions_timestamp ON emissions(timestamp)')
-            c.execute('CREATE INDEX IF NOT EXISTS idx_packaging_timestamp ON packaging(timestamp)')
-            c.execute('CREATE INDEX IF NOT EXISTS idx_offsets_timestamp ON offsets(timestamp)')
-            # Insert sample supplier data
-            sample_suppliers = [
-                (str(uuid.uuid4()), 'UK Steel Co', 'United Kingdom', 'London', 'Steel', 85, 50000, 'Renewable energy'),
-                (str(uuid.uuid4()), 'London Tech Supplies', 'United Kingdom', 'London', 'Electronics', 70, 20000, 'Recycling'),
-                (str(uuid.uuid4()), 'British Textiles Ltd', 'United Kingdom', 'London', 'Textiles', 65, 30000, 'Sustainable sourcing'),
-                (str(uuid.uuid4()), 'French Steelworks', 'France', 'Paris', 'Steel', 80, 45000, 'Energy-efficient manufacturing'),
-                (str(uuid.uuid4()), 'Paris Electronics Hub', 'France', 'Paris', 'Electronics', 75, 25000, 'Carbon offsetting'),
-                (str(uuid.uuid4()), 'ChemFrance', 'France', 'Paris', 'Chemicals', 60, 40000, 'Waste reduction'),
-                (str(uuid.uuid4()), 'American Steel Corp', 'USA', 'New York', 'Steel', 75, 60000, 'Renewable energy'),
-                (str(uuid.uuid4()), 'NY Tech Innovate', 'USA', 'New York', 'Electronics', 80, 30000, 'Sustainable packaging'),
-                (str(uuid.uuid4()), 'US Textile Giants', 'USA', 'New York', 'Textiles', 70, 35000, 'Recycling'),
-                (str(uuid.uuid4()), 'China Steel Group', 'China', 'Shanghai', 'Steel', 65, 80000, 'Energy-efficient manufacturing'),
-                (str(uuid.uuid4()), 'Shanghai Electronics', 'China', 'Shanghai', 'Electronics', 60, 50000, 'Carbon offsetting'),
-                (str(uuid.uuid4()), 'EastChem Co', 'China', 'Shanghai', 'Chemicals', 55, 60000, 'Waste reduction'),
-                (str(uuid.uuid4()), 'Nippon Steel', 'Japan', 'Tokyo', 'Steel', 80, 55000, 'Renewable energy'),
-                (str(uuid.uuid4()), 'Tokyo Tech Solutions', 'Japan', 'Tokyo', 'Electronics', 85, 40000, 'Sustainable packaging'),
-                (str(uuid.uuid4()), 'Japan Textiles', 'Japan', 'Tokyo', 'Textiles', 70, 30000, 'Recycling'),
-                (str(uuid.uuid4()), 'Aussie Steelworks', 'Australia', 'Sydney', 'Steel', 75, 40000, 'Sustainable sourcing'),
-                (str(uuid.uuid4()), 'Sydney Chem Supplies', 'Australia', 'Sydney', 'Chemicals', 65, 35000, 'Energy-efficient manufacturing'),
-                (str(uuid.uuid4()), 'Aus Textiles', 'Australia', 'Sydney', 'Textiles', 70, 25000, 'Carbon offsetting')
-            ]
-            c.executemany('INSERT OR IGNORE INTO suppliers (id, supplier_name, country, city, material, green_score, annual_capacity_tons, sustainable_practices) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', sample_suppliers)
-            conn.commit()
+        migrate_db()
+        return True
     except sqlite3.Error as e:
         handle_error(f"Database initialization failed: {e}")
+        return False
 
 # Centralized error handling
 def handle_error(message, user_message=None):
@@ -84,20 +457,82 @@ def handle_error(message, user_message=None):
     logging.error(message)
     st.error(user_message or f"An error occurred: {message}. Please try again or contact support.")
 
+# Retention and background maintenance
+RETENTION_DAYS = 365
+RETENTION_TABLES = ['emissions', 'packaging', 'offsets']
+RETENTION_CHUNK_SIZE = 5000
+RETENTION_CHUNK_PAUSE_SECONDS = 0.01
+MAINTENANCE_INTERVAL_SECONDS = 3600
+MAINTENANCE_START_DELAY_SECONDS = 30
+
+def _purge_expired(retention_days=RETENTION_DAYS, chunk_size=RETENTION_CHUNK_SIZE):
+    """Delete expired rows in chunks of chunk_size, one short transaction per chunk. Returns rows deleted."""
+    cutoff_date = (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=retention_days)).strftime('%Y-%m-%d %H:%M:%S')
+    deleted = 0
+    for table in RETENTION_TABLES:
+        while True:
+            with db_connection() as conn:
+                # Pick the chunk once so the rollup subtraction and the delete cover exactly the same rows
+                conn.execute('CREATE TEMP TABLE IF NOT EXISTS purge_chunk (row_id INTEGER PRIMARY KEY)')
+                conn.execute('DELETE FROM temp.purge_chunk')
+                conn.execute(f'INSERT INTO temp.purge_chunk SELECT rowid FROM {table} WHERE timestamp < ? ORDER BY rowid LIMIT ?',
+                             (cutoff_date, chunk_size))
+                expired = 'rowid IN (SELECT row_id FROM temp.purge_chunk)'
+                if table == 'emissions':
+                    _rollup_emissions(conn, expired, sign=-1)
+                elif table == 'offsets':
+                    _rollup_offsets(conn, expired, sign=-1)
+                cursor = conn.execute(f'DELETE FROM {table} WHERE {expired}')
+                if cursor.rowcount:
+                    _bump_data_version(conn, table)
+            deleted += cursor.rowcount
+            if cursor.rowcount < chunk_size:
+                break
+            time.sleep(RETENTION_CHUNK_PAUSE_SECONDS)
+    logging.info(f"Cleaned up {deleted} records older than {cutoff_date}")
+    return deleted
+
 # Cleanup old records
-def cleanup_old_records(retention_days=365):
+def cleanup_old_records(retention_days=RETENTION_DAYS):
     """Remove records older than retention_days from emissions, packaging, and offsets tables."""
     try:
-        with sqlite3.connect('emissions.db') as conn:
-            c = conn.cursor()
-            cutoff_date = datetime.datetime.now() - datetime.timedelta(days=retention_days)
-            c.execute('DELETE FROM emissions WHERE timestamp < ?', (cutoff_date,))
-            c.execute('DELETE FROM packaging WHERE timestamp < ?', (cutoff_date,))
-            c.execute('DELETE FROM offsets WHERE timestamp < ?', (cutoff_date,))
-            conn.commit()
-            logging.info(f"Cleaned up records older than {cutoff_date}")
+        return _purge_expired(retention_days)
     except sqlite3.Error as e:
         handle_error(f"Database cleanup failed: {e}", "Failed to clean up old records.")
+        return 0
+
+def _maintenance_loop(stop_event, interval_seconds, retention_days):
+    if stop_event.wait(MAINTENANCE_START_DELAY_SECONDS):
+        return
+    while True:
+        try:
+            _purge_expired(retention_days)
+            with db_connection() as conn:
+                conn.execute('PRAGMA optimize')
+            # Keep snapshots current once one has been exported
+            if SNAPSHOT_ON_MAINTENANCE and snapshot_available():
+                export_snapshots()
+        except (sqlite3.Error, ValueError, OSError):
+            logging.exception("Background maintenance failed")
+        if stop_event.wait(interval_seconds):
+            return
+
+def start_maintenance_job(interval_seconds=MAINTENANCE_INTERVAL_SECONDS, retention_days=RETENTION_DAYS):
+    """Start the background retention job. Returns an Event that stops the job when set."""
+    stop_event = threading.Event()
+    threading.Thread(target=_maintenance_loop, args=(stop_event, interval_seconds, retention_days),
+                     name='carbonx9-maintenance', daemon=True).start()
+    return stop_event
+
+@st.cache_resource(show_spinner=False)
+def _database_runtime(db_path):
+    migrate_db()
+    coordinate_cache()
+    return start_maintenance_job()
+
+def ensure_database():
+    """Migrate the database and start background maintenance once per process, not on every rerun."""
+    return _database_runtime(DB_PATH)
 
 # DEFRA-based emission factors (kg CO2 per km per ton)
 EMISSION_FACTORS = {
@@ -120,20 +555,16 @@ LOCATIONS = {
     'Australia': {'Sydney': (-33.8688, 151.2093)}
 }
 
-# Simulated carbon price fetch
-def fetch_carbon_price():
-    """Simulate fetching carbon price from an API (e.g., EU ETS)."""
-    try:
-        import random
-        base_price = 65.89
-        variation = random.uniform(-2.0, 2.0)
-        return round(base_price + variation, 2)
-    except Exception as e:
-        handle_error(f"Failed to fetch carbon price: {e}", "Using default carbon price.")
-        return 65.89
+# Market data: carbon price and exchange rates
+MARKET_DATA_PROVIDER = None  # object with fetch() -> {symbol: price}; None uses MARKET_DATA_URL, else the simulated stub
+MARKET_DATA_URL = None  # endpoint returning a JSON object of {symbol: price}, optionally under a "prices" key
+MARKET_DATA_TTL_SECONDS = 3600
+MARKET_DATA_RETRY_SECONDS = 60  # wait after a failed fetch before trying again
+MARKET_DATA_TIMEOUT_SECONDS = 10
+CARBON_PRICE_SYMBOL = 'EUA'  # EU ETS allowance, EUR per ton CO2
+DEFAULT_CARBON_PRICE = 65.89
 
-# Dynamic carbon pricing
-CARBON_PRICE_EUR_PER_TON = fetch_carbon_price()
+# Units of each currency per EUR, used until the provider has quoted a rate
 EXCHANGE_RATES = {
     'EUR': 1.0,
     'USD': 1.06,
@@ -141,6 +572,136 @@ EXCHANGE_RATES = {
     'SAR': 3.98
 }
 
+def fx_symbol(currency):
+    """Market data symbol of the EUR exchange rate of currency (units of currency per EUR)."""
+    return f'EUR{currency}'
+
+class SimulatedMarketData:
+    """Local stub provider: the carbon price varies around DEFAULT_CARBON_PRICE and FX rates are EXCHANGE_RATES."""
+
+    def __init__(self, seed=None):
+        self._rng = np.random.default_rng(seed)
+
+    def fetch(self):
+        prices = {CARBON_PRICE_SYMBOL: round(DEFAULT_CARBON_PRICE + self._rng.uniform(-2.0, 2.0), 2)}
+        prices.update({fx_symbol(currency): rate for currency, rate in EXCHANGE_RATES.items() if currency != 'EUR'})
+        return prices
+
+class JsonEndpointMarketData:
+    """Provider for an HTTP endpoint returning {symbol: price}, or {"prices": {symbol: price}}, as JSON."""
+
+    def __init__(self, url, timeout=MARKET_DATA_TIMEOUT_SECONDS):
+        self.url = url
+        self.timeout = timeout
+
+    def fetch(self):
+        import urllib.request
+        with urllib.request.urlopen(self.url, timeout=self.timeout) as response:
+            payload = json.load(response)
+        return payload.get('prices', payload)
+
+class MarketData:
+    """
+    TTL cache of the latest market prices. Reads never block: once the cache expires they keep serving the last
+    quotes while a background thread fetches new ones from the provider and appends them to market_prices.
+    """
+
+    def __init__(self, provider, ttl_seconds=MARKET_DATA_TTL_SECONDS, retry_seconds=MARKET_DATA_RETRY_SECONDS):
+        self.provider = provider
+        self.ttl_seconds = ttl_seconds
+        self.retry_seconds = retry_seconds
+        self._prices = {}
+        self._observed_at = None  # epoch seconds of the latest quotes
+        self._attempted_at = None  # monotonic time of the latest fetch attempt
+        self._lock = threading.Lock()
+        self._thread = None
+        self._load()
+
+    def _load(self):
+        """Start from the latest stored quote of each symbol, so a restart within the TTL does not refetch."""
+        try:
+            with db_connection() as conn:
+                rows = conn.execute('SELECT symbol, price, MAX(observed_at) FROM market_prices GROUP BY symbol').fetchall()
+        except sqlite3.Error as e:
+            logging.error(f"Failed to load stored market prices: {e}")
+            return
+        self._prices = {symbol: price for symbol, price, _ in rows}
+        if rows:
+            latest = max(observed_at for _, _, observed_at in rows)
+            self._observed_at = datetime.datetime.fromisoformat(latest).replace(tzinfo=datetime.timezone.utc).timestamp()
+
+    def price(self, symbol):
+        """Latest quote of symbol, or None if it has never been quoted. Starts a background refresh when stale."""
+        with self._lock:
+            stale = self._observed_at is None or time.time() - self._observed_at >= self.ttl_seconds
+            idle = self._thread is None or not self._thread.is_alive()
+            due = self._attempted_at is None or time.monotonic() - self._attempted_at >= self.retry_seconds
+            if stale and idle and due:
+                self._attempted_at = time.monotonic()
+                self._thread = threading.Thread(target=self.refresh, name='carbonx9-market-data', daemon=True)
+                self._thread.start()
+            return self._prices.get(symbol)
+
+    def as_of(self):
+        """Datetime (UTC) of the latest quotes, or None."""
+        with self._lock:
+            observed_at = self._observed_at
+        return None if observed_at is None else datetime.datetime.fromtimestamp(observed_at, datetime.timezone.utc)
+
+    def refresh(self):
+        """Fetch quotes from the provider now and store them. Returns the quotes, or None if the fetch failed."""
+        try:
+            with metrics().timer('market_data_fetch'):
+                quotes = self.provider.fetch()
+            quotes = {str(symbol): float(price) for symbol, price in quotes.items()}
+        except Exception as e:
+            metrics().increment('market_data_errors')
+            logging.error(f"Failed to fetch market data: {e}")
+            return None
+        quotes = {symbol: price for symbol, price in quotes.items() if math.isfinite(price) and price > 0}
+        observed_at = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+        try:
+            with db_connection() as conn:
+                conn.executemany('INSERT OR REPLACE INTO market_prices (symbol, observed_at, price) VALUES (?, ?, ?)',
+                                 [(symbol, observed_at.strftime('%Y-%m-%d %H:%M:%S'), price) for symbol, price in quotes.items()])
+                _bump_data_version(conn, 'market_prices')
+        except sqlite3.Error as e:
+            logging.error(f"Failed to store market prices: {e}")
+        with self._lock:
+            self._prices.update(quotes)
+            self._observed_at = observed_at.timestamp()
+        return quotes
+
+@st.cache_resource(show_spinner=False)
+def _market_data(db_path):
+    if MARKET_DATA_PROVIDER is not None:
+        provider = MARKET_DATA_PROVIDER
+    elif MARKET_DATA_URL:
+        provider = JsonEndpointMarketData(MARKET_DATA_URL)
+    else:
+        provider = SimulatedMarketData()
+    return MarketData(provider)
+
+def market_data():
+    """Process-wide market data cache for DB_PATH."""
+    return _market_data(DB_PATH)
+
+def get_carbon_price():
+    """Latest carbon price in EUR per ton; DEFAULT_CARBON_PRICE until the first quote arrives."""
+    price = market_data().price(CARBON_PRICE_SYMBOL)
+    return DEFAULT_CARBON_PRICE if price is None else price
+
+def exchange_rate(currency):
+    """Latest units of currency per EUR; the EXCHANGE_RATES entry until the first quote arrives."""
+    if currency == 'EUR':
+        return 1.0
+    rate = market_data().price(fx_symbol(currency))
+    if rate is not None:
+        return rate
+    if currency not in EXCHANGE_RATES:
+        raise ValueError(f"No exchange rate for {currency}")
+    return EXCHANGE_RATES[currency]
+
 # Packaging emission factors and costs
 PACKAGING_EMISSIONS = {
     'Plastic': 6.0,
@@ -162,46 +723,287 @@ PACKAGING_COSTS = {
     'Reusable': 3.0
 }
 
+# In-memory coordinate cache
+COORDINATE_CACHE_SIZE = 100000
+
+class CoordinateCache:
+    """Thread-safe LRU map of (country, city) -> (lat, lon), preloaded from LOCATIONS and the coordinates table."""
+
+    def __init__(self, max_entries=COORDINATE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _store(self, key, coords):
+        self._entries[key] = coords
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def preload(self):
+        """Load LOCATIONS and then the coordinates table (which takes precedence) into memory."""
+        with self._lock:
+            for country, cities in LOCATIONS.items():
+                for city, coords in cities.items():
+                    self._store((country, city), tuple(coords))
+        try:
+            with db_connection() as conn:
+                rows = conn.execute('SELECT country, city, lat, lon FROM coordinates LIMIT ?', (self.max_entries,)).fetchall()
+        except sqlite3.Error as e:
+            logging.warning(f"Coordinate cache preload skipped: {e}")
+            return
+        with self._lock:
+            for country, city, lat, lon in rows:
+                self._store((country, city), (lat, lon))
+
+    def get(self, country, city):
+        """Return cached coordinates or None."""
+        with self._lock:
+            coords = self._entries.get((country, city))
+            if coords is not None:
+                self._entries.move_to_end((country, city))
+            return coords
+
+    def put(self, country, city, coords, persist=True):
+        """Cache coordinates, writing them through to the coordinates table when persist is set."""
+        coords = (coords[0], coords[1])
+        if persist:
+            with db_connection() as conn:
+                conn.execute('INSERT OR REPLACE INTO coordinates (country, city, lat, lon) VALUES (?, ?, ?, ?)',
+                             (country, city, coords[0], coords[1]))
+                _bump_data_version(conn, 'coordinates')
+        with self._lock:
+            self._store((country, city), coords)
+
+    def snapshot(self):
+        """Return a copy of all cached entries."""
+        with self._lock:
+            return dict(self._entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+@st.cache_resource(show_spinner=False)
+def _coordinate_cache(db_path):
+    cache = CoordinateCache()
+    cache.preload()
+    return cache
+
+def coordinate_cache():
+    """Process-wide coordinate cache for DB_PATH."""
+    return _coordinate_cache(DB_PATH)
+
+# Background geocoding
+GEOCODER = None  # geopy-style geocoder with geocode(query, timeout=...); None uses Nominatim
+GEOCODE_REQUESTS_PER_SECOND = 1.0  # Nominatim usage policy
+GEOCODE_TIMEOUT_SECONDS = 10
+GEOCODE_MAX_RETRIES = 3
+GEOCODE_BACKOFF_SECONDS = 2.0
+GEOCODE_WRITE_BATCH_SIZE = 50
+GEOCODE_FLUSH_SECONDS = 2.0
+GEOCODE_FAILURE_TTL_SECONDS = 3600
+GEOCODE_PENDING = 'pending'
+GEOCODE_FAILED = 'failed'
+
+class GeocodingQueue:
+    """Deduplicating queue of unknown locations, resolved by a rate-limited background worker thread."""
+
+    def __init__(self, geocoder, cache, requests_per_second=GEOCODE_REQUESTS_PER_SECOND,
+                 max_retries=GEOCODE_MAX_RETRIES, backoff_seconds=GEOCODE_BACKOFF_SECONDS,
+                 batch_size=GEOCODE_WRITE_BATCH_SIZE):
+        self.geocoder = geocoder
+        self.cache = cache
+        self.requests_per_second = requests_per_second
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.batch_size = batch_size
+        self._queue = queue.Queue()
+        self._pending = set()
+        self._failed = {}
+        self._unwritten = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='carbonx9-geocoder', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """Stop the worker and write any resolved coordinates still buffered."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self._flush()
+
+    def submit(self, country, city):
+        """Queue a location for geocoding unless it is already queued. Returns its status."""
+        key = (country, city)
+        with self._lock:
+            if key in self._pending:
+                return GEOCODE_PENDING
+            failed_at = self._failed.get(key)
+            if failed_at is not None and time.monotonic() - failed_at[0] < GEOCODE_FAILURE_TTL_SECONDS:
+                return GEOCODE_FAILED
+            self._failed.pop(key, None)
+            self._pending.add(key)
+        self._queue.put(key)
+        return GEOCODE_PENDING
+
+    def status(self, country, city):
+        """Return GEOCODE_PENDING, GEOCODE_FAILED or None for a location."""
+        with self._lock:
+            if (country, city) in self._pending:
+                return GEOCODE_PENDING
+            if (country, city) in self._failed:
+                return GEOCODE_FAILED
+            return None
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    def _geocode(self, country, city, next_request_at):
+        """Geocode one location with rate limiting and exponential backoff. Returns (coords, error, next_request_at)."""
+        error = None
+        for attempt in range(self.max_retries + 1):
+            wait = next_request_at - time.monotonic()
+            if wait > 0 and self._stop.wait(wait):
+                break
+            next_request_at = time.monotonic() + 1.0 / self.requests_per_second
+            try:
+                with metrics().timer('geocode_request'):
+                    location = self.geocoder.geocode(f"{city}, {country}", timeout=GEOCODE_TIMEOUT_SECONDS)
+                if location:
+                    return (location.latitude, location.longitude), None, next_request_at
+                metrics().increment('geocode_not_found')
+                return None, "not found", next_request_at
+            except Exception as e:
+                metrics().increment('geocode_errors')
+                error = str(e)
+                logging.warning(f"Geocoding attempt {attempt + 1} failed for {city}, {country}: {e}")
+                if self._stop.wait(self.backoff_seconds * 2 ** attempt):
+                    break
+        return None, error, next_request_at
+
+    def _run(self):
+        next_request_at = 0.0
+        while not self._stop.is_set():
+            try:
+                country, city = self._queue.get(timeout=GEOCODE_FLUSH_SECONDS)
+            except queue.Empty:
+                self._flush()
+                continue
+            coords, error, next_request_at = self._geocode(country, city, next_request_at)
+            if coords:
+                self.cache.put(country, city, coords, persist=False)
+            else:
+                logging.error(f"No coordinates found for {city}, {country}: {error}")
+            with self._lock:
+                if coords:
+                    self._unwritten.append((country, city, coords[0], coords[1]))
+                else:
+                    self._failed[(country, city)] = (time.monotonic(), error)
+                self._pending.discard((country, city))
+                flush = len(self._unwritten) >= self.batch_size or self._queue.empty()
+            if flush:
+                self._flush()
+
+    def _flush(self):
+        """Write resolved coordinates to the coordinates table in one batch."""
+        with self._lock:
+            rows, self._unwritten = self._unwritten, []
+        if not rows:
+            return
+        try:
+            with db_connection() as conn:
+                conn.executemany('INSERT OR REPLACE INTO coordinates (country, city, lat, lon) VALUES (?, ?, ?, ?)', rows)
+                _bump_data_version(conn, 'coordinates')
+        except sqlite3.Error as e:
+            logging.error(f"Failed to store geocoded coordinates: {e}")
+            with self._lock:
+                self._unwritten = rows + self._unwritten
+
+@st.cache_resource(show_spinner=False)
+def _geocoding_queue(db_path):
+    if GEOCODER is None:
+        from geopy.geocoders import Nominatim
+    geocoder = GEOCODER or Nominatim(user_agent="carbon360")
+    return GeocodingQueue(geocoder, coordinate_cache()).start()
+
+def geocoding_queue():
+    """Process-wide background geocoding queue for DB_PATH."""
+    return _geocoding_queue(DB_PATH)
+
+def geocode_status(country, city):
+    """Return GEOCODE_PENDING or GEOCODE_FAILED while a location has no coordinates, else None."""
+    return geocoding_queue().status(country, city)
+
 # Enhanced geocoding with caching
+@instrumented
 def get_coordinates(country, city):
-    """Get coordinates for a country and city, using cached data or geocoding API."""
+    """
+    Get coordinates for a country and city, using the in-memory cache, cached data or geocoding API.
+    Unknown locations are queued for background geocoding and return (0, 0) until resolved.
+    """
+    cache = coordinate_cache()
+    coords = cache.get(country, city)
+    if coords is not None:
+        metrics().increment('coordinate_cache_hits')
+        return coords
     try:
-        with sqlite3.connect('emissions.db') as conn:
+        with db_connection() as conn:
             c = conn.cursor()
             c.execute('SELECT lat, lon FROM coordinates WHERE country = ? AND city = ?', (country, city))
             result = c.fetchone()
-            if result:
-                return result
-            # Fallback to LOCATIONS dictionary
-            coords = LOCATIONS.get(country, {}).get(city, None)
-            if coords:
-                c.execute('INSERT INTO coordinates (country, city, lat, lon) VALUES (?, ?, ?, ?)',
-                          (country, city, coords[0], coords[1]))
-                conn.commit()
-                return coords
-            # Use Nominatim for geocoding (rate-limited)
-            geolocator = Nominatim(user_agent="carbon360")
-            location = geolocator.geocode(f"{city}, {country}", timeout=10)
-            if location:
-                lat, lon = location.latitude, location.longitude
-                c.execute('INSERT INTO coordinates (country, city, lat, lon) VALUES (?, ?, ?, ?)',
-                          (country, city, lat, lon))
-                conn.commit()
-                return (lat, lon)
+        if result:
+            metrics().increment('coordinate_db_hits')
+            cache.put(country, city, result, persist=False)
+            return cache.get(country, city)
+        # Fallback to LOCATIONS dictionary
+        coords = LOCATIONS.get(country, {}).get(city, None)
+        if coords:
+            metrics().increment('coordinate_static_hits')
+            cache.put(country, city, coords, persist=False)
+            return coords
+        # Hand unknown locations to the rate-limited background geocoder instead of blocking the render
+        metrics().increment('coordinate_cache_misses')
+        if geocoding_queue().submit(country, city) == GEOCODE_FAILED:
             handle_error(f"No coordinates found for {city}, {country}", f"Location {city}, {country} not found.")
-            return (0, 0)
+        return (0, 0)
     except Exception as e:
         handle_error(f"Geocoding failed for {city}, {country}: {e}", f"Location {city}, {country} not found.")
         return LOCATIONS.get(country, {}).get(city, (0, 0))
 
+def get_coordinates_many(locations):
+    """
+    Resolve an iterable of (country, city) pairs to an (n, 2) array of (lat, lon).
+    Each distinct pair is looked up once; cache hits need no I/O.
+    """
+    resolved = {}
+    coords = []
+    for key in locations:
+        if key not in resolved:
+            resolved[key] = get_coordinates(*key)
+        coords.append(resolved[key])
+    return np.array(coords, dtype=float).reshape(-1, 2)
+
 def calculate_distance(country1, city1, country2, city2):
-    """Calculate great-circle distance using Haversine formula."""
+    """Calculate great-circle distance using Haversine formula, served from the distance matrix when possible."""
     if country1 == country2 and city1 == city2:
         raise ValueError("Source and destination cannot be the same location.")
     lat1, lon1 = get_coordinates(country1, city1)
     lat2, lon2 = get_coordinates(country2, city2)
+    for country, city in ((country1, city1), (country2, city2)):
+        if geocode_status(country, city) == GEOCODE_PENDING:
+            raise ValueError(f"Coordinates for {city}, {country} are still being looked up. Please try again shortly.")
     if lat1 == 0 and lon1 == 0 or lat2 == 0 and lon2 == 0:
         raise ValueError(f"Coordinates not found for {city1}, {country1} or {city2}, {country2}")
+    matrix = distance_matrix()
+    source, dest = matrix.positions([(country1, city1), (country2, city2)], [(lat1, lon1), (lat2, lon2)])
+    if source >= 0 and dest >= 0:
+        return round(float(matrix.distances(source, dest)), 2)
     R = 6371
     dlat = math.radians(lat2 - lat1)
     dlon = math.radians(lon2 - lon1)
@@ -221,18 +1023,321 @@ def calculate_co2(country1, city1, country2, city2, transport_mode, distance_km,
     co2_kg = distance_km * weight_tons * emission_factor
     return round(co2_kg, 2)
 
-def optimize_route(country1, city1, country2, city2, distance_km, weight_tons, prioritize_green=False):
-    """Optimize transport route to minimize CO2 emissions."""
-    if weight_tons <= 0:
-        raise ValueError("Weight must be positive.")
-    if distance_km <= 0:
-        raise ValueError("Distance must be positive.")
-    intercontinental = country1 != country2
+# Vectorized bulk calculations
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km for arrays of coordinates (vectorized Haversine)."""
+    lat1, lon1, lat2, lon2 = (np.asarray(v, dtype=float) for v in (lat1, lon1, lat2, lon2))
+    R = 6371
+    dlat = np.radians(lat2 - lat1)
+    dlon = np.radians(lon2 - lon1)
+    a = np.sin(dlat/2)**2 + np.cos(np.radians(lat1)) * np.cos(np.radians(lat2)) * np.sin(dlon/2)**2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1-a))
+    return R * c
+
+# Precomputed pairwise distance matrix
+DISTANCE_MATRIX_INITIAL_CAPACITY = 64
+DISTANCE_MATRIX_MAX_LOCATIONS = 5000
+DISTANCE_MATRIX_BLOCK_ROWS = 512
+
+class DistanceMatrix:
+    """
+    Pairwise Haversine distances (km) between known locations, stored in a memory-mapped file shared by every
+    process using the same database. Adding or moving a location recomputes only its row and column; lookups are
+    plain array indexing. Locations beyond max_locations are not stored and get position -1.
+
+    The JSON index records which location owns each position and is only ever appended to. Positions are handed out,
+    and the file written, only under an exclusive lock on path + '.lock' after re-reading the index, so all processes
+    agree on the layout. Growing writes a new data file rather than resizing the mapped one, so other processes keep
+    a valid view until their next sync. Without fcntl the matrix lives in memory, private to the process.
+    """
+
+    def __init__(self, path, max_locations=DISTANCE_MATRIX_MAX_LOCATIONS):
+        self.path = path if fcntl is not None else None
+        self.index_path = path + '.json'
+        self.lock_path = path + '.lock'
+        self.max_locations = max_locations
+        self._positions = {}
+        self._coords = np.empty((0, 2))
+        self._matrix = None
+        self._file_id = None  # data file of the mapped matrix
+        self._revision = 0  # index revision the in-process layout matches
+        self._lock = threading.RLock()
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Hold the thread lock and, for a shared matrix, the exclusive file lock."""
+        with self._lock:
+            if self.path is None:
+                yield
+                return
+            with open(self.lock_path, 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _data_path(self, file_id):
+        return f'{self.path}.{file_id}'
+
+    def _reset(self):
+        self._positions, self._coords, self._matrix, self._file_id, self._revision = {}, np.empty((0, 2)), None, None, 0
+
+    def _sync(self):
+        """Adopt the layout other processes wrote since our last sync. Call with the file lock held."""
+        if self.path is None:
+            return
+        try:
+            with open(self.index_path) as f:
+                index = json.load(f)
+            if index['revision'] == self._revision and index['file'] == self._file_id:
+                return
+            capacity, file_id = index['capacity'], index['file']
+            if os.path.getsize(self._data_path(file_id)) != capacity * capacity * 8:
+                raise ValueError("distance matrix size does not match its index")
+            if file_id != self._file_id:
+                self._matrix = np.memmap(self._data_path(file_id), dtype=np.float64, mode='r+', shape=(capacity, capacity))
+                self._file_id = file_id
+            self._positions = {(country, city): i for i, (country, city, _, _) in enumerate(index['locations'])}
+            self._coords = np.array([[lat, lon] for _, _, lat, lon in index['locations']], dtype=float).reshape(-1, 2)
+            self._revision = index['revision']
+        except (OSError, ValueError, KeyError) as e:
+            if self._file_id is not None or self._revision == 0:
+                logging.info(f"Building distance matrix from scratch: {e}")
+            self._reset()
+
+    def _ensure_capacity(self, size):
+        capacity = 0 if self._matrix is None else self._matrix.shape[0]
+        if size <= capacity:
+            return None
+        new_capacity = max(min(max(DISTANCE_MATRIX_INITIAL_CAPACITY, capacity * 2), self.max_locations), size)
+        if self.path is None:
+            matrix = np.zeros((new_capacity, new_capacity))
+        else:
+            file_id = uuid.uuid4().hex[:12]
+            matrix = np.memmap(self._data_path(file_id), dtype=np.float64, mode='w+', shape=(new_capacity, new_capacity))
+        if capacity:
+            matrix[:capacity, :capacity] = self._matrix[:capacity, :capacity]
+        old_file_id = self._file_id
+        self._matrix = matrix
+        if self.path is not None:
+            self._file_id = file_id
+        return old_file_id
+
+    def load(self, coordinates):
+        """Open the on-disk matrix, reusing stored rows whose coordinates are unchanged, then add `coordinates`."""
+        with self._locked():
+            self._sync()
+        keys = list(coordinates)[:self.max_locations]
+        self.positions(keys, [coordinates[key] for key in keys])
+
+    def _assign(self, locations, coords, apply):
+        """Positions of locations, plus the new or moved positions; with apply=False nothing is changed."""
+        result = np.full(len(coords), -1, dtype=np.int64)
+        changed = []
+        added = {}
+        for i, key in enumerate(locations):
+            lat, lon = coords[i]
+            if np.isnan(lat) or np.isnan(lon) or (lat == 0 and lon == 0):
+                continue
+            position = self._positions.get(key)
+            if position is None:
+                position = added.get(key)
+            if position is None:
+                size = len(self._positions) + len(added)
+                if size >= self.max_locations:
+                    continue
+                position = size
+                changed.append(position)
+                if apply:
+                    self._positions[key] = position
+                    self._coords = np.vstack([self._coords, [[lat, lon]]])
+                else:
+                    added[key] = position
+            elif position < len(self._coords) and (self._coords[position, 0] != lat or self._coords[position, 1] != lon):
+                changed.append(position)
+                if apply:
+                    self._coords[position] = (lat, lon)
+            result[i] = position
+        return result, changed
+
+    def positions(self, locations, coords):
+        """
+        Return matrix positions for (country, city) locations with their (lat, lon) coordinates,
+        adding new or moved locations. Missing coordinates, or a full matrix, give -1.
+        """
+        locations = list(locations)
+        coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+        with self._lock:
+            result, changed = self._assign(locations, coords, apply=False)
+            if changed:
+                with self._locked():
+                    self._sync()
+                    result, changed = self._assign(locations, coords, apply=True)
+                    if changed:
+                        self._update(np.array(sorted(set(changed))))
+        return result
+
+    def _update(self, changed):
+        """Recompute the rows and columns of changed positions, in blocks to bound memory. Call with the file lock held."""
+        n = len(self._coords)
+        old_file_id = self._ensure_capacity(n)
+        lat, lon = self._coords[:, 0], self._coords[:, 1]
+        for start in range(0, len(changed), DISTANCE_MATRIX_BLOCK_ROWS):
+            rows = changed[start:start + DISTANCE_MATRIX_BLOCK_ROWS]
+            block = haversine_km(lat[rows, None], lon[rows, None], lat[None, :], lon[None, :])
+            self._matrix[rows, :n] = block
+            self._matrix[:n, rows] = block.T
+        if self.path is None:
+            return
+        self._matrix.flush()
+        self._save_index()
+        if old_file_id is not None:
+            # Processes still mapping the old file keep a valid view of it until they sync
+            with contextlib.suppress(OSError):
+                os.remove(self._data_path(old_file_id))
+
+    def _save_index(self):
+        self._revision += 1
+        index = {
+            'file': self._file_id,
+            'capacity': self._matrix.shape[0],
+            'revision': self._revision,
+            'locations': [[country, city, float(lat), float(lon)]
+                          for (country, city), (lat, lon) in zip(self._positions, self._coords)]
+        }
+        tmp_path = f'{self.index_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self.index_path)
+
+    def distances(self, source_positions, dest_positions):
+        """Distances (km) between matrix positions; NaN where either position is -1."""
+        source_positions = np.asarray(source_positions, dtype=np.int64)
+        dest_positions = np.asarray(dest_positions, dtype=np.int64)
+        known = (source_positions >= 0) & (dest_positions >= 0)
+        result = np.full(np.broadcast(source_positions, dest_positions).shape, np.nan)
+        with self._lock:
+            if self._matrix is not None:
+                result[known] = self._matrix[source_positions[known], dest_positions[known]]
+        return result
+
+    def __len__(self):
+        return len(self._positions)
+
+@st.cache_resource(show_spinner=False)
+def _distance_matrix(db_path):
+    matrix = DistanceMatrix(os.path.splitext(db_path)[0] + '_distances.dat')
+    matrix.load(coordinate_cache().snapshot())
+    return matrix
+
+def distance_matrix():
+    """Process-wide distance matrix for all cached coordinates, stored next to DB_PATH."""
+    return _distance_matrix(DB_PATH)
+
+def _round_like_builtin(values, ndigits=2):
+    """np.round, falling back to built-in round() on near-half values so bulk results match the scalar functions."""
+    values = np.asarray(values, dtype=float)
+    rounded = np.round(values, ndigits)
+    scaled = values * 10**ndigits
+    near_half = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    if near_half.any():
+        rounded[near_half] = [round(float(value), ndigits) for value in values[near_half]]
+    return rounded
+
+def _factorize_locations(df):
+    """
+    Map source and destination (country, city) columns onto one shared integer code space.
+    Returns (source_codes, dest_codes, locations) where locations[code] is the (country, city) pair.
+    """
+    n = len(df)
+    country_codes, countries = pd.factorize(pd.concat([df['source_country'], df['dest_country']], ignore_index=True))
+    city_codes, cities = pd.factorize(pd.concat([df['source_city'], df['dest_city']], ignore_index=True))
+    pair_codes, pairs = pd.factorize(country_codes.astype(np.int64) * max(len(cities), 1) + city_codes)
+    locations = [(countries[pair // max(len(cities), 1)], cities[pair % max(len(cities), 1)]) for pair in pairs]
+    return pair_codes[:n], pair_codes[n:], locations
+
+def calculate_emissions_bulk(shipments=None, **columns):
+    """
+    Calculate distance and CO2 for a whole table of shipments in one vectorized pass.
+    Accepts a DataFrame (or keyword NumPy arrays) with transport_mode, weight_tons and either
+    source_lat/source_lon/dest_lat/dest_lon or source_country/source_city/dest_country/dest_city.
+    Returns a copy with distance_km, co2_kg and an error column holding the message the scalar
+    functions would raise for that row (None for valid rows).
+    """
+    df = pd.DataFrame(columns) if shipments is None else pd.DataFrame(shipments)
+    df = df.copy(deep=False)
+    by_name = {'source_country', 'source_city', 'dest_country', 'dest_city'}.issubset(df.columns)
+    by_coords = {'source_lat', 'source_lon', 'dest_lat', 'dest_lon'}.issubset(df.columns)
+    missing = [col for col in ('transport_mode', 'weight_tons') if col not in df.columns]
+    if not (by_name or by_coords):
+        missing.append('source/destination coordinates or country/city columns')
+    if missing:
+        raise ValueError(f"Missing shipment columns: {', '.join(missing)}")
+
+    errors = pd.Series(np.full(len(df), None, dtype=object), index=df.index)
+
+    def flag(mask, message):
+        # Keep the first failure per row, mirroring the order the scalar functions raise in;
+        # per-row messages are built only for the failing rows
+        mask = np.asarray(mask, dtype=bool) & errors.isna().to_numpy()
+        if mask.any():
+            errors[mask] = message(df[mask]) if callable(message) else message
+
+    if by_coords:
+        lat1 = df['source_lat'].to_numpy(dtype=float)
+        lon1 = df['source_lon'].to_numpy(dtype=float)
+        lat2 = df['dest_lat'].to_numpy(dtype=float)
+        lon2 = df['dest_lon'].to_numpy(dtype=float)
+        flag((lat1 == lat2) & (lon1 == lon2), "Source and destination cannot be the same location.")
+        not_found = "Coordinates not found"
+    else:
+        source_codes, dest_codes, locations = _factorize_locations(df)
+        flag(source_codes == dest_codes, "Source and destination cannot be the same location.")
+        # Resolve each distinct location once and broadcast back to every row
+        coords = get_coordinates_many(locations)
+        lat1, lon1 = coords[source_codes, 0], coords[source_codes, 1]
+        lat2, lon2 = coords[dest_codes, 0], coords[dest_codes, 1]
+        pending = np.array([geocode_status(country, city) == GEOCODE_PENDING for country, city in locations], dtype=bool)
+        if pending.any():
+            flag(pending[source_codes] | pending[dest_codes],
+                 lambda rows: ("Coordinates are still being looked up for " + rows['source_city'].astype(str) + ", "
+                               + rows['source_country'].astype(str) + " or " + rows['dest_city'].astype(str) + ", "
+                               + rows['dest_country'].astype(str)))
+        not_found = lambda rows: ("Coordinates not found for " + rows['source_city'].astype(str) + ", " + rows['source_country'].astype(str)
+                                  + " or " + rows['dest_city'].astype(str) + ", " + rows['dest_country'].astype(str))
+    missing_coords = ((lat1 == 0) & (lon1 == 0)) | ((lat2 == 0) & (lon2 == 0)) | np.isnan(lat1 + lon1 + lat2 + lon2)
+    flag(missing_coords, not_found)
+
+    if by_coords:
+        distance_km = haversine_km(lat1, lon1, lat2, lon2)
+    else:
+        # Known locations are a lookup into the distance matrix; compute the rest directly
+        matrix = distance_matrix()
+        positions = matrix.positions(locations, coords)
+        distance_km = matrix.distances(positions[source_codes], positions[dest_codes])
+        uncached = np.isnan(distance_km)
+        if uncached.any():
+            distance_km[uncached] = haversine_km(lat1[uncached], lon1[uncached], lat2[uncached], lon2[uncached])
+    distance_km = _round_like_builtin(distance_km)
+    weight_tons = pd.to_numeric(df['weight_tons'], errors='coerce').to_numpy(dtype=float)
+    emission_factor = df['transport_mode'].map(EMISSION_FACTORS).to_numpy(dtype=float)
+    flag(~(weight_tons > 0), "Weight must be positive.")
+    flag(~(distance_km > 0), "Distance must be positive.")
+    flag(np.isnan(emission_factor), lambda rows: "Invalid transport mode: " + rows['transport_mode'].astype(str))
+
+    valid = errors.isna().to_numpy()
+    df['distance_km'] = np.where(valid, distance_km, np.nan)
+    df['co2_kg'] = np.where(valid, _round_like_builtin(distance_km * weight_tons * emission_factor), np.nan)
+    df['error'] = errors
+    return df
+
+def route_combinations(intercontinental, distance_km, prioritize_green=False):
+    """Candidate (mode1, ratio1, mode2, ratio2) splits for a route, by intercontinental flag and distance band."""
     distance_short = distance_km < 1000
     distance_medium = 1000 <= distance_km < 5000
     distance_long = distance_km >= 5000
 
-    current_co2 = distance_km * weight_tons * EMISSION_FACTORS['Truck']
     combinations = []
     if intercontinental:
         if distance_long:
@@ -266,6 +1371,19 @@ def optimize_route(country1, city1, country2, city2, distance_km, weight_tons, p
                 ('Truck', 0.6, 'Train', 0.4),
                 ('Plane', 0.3, 'Truck', 0.7)
             ])
+    return combinations
+
+@instrumented
+def optimize_route(country1, city1, country2, city2, distance_km, weight_tons, prioritize_green=False):
+    """Optimize transport route to minimize CO2 emissions."""
+    if weight_tons <= 0:
+        raise ValueError("Weight must be positive.")
+    if distance_km <= 0:
+        raise ValueError("Distance must be positive.")
+    intercontinental = country1 != country2
+
+    current_co2 = distance_km * weight_tons * EMISSION_FACTORS['Truck']
+    combinations = route_combinations(intercontinental, distance_km, prioritize_green)
 
     best_option = None
     min_co2 = float('inf')
@@ -286,156 +1404,1374 @@ def optimize_route(country1, city1, country2, city2, distance_km, weight_tons, p
     
     return best_option, round(min_co2, 2), best_breakdown, best_distances, round(current_co2, 2)
 
-def save_emission(source, destination, transport_mode, distance_km, co2_kg, weight_tons):
+# Distance bands used by route_combinations, as (representative distance, upper bound)
+ROUTE_DISTANCE_BANDS = [(0, 1000), (1000, 5000), (5000, np.inf)]
+
+def _distance_bands(distance_km):
+    """Index into ROUTE_DISTANCE_BANDS for each distance; the last band is open-ended."""
+    band = np.searchsorted([upper for _, upper in ROUTE_DISTANCE_BANDS], distance_km, side='right')
+    return np.minimum(band, len(ROUTE_DISTANCE_BANDS) - 1)
+
+def split_locations(emissions):
+    """
+    Return a copy of emissions with source/destination country and city columns.
+    Frames read through the locations join already have them; others (e.g. snapshots) get their labels split.
+    """
+    df = emissions.copy(deep=False)
+    if {'source_country', 'source_city', 'dest_country', 'dest_city'}.issubset(df.columns):
+        return df
+    source = df['source'].str.rsplit(', ', n=1, expand=True).reindex(columns=[0, 1])
+    destination = df['destination'].str.rsplit(', ', n=1, expand=True).reindex(columns=[0, 1])
+    df['source_city'], df['source_country'] = source[0], source[1]
+    df['dest_city'], df['dest_country'] = destination[0], destination[1]
+    return df
+
+def optimize_routes_bulk(routes, prioritize_green=False):
+    """
+    Batched optimize_route: score every candidate mode combination for every row at once.
+    `routes` needs source_country, dest_country, distance_km and weight_tons columns.
+    Returns a DataFrame aligned with `routes` holding the best option, its per-leg breakdown,
+    optimized_co2, current_co2 and an error column (None for rows that could be optimized).
+    """
+    distance_km = exact_values(routes['distance_km'])
+    weight_tons = exact_values(routes['weight_tons'])
+    intercontinental = (routes['source_country'] != routes['dest_country']).to_numpy()
+
+    # Route classes are (intercontinental, distance band); each has a fixed list of candidates
+    route_class = intercontinental.astype(int) * len(ROUTE_DISTANCE_BANDS) + _distance_bands(distance_km)
+    candidates = [route_combinations(flag, lower, prioritize_green)
+                  for flag in (False, True) for lower, _ in ROUTE_DISTANCE_BANDS]
+    modes1 = np.array([[combo[0] for combo in c] for c in candidates], dtype=object)
+    modes2 = np.array([[combo[2] for combo in c] for c in candidates], dtype=object)
+    ratios1 = np.array([[combo[1] for combo in c] for c in candidates], dtype=float)
+    ratios2 = np.array([[combo[3] if combo[2] else 0.0 for combo in c] for c in candidates], dtype=float)
+    factors1 = np.array([[EMISSION_FACTORS[combo[0]] for combo in c] for c in candidates], dtype=float)
+    factors2 = np.array([[EMISSION_FACTORS[combo[2]] if combo[2] else 0.0 for combo in c] for c in candidates], dtype=float)
+
+    # Same arithmetic as optimize_route, laid out as (rows, candidates)
+    dist1 = distance_km[:, None] * ratios1[route_class]
+    dist2 = distance_km[:, None] * ratios2[route_class]
+    co2_1 = dist1 * weight_tons[:, None] * factors1[route_class]
+    co2_2 = dist2 * weight_tons[:, None] * factors2[route_class]
+    best = np.argmin(co2_1 + co2_2, axis=1)
+    rows = np.arange(len(routes))
+
+    errors = np.full(len(routes), None, dtype=object)
+    errors[~(distance_km > 0)] = "Distance must be positive."
+    errors[~(weight_tons > 0)] = "Weight must be positive."
+    valid = pd.isna(errors)
+
+    result = pd.DataFrame({
+        'mode1': modes1[route_class, best],
+        'ratio1': ratios1[route_class, best],
+        'mode2': modes2[route_class, best],
+        'ratio2': ratios2[route_class, best],
+        'co2_1': co2_1[rows, best],
+        'co2_2': co2_2[rows, best],
+        'dist1': dist1[rows, best],
+        'dist2': dist2[rows, best],
+        'optimized_co2': _round_like_builtin(co2_1[rows, best] + co2_2[rows, best]),
+        'current_co2': _round_like_builtin(distance_km * weight_tons * EMISSION_FACTORS['Truck']),
+        'error': errors
+    }, index=routes.index)
+    result.loc[~valid, ['mode1', 'mode2']] = None
+    result.loc[~valid, ['ratio1', 'ratio2', 'co2_1', 'co2_2', 'dist1', 'dist2', 'optimized_co2']] = np.nan
+    return result
+
+# Multimodal hub network: shortest CO2 paths over road, rail, sea and air links between known locations
+HUB_PROFILES = {
+    ('United Kingdom', 'London'): ('road', 'rail', 'port', 'airport'),
+    ('France', 'Paris'): ('road', 'rail', 'airport'),
+    ('USA', 'New York'): ('road', 'rail', 'port', 'airport'),
+    ('China', 'Shanghai'): ('road', 'rail', 'port', 'airport'),
+    ('Japan', 'Tokyo'): ('road', 'rail', 'port', 'airport'),
+    ('Australia', 'Sydney'): ('road', 'rail', 'port', 'airport')
+}
+DEFAULT_HUB_PROFILE = ('road', 'rail', 'airport')  # geocoded locations without a known profile
+# Countries sharing a land mass reachable by road and rail; unlisted countries form their own region
+LAND_REGIONS = {
+    'United Kingdom': 'Europe',
+    'France': 'Europe',
+    'USA': 'North America',
+    'China': 'Asia',
+    'Japan': 'Japan',
+    'Australia': 'Australia'
+}
+# mode: (terminal needed at both ends, longest single leg in km, surface link, network detour over great-circle distance)
+GRAPH_MODES = {
+    'Truck': ('road', 2000, True, 1.2),
+    'Electric Truck': ('road', 800, True, 1.2),
+    'Hydrogen Truck': ('road', 1500, True, 1.2),
+    'Biofuel Truck': ('road', 2000, True, 1.2),
+    'Train': ('rail', 6000, True, 1.2),
+    'Ship': ('port', np.inf, False, 1.5),
+    'Plane': ('airport', np.inf, False, 1.05)
+}
+GREEN_ROAD_MODES = ('Electric Truck', 'Hydrogen Truck', 'Biofuel Truck')
+GRAPH_MAX_NODES = 2000
+GRAPH_TREE_CACHE_SIZE = 256
+
+class RouteGraph:
+    """
+    Dense multimodal graph over known locations. Edge weights are kg CO2 per ton using the cheapest mode allowed
+    between two nodes, so one shortest-path tree per origin serves every destination and shipment weight.
+    """
+
+    def __init__(self, coordinates, prioritize_green=False):
+        keys = [key for key, coords in coordinates.items() if tuple(coords) != (0, 0)]
+        keys.sort(key=lambda key: key not in HUB_PROFILES)
+        if len(keys) > GRAPH_MAX_NODES:
+            logging.warning(f"Route graph limited to {GRAPH_MAX_NODES} of {len(keys)} locations")
+            keys = keys[:GRAPH_MAX_NODES]
+        self.keys = keys
+        self.index = {key: position for position, key in enumerate(keys)}
+        self.modes = [mode for mode in GRAPH_MODES if prioritize_green or mode not in GREEN_ROAD_MODES]
+        coords = np.array([coordinates[key] for key in keys], dtype=float).reshape(-1, 2)
+        self.coords = coords
+        great_circle = haversine_km(coords[:, None, 0], coords[:, None, 1], coords[None, :, 0], coords[None, :, 1])
+        regions = np.array([LAND_REGIONS.get(country, country) for country, _ in keys])
+        same_region = regions[:, None] == regions[None, :]
+        profiles = [set(HUB_PROFILES.get(key, DEFAULT_HUB_PROFILE)) for key in keys]
+
+        n = len(keys)
+        self.cost = np.full((n, n), np.inf)
+        self.leg_km = np.zeros((n, n))
+        self.mode = np.full((n, n), -1, dtype=np.int8)
+        for code, mode in enumerate(self.modes):
+            terminal, max_leg_km, surface, detour = GRAPH_MODES[mode]
+            has_terminal = np.array([terminal in profile for profile in profiles])
+            km = great_circle * detour
+            allowed = has_terminal[:, None] & has_terminal[None, :] & (km <= max_leg_km)
+            if surface:
+                allowed &= same_region
+            cost = np.where(allowed, km * EMISSION_FACTORS[mode], np.inf)
+            better = cost < self.cost
+            self.cost[better] = cost[better]
+            self.leg_km[better] = km[better]
+            self.mode[better] = code
+        np.fill_diagonal(self.cost, np.inf)
+        self._trees = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _tree(self, source):
+        """Dijkstra from node `source` over the dense cost matrix: (kg CO2 per ton, km travelled, predecessor) per node."""
+        with self._lock:
+            tree = self._trees.get(source)
+            if tree is not None:
+                self._trees.move_to_end(source)
+                return tree
+        n = len(self.keys)
+        co2 = np.full(n, np.inf)
+        km = np.zeros(n)
+        pred = np.full(n, -1)
+        done = np.zeros(n, dtype=bool)
+        co2[source] = 0.0
+        for _ in range(n):
+            node = int(np.argmin(np.where(done, np.inf, co2)))
+            if done[node] or not np.isfinite(co2[node]):
+                break
+            done[node] = True
+            candidate = co2[node] + self.cost[node]
+            better = (candidate < co2) & ~done
+            co2[better] = candidate[better]
+            km[better] = km[node] + self.leg_km[node, better]
+            pred[better] = node
+        tree = (co2, km, pred)
+        with self._lock:
+            self._trees[source] = tree
+            while len(self._trees) > GRAPH_TREE_CACHE_SIZE:
+                self._trees.popitem(last=False)
+        return tree
+
+    def path(self, origin, destination):
+        """Cheapest path between two (country, city) keys as (kg CO2 per ton, km, [(from, to, mode, km), ...])."""
+        if origin not in self.index or destination not in self.index:
+            raise ValueError("Location is not part of the route network yet.")
+        if origin == destination:
+            raise ValueError("Source and destination cannot be the same location.")
+        source, target = self.index[origin], self.index[destination]
+        co2, km, pred = self._tree(source)
+        if not np.isfinite(co2[target]):
+            raise ValueError(f"No multimodal path from {origin[1]}, {origin[0]} to {destination[1]}, {destination[0]}.")
+        legs = []
+        node = target
+        while node != source:
+            previous = int(pred[node])
+            legs.append((self.keys[previous], self.keys[node], self.modes[self.mode[previous, node]], float(self.leg_km[previous, node])))
+            node = previous
+        return float(co2[target]), float(km[target]), legs[::-1]
+
+    def costs(self, origins, destinations):
+        """Per-ton CO2 and km for arrays of node positions (-1 = unknown), one Dijkstra tree per distinct origin."""
+        co2 = np.full(len(origins), np.nan)
+        km = np.full(len(origins), np.nan)
+        known = (origins >= 0) & (destinations >= 0)
+        for source in np.unique(origins[known]):
+            rows = np.flatnonzero(known & (origins == source))
+            tree_co2, tree_km, _ = self._tree(int(source))
+            co2[rows] = tree_co2[destinations[rows]]
+            km[rows] = tree_km[destinations[rows]]
+        unreachable = ~np.isfinite(co2)
+        co2[unreachable] = np.nan
+        km[unreachable] = np.nan
+        return co2, km
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def _route_graph(db_path, coordinates_version, prioritize_green):
+    return RouteGraph(coordinate_cache().snapshot(), prioritize_green)
+
+def route_graph(prioritize_green=False):
+    """Process-wide route graph, rebuilt when coordinates change."""
+    return _route_graph(DB_PATH, get_data_version('coordinates'), prioritize_green)
+
+def optimize_route_graph(country1, city1, country2, city2, weight_tons, prioritize_green=False):
+    """
+    Lowest-CO2 multimodal path through the hub network with any number of legs.
+    Returns {'co2_kg', 'distance_km', 'legs': [{'from', 'to', 'mode', 'distance_km', 'co2_kg'}, ...],
+    'path': [(lat, lon) of every stop from origin to destination]}.
+    """
+    if weight_tons <= 0:
+        raise ValueError("Weight must be positive.")
+    graph = route_graph(prioritize_green)
+    co2_per_ton, km, legs = graph.path((country1, city1), (country2, city2))
+    stops = [legs[0][0]] + [end for _, end, _, _ in legs]
+    return {
+        'co2_kg': round(co2_per_ton * weight_tons, 2),
+        'distance_km': round(km, 2),
+        'path': [tuple(graph.coords[graph.index[stop]].tolist()) for stop in stops],
+        'legs': [{'from': f"{start[1]}, {start[0]}", 'to': f"{end[1]}, {end[0]}", 'mode': mode,
+                  'distance_km': round(leg_km, 2), 'co2_kg': round(leg_km * EMISSION_FACTORS[mode] * weight_tons, 2)}
+                 for start, end, mode, leg_km in legs]
+    }
+
+def optimize_routes_graph(routes, prioritize_green=False):
+    """
+    Batched optimize_route_graph for a frame with source_country/city, dest_country/city and weight_tons.
+    Returns a DataFrame aligned with `routes` with graph_co2, graph_distance_km and error (None when a path exists).
+    """
+    graph = route_graph(prioritize_green)
+    source_codes, dest_codes, locations = _factorize_locations(routes)
+    positions = np.array([graph.index.get((str(country), str(city)), -1) for country, city in locations], dtype=np.int64)
+    origins = positions[source_codes] if len(positions) else np.zeros(0, dtype=np.int64)
+    destinations = positions[dest_codes] if len(positions) else np.zeros(0, dtype=np.int64)
+    co2_per_ton, km = graph.costs(origins, destinations)
+    weight_tons = exact_values(routes['weight_tons'])
+    errors = np.full(len(routes), None, dtype=object)
+    errors[(origins < 0) | (destinations < 0)] = "Location is not part of the route network yet."
+    errors[(origins == destinations) & (origins >= 0)] = "Source and destination cannot be the same location."
+    errors[np.isnan(co2_per_ton) & pd.isna(errors)] = "No multimodal path between these locations."
+    errors[(weight_tons <= 0) & pd.isna(errors)] = "Weight must be positive."
+    valid = pd.isna(errors)
+    return pd.DataFrame({
+        'graph_co2': np.where(valid, _round_like_builtin(co2_per_ton * weight_tons), np.nan),
+        'graph_distance_km': np.where(valid, _round_like_builtin(km), np.nan),
+        'error': errors
+    }, index=routes.index)
+
+# Pareto trade-offs between CO2, cost and transit time over a dense grid of two-mode splits
+MODE_COST_EUR_PER_TON_KM = {
+    'Truck': 0.10,
+    'Train': 0.05,
+    'Ship': 0.012,
+    'Plane': 0.80,
+    'Electric Truck': 0.12,
+    'Biofuel Truck': 0.11,
+    'Hydrogen Truck': 0.14
+}
+MODE_SPEED_KMH = {  # door-to-door averages including handling
+    'Truck': 60,
+    'Train': 45,
+    'Ship': 25,
+    'Plane': 500,
+    'Electric Truck': 55,
+    'Biofuel Truck': 60,
+    'Hydrogen Truck': 60
+}
+PARETO_RATIO_STEPS = 20
+# Every route class (2 flags x 3 bands) with and without green modes, for the last few carbon price quotes
+PARETO_CACHE_ENTRIES = 2 * len(ROUTE_DISTANCE_BANDS) * 2 * 4
+
+@st.cache_data(show_spinner=False, max_entries=PARETO_CACHE_ENTRIES)
+def _pareto_frontier(intercontinental, band, prioritize_green, carbon_price):
+    """
+    Pareto-optimal (mode1, ratio1, mode2, ratio2) splits with CO2 and cost per ton-km and hours per km for a route
+    class (intercontinental flag and index into ROUTE_DISTANCE_BANDS). The class's route_combinations set which
+    modes are feasible and which of them may carry the longer leg; the grid varies the split between them.
+    All three objectives scale linearly with the lane (CO2/cost by distance x weight, time by distance), so the
+    frontier and its balanced choice are the same for every lane of a class and are computed once.
+    """
+    candidates = route_combinations(intercontinental, ROUTE_DISTANCE_BANDS[band][0], False)
+    if prioritize_green:
+        candidates += route_combinations(intercontinental, ROUTE_DISTANCE_BANDS[band][0], True)
+    leads = {mode1 for mode1, _, _, _ in candidates}
+    modes = [mode for mode in EMISSION_FACTORS if mode in leads or any(mode == mode2 for _, _, mode2, _ in candidates)]
+    # Each split is listed once, longer leg first; even splits put a mode that can lead first
+    order = {mode: (mode not in leads, position) for position, mode in enumerate(modes)}
+    grid = [(mode1, 1.0, None, 0.0) for mode1 in modes]
+    for step in range(PARETO_RATIO_STEPS // 2, PARETO_RATIO_STEPS):
+        ratio = step / PARETO_RATIO_STEPS
+        grid += [(mode1, ratio, mode2, round(1 - ratio, 10)) for mode1 in modes for mode2 in modes
+                 if mode1 != mode2 and (ratio > 0.5 or order[mode1] < order[mode2])]
+    grid = [option for option in grid if option[0] in leads]
+    options = pd.DataFrame(grid, columns=['mode1', 'ratio1', 'mode2', 'ratio2'])
+    second = options['mode2'].fillna(options['mode1'])
+    factor = lambda table: options['ratio1'] * options['mode1'].map(table) + options['ratio2'] * second.map(table)
+    options['co2_per_ton_km'] = factor(EMISSION_FACTORS)
+    options['cost_per_ton_km'] = factor(MODE_COST_EUR_PER_TON_KM) + options['co2_per_ton_km'] / 1000 * carbon_price
+    options['hours_per_km'] = options['ratio1'] / options['mode1'].map(MODE_SPEED_KMH) + options['ratio2'] / second.map(MODE_SPEED_KMH)
+
+    objectives = options[['co2_per_ton_km', 'cost_per_ton_km', 'hours_per_km']].to_numpy()
+    no_worse = (objectives[None, :, :] <= objectives[:, None, :]).all(axis=2)
+    better = (objectives[None, :, :] < objectives[:, None, :]).any(axis=2)
+    frontier = options[~(no_worse & better).any(axis=1)].sort_values('co2_per_ton_km', kind='stable').reset_index(drop=True)
+    # Balanced choice: smallest sum of objectives scaled to [0, 1] across the frontier
+    values = frontier[['co2_per_ton_km', 'cost_per_ton_km', 'hours_per_km']].to_numpy()
+    span = np.where(values.max(axis=0) > values.min(axis=0), values.max(axis=0) - values.min(axis=0), 1.0)
+    balanced = int(np.argmin(((values - values.min(axis=0)) / span).sum(axis=1)))
+    return frontier, balanced
+
+def pareto_routes(country1, country2, distance_km, weight_tons, prioritize_green=False):
+    """Pareto-optimal mode splits for one lane with co2_kg, cost_eur (freight plus carbon) and transit_hours, lowest CO2 first."""
+    if weight_tons <= 0:
+        raise ValueError("Weight must be positive.")
+    if distance_km <= 0:
+        raise ValueError("Distance must be positive.")
+    band = int(_distance_bands(distance_km))
+    frontier, balanced = _pareto_frontier(country1 != country2, band, prioritize_green, get_carbon_price())
+    options = frontier[['mode1', 'ratio1', 'mode2', 'ratio2']].copy()
+    options['co2_kg'] = _round_like_builtin(frontier['co2_per_ton_km'] * distance_km * weight_tons)
+    options['cost_eur'] = _round_like_builtin(frontier['cost_per_ton_km'] * distance_km * weight_tons)
+    options['transit_hours'] = _round_like_builtin(frontier['hours_per_km'] * distance_km, 1)
+    options['balanced'] = options.index == balanced
+    return options
+
+def pareto_routes_bulk(routes, prioritize_green=False):
+    """
+    Per-row Pareto summary for a frame with source_country, dest_country, distance_km and weight_tons:
+    the frontier size of the row's route class and the balanced option with its CO2, cost and transit time.
+    error is None for valid rows.
+    """
+    distance_km = exact_values(routes['distance_km'])
+    weight_tons = exact_values(routes['weight_tons'])
+    intercontinental = (routes['source_country'] != routes['dest_country']).to_numpy()
+    bands = _distance_bands(distance_km)
+    result = pd.DataFrame({'pareto_options': 0, 'balanced_mode1': None, 'balanced_ratio1': np.nan, 'balanced_mode2': None,
+                           'balanced_ratio2': np.nan, 'balanced_co2': np.nan, 'balanced_cost_eur': np.nan,
+                           'balanced_hours': np.nan}, index=routes.index)
+    for flag, band in {(bool(flag), int(band)) for flag, band in zip(intercontinental, bands)}:
+        frontier, balanced = _pareto_frontier(flag, band, prioritize_green, get_carbon_price())
+        choice = frontier.iloc[balanced]
+        rows = (intercontinental == flag) & (bands == band)
+        result.loc[rows, ['pareto_options', 'balanced_mode1', 'balanced_ratio1', 'balanced_mode2', 'balanced_ratio2']] = \
+            [len(frontier), choice['mode1'], choice['ratio1'], choice['mode2'], choice['ratio2']]
+        result.loc[rows, 'balanced_co2'] = _round_like_builtin(choice['co2_per_ton_km'] * distance_km[rows] * weight_tons[rows])
+        result.loc[rows, 'balanced_cost_eur'] = _round_like_builtin(choice['cost_per_ton_km'] * distance_km[rows] * weight_tons[rows])
+        result.loc[rows, 'balanced_hours'] = _round_like_builtin(choice['hours_per_km'] * distance_km[rows], 1)
+    errors = np.full(len(routes), None, dtype=object)
+    errors[weight_tons <= 0] = "Weight must be positive."
+    errors[(distance_km <= 0) & pd.isna(errors)] = "Distance must be positive."
+    result['error'] = errors
+    invalid = ~pd.isna(errors)
+    result.loc[invalid, ['balanced_mode1', 'balanced_mode2']] = None
+    result.loc[invalid, ['balanced_ratio1', 'balanced_ratio2', 'balanced_co2', 'balanced_cost_eur', 'balanced_hours']] = np.nan
+    result.loc[invalid, 'pareto_options'] = 0
+    return result
+
+@instrumented
+def save_emission(source_country, source_city, dest_country, dest_city, transport_mode, distance_km, co2_kg, weight_tons):
     """Save emission data to the SQLite database."""
     try:
-        with sqlite3.connect('emissions.db') as conn:
+        with db_connection() as conn:
             c = conn.cursor()
             emission_id = str(uuid.uuid4())
-            c.execute('INSERT INTO emissions (id, source, destination, transport_mode, distance_km, co2_kg, weight_tons) VALUES (?, ?, ?, ?, ?, ?, ?)',
-                      (emission_id, source, destination, transport_mode, distance_km, co2_kg, weight_tons))
+            source_id, dest_id = _location_ids(conn, [(source_country, source_city), (dest_country, dest_city)])
+            c.execute('''INSERT INTO emissions (id, source, destination, source_location_id, dest_location_id, transport_mode, distance_km, co2_kg, weight_tons) 
+                         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                      (emission_id, f"{source_city}, {source_country}", f"{dest_city}, {dest_country}", source_id, dest_id,
+                       transport_mode, distance_km, co2_kg, weight_tons))
+            _rollup_emissions(conn, 'rowid = ?', (c.lastrowid,))
+            _bump_data_version(conn, 'emissions')
             conn.commit()
     except sqlite3.Error as e:
         handle_error(f"Failed to save emission: {e}", "Could not save emission data.")
 
+# Bulk shipment ingestion
+INGEST_BATCH_SIZE = 50000
+INGEST_COLUMNS = ['source_country', 'source_city', 'dest_country', 'dest_city', 'transport_mode', 'weight_tons']
+
+_UUID_HEX_POSITIONS = [i for i in range(36) if i not in (8, 13, 18, 23)]
+
+def _uuid4_batch(n):
+    """Generate n random version-4 UUID strings in one vectorized pass."""
+    raw = np.frombuffer(os.urandom(16 * n), dtype=np.uint8).reshape(n, 16).copy()
+    raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40
+    raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80
+    hex_chars = np.frombuffer(raw.tobytes().hex().encode('ascii'), dtype=np.uint8).reshape(n, 32)
+    chars = np.full((n, 36), ord('-'), dtype=np.uint8)
+    chars[:, _UUID_HEX_POSITIONS] = hex_chars
+    return chars.view('S36').ravel().astype(str).tolist()
+
+def _format_timestamps(timestamps):
+    """Format a datetime Series as SQLite CURRENT_TIMESTAMP-style strings (UTC, second resolution)."""
+    if timestamps.dt.tz is not None:
+        timestamps = timestamps.dt.tz_convert('UTC').dt.tz_localize(None)
+    chars = np.datetime_as_string(timestamps.to_numpy().astype('datetime64[s]'), unit='s').astype('S19')
+    chars = chars.view(np.uint8).reshape(-1, 19).copy()
+    chars[:, 10] = ord(' ')
+    return chars.view('S19').ravel().astype(str).tolist()
+
+def _iter_shipment_batches(source, batch_size):
+    """Yield DataFrame batches from a CSV/Parquet path or upload, a DataFrame, or an iterable of records."""
+    if isinstance(source, pd.DataFrame):
+        for start in range(0, len(source), batch_size):
+            yield source.iloc[start:start + batch_size]
+    elif isinstance(source, (str, os.PathLike)) or hasattr(source, 'read'):
+        name = str(getattr(source, 'name', source)).lower()
+        if name.endswith('.parquet'):
+            try:
+                import pyarrow.parquet as pq
+            except ImportError:
+                raise ValueError("Parquet import requires the pyarrow package.")
+            for batch in pq.ParquetFile(source).iter_batches(batch_size=batch_size):
+                yield batch.to_pandas()
+        else:
+            yield from pd.read_csv(source, chunksize=batch_size)
+    else:
+        records = iter(source)
+        while True:
+            chunk = list(itertools.islice(records, batch_size))
+            if not chunk:
+                break
+            yield pd.DataFrame.from_records(chunk)
+
+def store_emissions(result):
+    """
+    Write the valid rows of a calculate_emissions_bulk result to the emissions table in one transaction.
+    An optional timestamp column is stored too; rows whose timestamp cannot be parsed are marked "Invalid timestamp."
+    and skipped. Returns the result with its error column updated, so rows without an error are the ones stored.
+    """
+    has_timestamp = 'timestamp' in result.columns
+    if has_timestamp:
+        timestamps = pd.to_datetime(result['timestamp'], errors='coerce', utc=True)
+        invalid_timestamp = timestamps.isna() & result['error'].isna()
+        if invalid_timestamp.any():
+            result = result.copy(deep=False)
+            result['error'] = result['error'].where(~invalid_timestamp, "Invalid timestamp.")
+    valid = result['error'].isna()
+    rows = result[valid]
+    if rows.empty:
+        return result
+
+    source_codes, dest_codes, locations = _factorize_locations(rows)
+    params = [
+        _uuid4_batch(len(rows)),
+        (rows['source_city'].astype(str) + ', ' + rows['source_country'].astype(str)).tolist(),
+        (rows['dest_city'].astype(str) + ', ' + rows['dest_country'].astype(str)).tolist(),
+        None,
+        None,
+        rows['transport_mode'].tolist(),
+        rows['distance_km'].tolist(),
+        rows['co2_kg'].tolist(),
+        pd.to_numeric(rows['weight_tons']).astype(float).tolist()
+    ]
+    columns = 'id, source, destination, source_location_id, dest_location_id, transport_mode, distance_km, co2_kg, weight_tons'
+    if has_timestamp:
+        params.append(_format_timestamps(timestamps[valid]))
+        columns += ', timestamp'
+    placeholders = ', '.join('?' * len(params))
+    with db_connection() as conn:
+        location_ids = np.array(_location_ids(conn, ((str(country), str(city)) for country, city in locations)), dtype=np.int64)
+        params[3] = location_ids[source_codes].tolist()
+        params[4] = location_ids[dest_codes].tolist()
+        conn.executemany(f'INSERT INTO emissions ({columns}) VALUES ({placeholders})', zip(*params))
+        # The batch holds the write lock, so its rows got the highest, consecutive rowids
+        last_rowid = conn.execute('SELECT MAX(rowid) FROM emissions').fetchone()[0]
+        _rollup_emissions(conn, 'rowid > ?', (last_rowid - len(rows),))
+        _bump_data_version(conn, 'emissions')
+    return result
+
+COORDINATE_COLUMNS = ['country', 'city', 'lat', 'lon']
+
+def import_coordinates(source):
+    """
+    Load known coordinates from a CSV file (path or upload) or DataFrame with COORDINATE_COLUMNS into the
+    coordinates table and the coordinate cache, so shipments between those locations import without geocoding.
+    Returns the number of locations stored.
+    """
+    frame = source if isinstance(source, pd.DataFrame) else pd.read_csv(source)
+    missing = [col for col in COORDINATE_COLUMNS if col not in frame.columns]
+    if missing:
+        raise ValueError(f"Missing coordinate columns: {', '.join(missing)}")
+    lat = pd.to_numeric(frame['lat'], errors='coerce')
+    lon = pd.to_numeric(frame['lon'], errors='coerce')
+    invalid = ~(lat.between(-90, 90) & lon.between(-180, 180)) | frame['country'].isna() | frame['city'].isna()
+    if invalid.any():
+        raise ValueError(f"{int(invalid.sum())} coordinate rows have no location or an out-of-range latitude/longitude")
+    rows = list(zip(frame['country'].astype(str), frame['city'].astype(str), lat.astype(float), lon.astype(float)))
+    with db_connection() as conn:
+        conn.executemany('INSERT OR REPLACE INTO coordinates (country, city, lat, lon) VALUES (?, ?, ?, ?)', rows)
+        _bump_data_version(conn, 'coordinates')
+    cache = coordinate_cache()
+    for country, city, lat, lon in rows:
+        cache.put(country, city, (lat, lon), persist=False)
+    return len(rows)
+
+def ingest_shipments(source, batch_size=INGEST_BATCH_SIZE):
+    """
+    Bulk-load shipments into the emissions table.
+    `source` is a CSV/Parquet file (path or upload), a DataFrame or an iterable of dicts with INGEST_COLUMNS
+    and an optional timestamp. Rows are validated and priced with calculate_emissions_bulk and written with
+    executemany, one transaction per batch. Returns counts, rejected rows (with their error) and throughput.
+    """
+    started = time.perf_counter()
+    inserted = 0
+    rejected = []
+    for batch in _iter_shipment_batches(source, batch_size):
+        missing = [col for col in INGEST_COLUMNS if col not in batch.columns]
+        if missing:
+            raise ValueError(f"Missing shipment columns: {', '.join(missing)}")
+        result = store_emissions(calculate_emissions_bulk(batch))
+        valid = result['error'].isna()
+        if not valid.all():
+            rejected.append(result.loc[~valid, [col for col in batch.columns] + ['error']])
+        inserted += int(valid.sum())
+
+    seconds = time.perf_counter() - started
+    rejected = pd.concat(rejected, ignore_index=True) if rejected else pd.DataFrame(columns=INGEST_COLUMNS + ['error'])
+    rows_per_second = inserted / seconds if seconds > 0 else 0.0
+    logging.info(f"Ingested {inserted} shipments ({len(rejected)} rejected) in {seconds:.2f}s ({rows_per_second:,.0f} rows/s)")
+    return {'inserted': inserted, 'rejected': rejected, 'seconds': seconds, 'rows_per_second': rows_per_second}
+
+@instrumented
 def save_packaging(material_type, weight_kg, co2_kg):
     """Save packaging emission data to the SQLite database."""
     try:
-        with sqlite3.connect('emissions.db') as conn:
+        with db_connection() as conn:
             c = conn.cursor()
             packaging_id = str(uuid.uuid4())
             c.execute('INSERT INTO packaging (id, material_type, weight_kg, co2_kg) VALUES (?, ?, ?, ?)',
                       (packaging_id, material_type, weight_kg, co2_kg))
+            _bump_data_version(conn, 'packaging')
             conn.commit()
     except sqlite3.Error as e:
         handle_error(f"Failed to save packaging: {e}", "Could not save packaging data.")
 
+@instrumented
 def save_offset(project_type, co2_offset_tons, cost_usd):
     """Save carbon offset data to the SQLite database."""
     try:
-        with sqlite3.connect('emissions.db') as conn:
+        with db_connection() as conn:
             c = conn.cursor()
             offset_id = str(uuid.uuid4())
             c.execute('INSERT INTO offsets (id, project_type, co2_offset_tons, cost_usd) VALUES (?, ?, ?, ?)',
                       (offset_id, project_type, co2_offset_tons, cost_usd))
+            _rollup_offsets(conn, 'rowid = ?', (c.lastrowid,))
+            _bump_data_version(conn, 'offsets')
             conn.commit()
     except sqlite3.Error as e:
         handle_error(f"Failed to save offset: {e}", "Could not save offset data.")
 
-def get_emissions():
-    """Retrieve all emission records from the database."""
+# Query result cache
+QUERY_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+class QueryCache:
+    """
+    Thread-safe LRU of query results keyed by (sql, params, tables) and stamped with the tables' data version.
+    A hit is only served while the stamp matches; entries are evicted least recently used beyond max_bytes.
+    """
+
+    def __init__(self, max_bytes=QUERY_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _discard(self, key):
+        _, _, size = self._entries.pop(key)
+        self.bytes -= size
+
+    def frame(self, sql, params=(), tables=(), prepare=None):
+        """
+        Return the result of sql as a DataFrame, served from memory when tables have not been written since.
+        `prepare` post-processes a fresh result before it is cached (e.g. compact_frame).
+        Hits share their column data with the cache: treat the result as read-only (adding columns is fine).
+        """
+        key = (sql, tuple(params), tuple(tables), prepare)
+        version = get_data_version(*tables)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1].copy(deep=False)
+            self.misses += 1
+        with metrics().timer('sql_query'), db_connection() as conn:
+            df = pd.read_sql_query(sql, conn, params=params)
+        if prepare is not None:
+            df = prepare(df)
+        size = int(df.memory_usage(deep=True).sum())
+        with self._lock:
+            if key in self._entries:
+                self._discard(key)
+            if size <= self.max_bytes:
+                self._entries[key] = (version, df, size)
+                self.bytes += size
+                while self.bytes > self.max_bytes:
+                    self._discard(next(iter(self._entries)))
+        return df.copy(deep=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        """Entry count, memory use and hit/miss counters."""
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self.bytes, 'max_bytes': self.max_bytes,
+                    'hits': self.hits, 'misses': self.misses}
+
+@st.cache_resource(show_spinner=False)
+def _query_cache(db_path):
+    return QueryCache()
+
+def query_cache():
+    """Process-wide query result cache for DB_PATH."""
+    return _query_cache(DB_PATH)
+
+def cached_query(sql, params=(), tables=(), prepare=None):
+    """Run a read query through the query cache, invalidated by writes to tables."""
+    return query_cache().frame(sql, params, tables, prepare)
+
+# Typed loading: project the columns a page needs and store them in compact dtypes
+CATEGORICAL_COLUMNS = ('transport_mode', 'project_type', 'material_type')
+# Source/destination columns share one category set per pair so they stay comparable with each other
+LOCATION_COLUMN_PAIRS = [('source', 'destination'), ('source_country', 'dest_country'), ('source_city', 'dest_city')]
+TIMESTAMP_COLUMNS = ('timestamp', 'created_at', 'observed_at')
+FLOAT_DECIMALS = 2
+EMISSION_SELECT = {
+    'id': 'e.id', 'source': 'e.source', 'destination': 'e.destination',
+    'source_country': 's.country', 'source_city': 's.city', 'dest_country': 'd.country', 'dest_city': 'd.city',
+    'transport_mode': 'e.transport_mode', 'distance_km': 'e.distance_km', 'co2_kg': 'e.co2_kg',
+    'weight_tons': 'e.weight_tons', 'timestamp': 'e.timestamp'
+}
+ROUTE_COLUMNS = ['source', 'destination', 'source_country', 'source_city', 'dest_country', 'dest_city',
+                 'transport_mode', 'distance_km', 'co2_kg', 'weight_tons']
+
+def compact_frame(df):
+    """
+    Convert a query result to compact dtypes: categoricals for low-cardinality labels and locations, datetime64
+    timestamps, and float32 for float columns whose values survive the round trip at FLOAT_DECIMALS decimals.
+    """
+    for pair in LOCATION_COLUMN_PAIRS:
+        present = [column for column in pair if column in df.columns]
+        if present:
+            dtype = pd.CategoricalDtype(pd.unique(pd.concat([df[column] for column in present]).dropna()))
+            for column in present:
+                df[column] = df[column].astype(dtype)
+    for column in df.columns:
+        if column in CATEGORICAL_COLUMNS:
+            df[column] = df[column].astype('category')
+        elif column in TIMESTAMP_COLUMNS:
+            df[column] = pd.to_datetime(df[column], errors='coerce', format='ISO8601')
+        elif df[column].dtype == np.float64:
+            values = df[column].to_numpy()
+            narrow = values.astype(np.float32)
+            rounded = np.round(values, FLOAT_DECIMALS)
+            if np.array_equal(np.round(narrow.astype(np.float64), FLOAT_DECIMALS), rounded, equal_nan=True) \
+                    and np.allclose(values, rounded, rtol=0, atol=1e-9, equal_nan=True):
+                df[column] = narrow
+    return df
+
+def exact_values(column):
+    """
+    Return a numeric column as float64. Columns narrowed to float32 by compact_frame only ever held values with
+    FLOAT_DECIMALS decimals, so rounding restores the stored values exactly before they are used in calculations.
+    """
+    values = np.asarray(column, dtype=float)
+    if getattr(column, 'dtype', None) == np.float32:
+        values = np.round(values, FLOAT_DECIMALS)
+    return values
+
+def _projection(columns, available):
+    columns = list(columns or available)
+    unknown = [column for column in columns if column not in available]
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+    return columns
+
+@instrumented
+def get_emissions(snapshot=False, columns=None):
+    """
+    Retrieve emission records (all columns, or just `columns`) in compact dtypes from the database,
+    or from the Parquet snapshot when snapshot is True.
+    """
+    columns = _projection(columns, EMISSION_SELECT)
+    if snapshot:
+        return compact_frame(split_locations(read_snapshot('emissions'))[columns])
+    joins = ''
+    if any(column.startswith('source_') for column in columns):
+        joins += ' LEFT JOIN locations s ON s.id = e.source_location_id'
+    if any(column.startswith('dest_') for column in columns):
+        joins += ' LEFT JOIN locations d ON d.id = e.dest_location_id'
     try:
-        with sqlite3.connect('emissions.db') as conn:
-            df = pd.read_sql_query('SELECT * FROM emissions', conn)
-        return df
+        return cached_query(f'SELECT {", ".join(f"{EMISSION_SELECT[column]} AS {column}" for column in columns)} FROM emissions e{joins}',
+                            tables=('emissions',), prepare=compact_frame)
     except sqlite3.Error as e:
         handle_error(f"Failed to retrieve emissions: {e}", "Could not load emission data.")
         return pd.DataFrame()
 
+@instrumented
+def get_price_history(symbol):
+    """Stored quotes of a market data symbol as observed_at, price, oldest first."""
+    try:
+        return cached_query('SELECT observed_at, price FROM market_prices WHERE symbol = ? ORDER BY observed_at',
+                            (symbol,), tables=('market_prices',), prepare=compact_frame)
+    except sqlite3.Error as e:
+        handle_error(f"Failed to retrieve price history for {symbol}: {e}", "Could not load market price history.")
+        return pd.DataFrame(columns=['observed_at', 'price'])
+
+def prices_at(symbol, timestamps, fallback):
+    """
+    Price of symbol in force at each timestamp: an as-of join against the stored quotes (the latest quote at or before
+    the timestamp). Timestamps before the first quote take the earliest one; missing timestamps, or a symbol with no
+    quotes, take fallback.
+    """
+    timestamps = pd.to_datetime(pd.Series(timestamps), errors='coerce').to_numpy(dtype='datetime64[ns]')
+    history = get_price_history(symbol)
+    if history.empty:
+        return np.full(len(timestamps), float(fallback))
+    observed = history['observed_at'].to_numpy(dtype='datetime64[ns]')
+    index = np.clip(np.searchsorted(observed, timestamps, side='right') - 1, 0, None)
+    return np.where(np.isnat(timestamps), float(fallback), exact_values(history['price'])[index])
+
+def shipment_costs(emissions, currency='EUR'):
+    """
+    Carbon cost of each row (co2_kg and timestamp columns) in currency, at the carbon price and exchange rate
+    in force at its timestamp. Rows are shipments or daily totals. Returns a float64 array aligned with emissions.
+    """
+    cost = exact_values(emissions['co2_kg']) / 1000 * prices_at(CARBON_PRICE_SYMBOL, emissions['timestamp'], get_carbon_price())
+    if currency != 'EUR':
+        cost *= prices_at(fx_symbol(currency), emissions['timestamp'], exchange_rate(currency))
+    return cost
+
+# Paginated browsing and chunked export of the emissions table
+EMISSIONS_PAGE_SIZE = 100
+EXPORT_CHUNK_ROWS = 10000
+EMISSION_COLUMNS = ['id', 'source', 'destination', 'transport_mode', 'distance_km', 'co2_kg', 'weight_tons', 'timestamp']
+
+@instrumented
+def get_emissions_page(before=None, page_size=EMISSIONS_PAGE_SIZE):
+    """
+    Fetch one page of emissions, newest first, using keyset pagination on the timestamp index.
+    `before` is the (timestamp, rowid) key returned with the previous page; returns (page, next key or None).
+    """
+    query = f'SELECT rowid AS row_key, {", ".join(EMISSION_COLUMNS)} FROM emissions'
+    params = []
+    if before is not None:
+        query += ' WHERE (timestamp, rowid) < (?, ?)'
+        params.extend(before)
+    query += ' ORDER BY timestamp DESC, rowid DESC LIMIT ?'
+    params.append(page_size + 1)
+    try:
+        with db_connection() as conn:
+            df = pd.read_sql_query(query, conn, params=params)
+    except sqlite3.Error as e:
+        handle_error(f"Failed to retrieve emissions page: {e}", "Could not load emission data.")
+        return pd.DataFrame(columns=EMISSION_COLUMNS), None
+    next_key = None
+    if len(df) > page_size:
+        df = df.iloc[:page_size]
+        next_key = (df['timestamp'].iat[-1], int(df['row_key'].iat[-1]))
+    return df.drop(columns='row_key'), next_key
+
+def iter_emissions_csv(chunk_rows=EXPORT_CHUNK_ROWS):
+    """
+    Yield the emissions table as UTF-8 CSV byte chunks of at most chunk_rows rows.
+    Each chunk is its own keyset query on rowid, so memory stays flat and no read transaction is held between chunks.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(EMISSION_COLUMNS)
+    last_rowid = 0
+    while True:
+        with db_connection() as conn:
+            rows = conn.execute(f'SELECT rowid, {", ".join(EMISSION_COLUMNS)} FROM emissions WHERE rowid > ? ORDER BY rowid LIMIT ?',
+                                (last_rowid, chunk_rows)).fetchall()
+        if rows:
+            last_rowid = rows[-1][0]
+            writer.writerows(row[1:] for row in rows)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+        if len(rows) < chunk_rows:
+            break
+
+def export_emissions_csv_gz(chunk_rows=EXPORT_CHUNK_ROWS):
+    """Stream the emissions CSV chunk by chunk into a gzip payload for download."""
+    payload = io.BytesIO()
+    with gzip.GzipFile(fileobj=payload, mode='wb') as archive:
+        for chunk in iter_emissions_csv(chunk_rows):
+            archive.write(chunk)
+    return payload.getvalue()
+
+# Columnar snapshots: one Parquet file per table and month under <db>_snapshots/<table>/month=YYYY-MM/
+SNAPSHOT_TABLES = {
+    'emissions': ('timestamp', [('id', 'string'), ('source', 'string'), ('destination', 'string'), ('transport_mode', 'string'),
+                                ('distance_km', 'float64'), ('co2_kg', 'float64'), ('weight_tons', 'float64'), ('timestamp', 'timestamp')]),
+    'packaging': ('timestamp', [('id', 'string'), ('material_type', 'string'), ('weight_kg', 'float64'), ('co2_kg', 'float64'),
+                                ('timestamp', 'timestamp')]),
+    'offsets': ('timestamp', [('id', 'string'), ('project_type', 'string'), ('co2_offset_tons', 'float64'), ('cost_usd', 'float64'),
+                              ('timestamp', 'timestamp')]),
+    'suppliers': ('created_at', [('id', 'string'), ('supplier_name', 'string'), ('country', 'string'), ('city', 'string'),
+                                 ('material', 'string'), ('green_score', 'int64'), ('annual_capacity_tons', 'int64'),
+                                 ('sustainable_practices', 'string'), ('created_at', 'timestamp')]),
+}
+SNAPSHOT_COMPRESSION = 'zstd'
+SNAPSHOT_ON_MAINTENANCE = True
+
+def _snapshot_dir(snapshot_dir=None):
+    return snapshot_dir or os.path.splitext(DB_PATH)[0] + '_snapshots'
+
+def _snapshot_schema(pa, columns):
+    types = {'string': pa.string(), 'float64': pa.float64(), 'int64': pa.int64(), 'timestamp': pa.timestamp('s')}
+    return pa.schema([(name, types[kind]) for name, kind in columns])
+
+def _write_json_atomic(path, payload):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(payload, f)
+    os.replace(path + '.tmp', path)
+
+def _next_month(month):
+    year, month_number = int(month[:4]), int(month[5:7])
+    return f"{year + month_number // 12:04d}-{month_number % 12 + 1:02d}"
+
+def export_snapshots(snapshot_dir=None, tables=None):
+    """
+    Write tables to month-partitioned Parquet files, rewriting only partitions whose row count or highest rowid
+    changed since the last export and removing partitions whose rows were purged.
+    Returns {table: {'written', 'unchanged', 'removed'}}. Raises ValueError without pyarrow, sqlite3.Error/OSError on failure.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ValueError("Parquet snapshots require the pyarrow package.")
+    root = _snapshot_dir(snapshot_dir)
+    summary = {}
+    for table in tables or SNAPSHOT_TABLES:
+        time_column, columns = SNAPSHOT_TABLES[table]
+        schema = _snapshot_schema(pa, columns)
+        table_dir = os.path.join(root, table)
+        os.makedirs(table_dir, exist_ok=True)
+        manifest_path = os.path.join(table_dir, '_manifest.json')
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = {}
+        with db_connection() as conn:
+            current = {month: [rows, max_rowid] for month, rows, max_rowid in conn.execute(
+                f'''SELECT substr({time_column}, 1, 7) AS month, COUNT(*), MAX(rowid) FROM {table} 
+                    WHERE {time_column} IS NOT NULL GROUP BY month''')}
+        counts = {'written': 0, 'unchanged': 0, 'removed': 0}
+        for month, signature in sorted(current.items()):
+            partition = os.path.join(table_dir, f'month={month}')
+            if manifest.get(month) == signature and os.path.exists(os.path.join(partition, 'part-0.parquet')):
+                counts['unchanged'] += 1
+                continue
+            with db_connection() as conn:
+                df = pd.read_sql_query(f'SELECT {", ".join(name for name, _ in columns)} FROM {table} WHERE {time_column} >= ? AND {time_column} < ?',
+                                       conn, params=(month, _next_month(month)))
+            for name, kind in columns:
+                if kind == 'timestamp':
+                    df[name] = pd.to_datetime(df[name], errors='coerce').astype('datetime64[s]')
+            os.makedirs(partition, exist_ok=True)
+            target = os.path.join(partition, 'part-0.parquet')
+            pq.write_table(pa.Table.from_pandas(df, schema=schema, preserve_index=False), target + '.tmp',
+                           compression=SNAPSHOT_COMPRESSION)
+            os.replace(target + '.tmp', target)
+            manifest[month] = signature
+            counts['written'] += 1
+        for month in sorted(set(manifest) - set(current)):
+            partition = os.path.join(table_dir, f'month={month}')
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(partition, 'part-0.parquet'))
+                os.rmdir(partition)
+            del manifest[month]
+            counts['removed'] += 1
+        _write_json_atomic(manifest_path, manifest)
+        summary[table] = counts
+        logging.info(f"Snapshot of {table}: {counts['written']} partitions written, {counts['unchanged']} unchanged, {counts['removed']} removed")
+    return summary
+
+def snapshot_available(table='emissions', snapshot_dir=None):
+    """Whether an exported snapshot of table exists."""
+    return os.path.exists(os.path.join(_snapshot_dir(snapshot_dir), table, '_manifest.json'))
+
+def read_snapshot(table, columns=None, snapshot_dir=None):
+    """Load a table from its Parquet snapshot with its exported types. Raises ValueError without pyarrow or a snapshot."""
+    try:
+        import pyarrow.dataset as ds
+    except ImportError:
+        raise ValueError("Parquet snapshots require the pyarrow package.")
+    if table not in SNAPSHOT_TABLES or not snapshot_available(table, snapshot_dir):
+        raise ValueError(f"No snapshot of {table} has been exported.")
+    import pyarrow as pa
+    schema = _snapshot_schema(pa, SNAPSHOT_TABLES[table][1])
+    table_dir = os.path.join(_snapshot_dir(snapshot_dir), table)
+    with open(os.path.join(table_dir, '_manifest.json')) as f:
+        months = sorted(json.load(f))
+    # Read the partitions listed in the manifest so half-written files from a concurrent export are never picked up
+    dataset = ds.dataset([os.path.join(table_dir, f'month={month}', 'part-0.parquet') for month in months], schema=schema, format='parquet')
+    return dataset.to_table(columns=columns or schema.names).to_pandas()
+
+@instrumented
+def get_emission_totals(dimension):
+    """Read shipment count, CO2, tons and ton-km totals per mode, day, month or lane from the rollup tables."""
+    tables = {'mode': 'emission_totals_by_mode', 'day': 'emission_totals_by_day',
+              'month': 'emission_totals_by_month', 'lane': 'emission_totals_by_lane'}
+    if dimension not in tables:
+        raise ValueError(f"Unknown rollup dimension: {dimension}")
+    try:
+        if dimension == 'lane':
+            return cached_query('''SELECT s.city || ', ' || s.country AS source, d.city || ', ' || d.country AS destination, 
+                                          s.country AS source_country, s.city AS source_city, d.country AS dest_country, d.city AS dest_city, 
+                                          r.shipments, r.co2_kg, r.weight_tons, r.ton_km 
+                                   FROM emission_totals_by_lane r 
+                                   JOIN locations s ON s.id = r.source_location_id 
+                                   JOIN locations d ON d.id = r.dest_location_id''', tables=('emissions',))
+        return cached_query(f'SELECT * FROM {tables[dimension]}', tables=('emissions',))
+    except sqlite3.Error as e:
+        handle_error(f"Failed to read emission totals by {dimension}: {e}", "Could not load emission totals.")
+        return pd.DataFrame()
+
+@instrumented
+def get_lane_totals():
+    """Shipment count, CO2, tons and ton-km totals per origin/destination lane."""
+    return get_emission_totals('lane')
+
+@instrumented
+def get_offset_totals():
+    """Read offset count, tons and cost per project type from the rollup table."""
+    try:
+        return cached_query('SELECT * FROM offset_totals_by_project', tables=('offsets',))
+    except sqlite3.Error as e:
+        handle_error(f"Failed to read offset totals: {e}", "Could not load offset totals.")
+        return pd.DataFrame()
+
 # Enhanced timestamp handling
-def get_packaging():
-    """Retrieve all packaging emission records, handling invalid timestamps."""
+@instrumented
+def get_packaging(snapshot=False, columns=None):
+    """Retrieve packaging emission records (optionally only `columns`, or from the Parquet snapshot), handling invalid timestamps."""
+    columns = _projection(columns, [name for name, _ in SNAPSHOT_TABLES['packaging'][1]])
     try:
-        with sqlite3.connect('emissions.db') as conn:
-            df = pd.read_sql_query('SELECT * FROM packaging', conn)
-            df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
+        if snapshot:
+            df = compact_frame(read_snapshot('packaging', columns))
+        else:
+            df = cached_query(f'SELECT {", ".join(columns)} FROM packaging', tables=('packaging',), prepare=compact_frame)
+        if 'timestamp' in df.columns:
             invalid = df[df['timestamp'].isna()]
             if not invalid.empty:
                 st.warning(f"Found {len(invalid)} invalid timestamps. Please check the data.")
-                st.dataframe(invalid[['id', 'material_type', 'weight_kg', 'co2_kg', 'timestamp']])
+                st.dataframe(invalid[[column for column in ['id', 'material_type', 'weight_kg', 'co2_kg', 'timestamp'] if column in df.columns]])
             df = df.dropna(subset=['timestamp'])
-            return df
+        return df
     except sqlite3.Error as e:
         handle_error(f"Failed to retrieve packaging: {e}", "Could not load packaging data.")
         return pd.DataFrame()
 
-def get_offsets():
-    """Retrieve all carbon offset records from the database."""
+@instrumented
+def get_offsets(snapshot=False, columns=None):
+    """Retrieve carbon offset records (all columns, or just `columns`) in compact dtypes, from the database or the Parquet snapshot."""
+    columns = _projection(columns, [name for name, _ in SNAPSHOT_TABLES['offsets'][1]])
+    if snapshot:
+        return compact_frame(read_snapshot('offsets', columns))
     try:
-        with sqlite3.connect('emissions.db') as conn:
-            df = pd.read_sql_query('SELECT * FROM offsets', conn)
-        return df
+        return cached_query(f'SELECT {", ".join(columns)} FROM offsets', tables=('offsets',), prepare=compact_frame)
     except sqlite3.Error as e:
         handle_error(f"Failed to retrieve offsets: {e}", "Could not load offset data.")
         return pd.DataFrame()
 
 # Include created_at filtering
+@instrumented
 def get_suppliers(country=None, city=None, material=None, min_green_score=0, min_date=None):
     """Retrieve suppliers based on filters, including creation date."""
     try:
-        with sqlite3.connect('emissions.db') as conn:
-            query = 'SELECT * FROM suppliers WHERE green_score >= ?'
-            params = [min_green_score]
-            conditions = []
-            if country and country != "All":
-                conditions.append('country = ?')
-                params.append(country)
-            if city and city != "All":
-                conditions.append('city = ?')
-                params.append(city)
-            if material:
-                conditions.append('LOWER(material) LIKE ?')
-                params.append(f'%{material.lower()}%')
-            if min_date:
-                conditions.append('created_at >= ?')
-                params.append(min_date)
-            if conditions:
-                query += ' AND ' + ' AND '.join(conditions)
-            df = pd.read_sql_query(query, conn, params=params)
-        return df
+        query = 'SELECT * FROM suppliers WHERE green_score >= ?'
+        params = [min_green_score]
+        conditions = []
+        if country and country != "All":
+            conditions.append('country = ?')
+            params.append(country)
+        if city and city != "All":
+            conditions.append('city = ?')
+            params.append(city)
+        if material:
+            conditions.append('LOWER(material) LIKE ?')
+            params.append(f'%{material.lower()}%')
+        if min_date:
+            conditions.append('created_at >= ?')
+            params.append(min_date)
+        if conditions:
+            query += ' AND ' + ' AND '.join(conditions)
+        return cached_query(query, params, tables=('suppliers',))
     except sqlite3.Error as e:
         handle_error(f"Failed to retrieve suppliers: {e}", "Could not load supplier data.")
         return pd.DataFrame()
 
-def calculate_warehouse_savings(warehouse_size_m2, led_percentage, solar_percentage):
-    """Calculate CO2 and energy savings from green warehousing technologies."""
-    if warehouse_size_m2 <= 0:
+# Savings models; parameters may be scalars or broadcastable NumPy arrays
+def warehouse_savings_model(warehouse_size_m2, led_percentage, solar_percentage):
+    """CO2 and energy savings from green warehousing technologies."""
+    warehouse_size_m2, led_percentage, solar_percentage = np.broadcast_arrays(
+        *(np.asarray(p, dtype=float) for p in (warehouse_size_m2, led_percentage, solar_percentage)))
+    if not (warehouse_size_m2 > 0).all():
         raise ValueError("Warehouse size must be positive.")
-    if not (0 <= led_percentage <= 1 and 0 <= solar_percentage <= 1):
+    if not ((0 <= led_percentage) & (led_percentage <= 1) & (0 <= solar_percentage) & (solar_percentage <= 1)).all():
         raise ValueError("Percentages must be between 0 and 100.")
     traditional_energy_kwh = warehouse_size_m2 * 100
     led_savings_kwh = traditional_energy_kwh * led_percentage * 0.5
     solar_savings_kwh = traditional_energy_kwh * solar_percentage * 0.3
     total_savings_kwh = led_savings_kwh + solar_savings_kwh
-    co2_savings_kg = total_savings_kwh * 0.5
-    return round(co2_savings_kg, 2), round(total_savings_kwh, 2)
+    return {'co2_savings_kg': total_savings_kwh * 0.5, 'energy_savings_kwh': total_savings_kwh}
 
-def calculate_load_optimization(weight_tons, vehicle_capacity_tons, avg_trip_distance_km=100):
-    """Calculate CO2 savings from efficient load management."""
-    if weight_tons <= 0 or vehicle_capacity_tons <= 0 or avg_trip_distance_km <= 0:
+def load_optimization_model(weight_tons, vehicle_capacity_tons, avg_trip_distance_km=100):
+    """Trips and CO2 saved by loading vehicles to 98% instead of 90% of capacity."""
+    weight_tons, vehicle_capacity_tons, avg_trip_distance_km = np.broadcast_arrays(
+        *(np.asarray(p, dtype=float) for p in (weight_tons, vehicle_capacity_tons, avg_trip_distance_km)))
+    if not ((weight_tons > 0) & (vehicle_capacity_tons > 0) & (avg_trip_distance_km > 0)).all():
         raise ValueError("Weight, capacity, and distance must be positive.")
-    trips_without_optimization = math.ceil(weight_tons / (vehicle_capacity_tons * 0.90))
-    optimized_trips = math.ceil(weight_tons / (vehicle_capacity_tons * 0.98))
-    trips_saved = max(trips_without_optimization - optimized_trips, 0)
+    trips_without_optimization = np.ceil(weight_tons / (vehicle_capacity_tons * 0.90))
+    optimized_trips = np.ceil(weight_tons / (vehicle_capacity_tons * 0.98))
+    trips_saved = np.maximum(trips_without_optimization - optimized_trips, 0)
     co2_savings_kg = trips_saved * avg_trip_distance_km * EMISSION_FACTORS['Truck']
-    return trips_saved, round(co2_savings_kg, 2)
+    return {'trips_saved': trips_saved, 'co2_savings_kg': co2_savings_kg}
+
+def energy_savings_model(facility_size_m2, smart_system_usage):
+    """CO2 and energy savings from smart energy management systems."""
+    facility_size_m2, smart_system_usage = np.broadcast_arrays(
+        *(np.asarray(p, dtype=float) for p in (facility_size_m2, smart_system_usage)))
+    if not (facility_size_m2 > 0).all():
+        raise ValueError("Facility size must be positive.")
+    if not ((0 <= smart_system_usage) & (smart_system_usage <= 1)).all():
+        raise ValueError("Percentages must be between 0 and 100.")
+    traditional_energy_kwh = facility_size_m2 * 150
+    energy_savings_kwh = traditional_energy_kwh * smart_system_usage * 0.4
+    return {'co2_savings_kg': energy_savings_kwh * 0.5, 'energy_savings_kwh': energy_savings_kwh}
+
+def calculate_warehouse_savings(warehouse_size_m2, led_percentage, solar_percentage):
+    """Calculate CO2 and energy savings from green warehousing technologies."""
+    savings = warehouse_savings_model(warehouse_size_m2, led_percentage, solar_percentage)
+    return round(float(savings['co2_savings_kg']), 2), round(float(savings['energy_savings_kwh']), 2)
+
+def calculate_load_optimization(weight_tons, vehicle_capacity_tons, avg_trip_distance_km=100):
+    """Calculate CO2 savings from efficient load management."""
+    savings = load_optimization_model(weight_tons, vehicle_capacity_tons, avg_trip_distance_km)
+    return int(savings['trips_saved']), round(float(savings['co2_savings_kg']), 2)
+
+def calculate_energy_savings(facility_size_m2, smart_system_usage):
+    """Calculate CO2 and energy savings from smart energy management."""
+    savings = energy_savings_model(facility_size_m2, smart_system_usage)
+    return round(float(savings['co2_savings_kg']), 2), round(float(savings['energy_savings_kwh']), 2)
+
+# Scenario sweeps
+SCENARIO_MODELS = {
+    'warehouse': warehouse_savings_model,
+    'load': load_optimization_model,
+    'energy': energy_savings_model
+}
+SWEEP_LINE_POINTS = 200
+SWEEP_HEATMAP_POINTS = 320  # per axis; ~10^5 cells
+SWEEP_CACHE_ENTRIES = 32
+
+@st.cache_data(show_spinner=False, max_entries=SWEEP_CACHE_ENTRIES)
+def _sweep(model, parameters):
+    """Evaluate a model over the outer product of its swept parameters."""
+    axes = [name for name, values in parameters if np.ndim(values)]
+    grid = {}
+    for name, values in parameters:
+        if np.ndim(values):
+            shape = [1] * len(axes)
+            shape[axes.index(name)] = -1
+            values = np.reshape(values, shape)
+        grid[name] = values
+    outputs = SCENARIO_MODELS[model](**grid)
+    shape = tuple(len(values) for _, values in parameters if np.ndim(values))
+    return {name: _round_like_builtin(np.broadcast_to(values, shape)) for name, values in outputs.items()}
+
+def sweep_scenarios(model, **parameters):
+    """Evaluate a savings model over a parameter grid.
+    
+    Each keyword is a model parameter, given as a scalar (held fixed) or a 1-D sequence
+    (swept). Output arrays have one axis per swept parameter, in keyword order, and are
+    memoized by model and inputs.
+    """
+    if model not in SCENARIO_MODELS:
+        raise ValueError(f"Unknown scenario model: {model}.")
+    parameters = tuple((name, np.asarray(values, dtype=float)) for name, values in parameters.items())
+    if any(np.ndim(values) > 1 for _, values in parameters):
+        raise ValueError("Swept parameters must be 1-D sequences.")
+    return _sweep(model, parameters)
+
+# Fleet consolidation planning
+DEFAULT_FLEET = [
+    {'vehicle': 'Electric Van', 'mode': 'Electric Truck', 'capacity_tons': 3.5},
+    {'vehicle': 'Rigid Truck', 'mode': 'Truck', 'capacity_tons': 12.0},
+    {'vehicle': 'Articulated Truck', 'mode': 'Truck', 'capacity_tons': 24.0}
+]
+LOAD_EMPTY_SHARE = 0.6  # share of full-load fuel a vehicle burns running empty
+LOAD_WINDOW_HOURS = 48  # dispatch window for recorded shipments without explicit windows
+LOAD_TOLERANCE_TONS = 1e-9
+
+def _fleet_table(fleet):
+    """Validate a fleet and return it sorted by capacity with per-km CO2 coefficients."""
+    fleet = pd.DataFrame(fleet, columns=['vehicle', 'mode', 'capacity_tons'])
+    if fleet.empty:
+        raise ValueError("Fleet must contain at least one vehicle type.")
+    unknown = set(fleet['mode']) - set(EMISSION_FACTORS)
+    if unknown:
+        raise ValueError(f"Unknown transport mode(s) in fleet: {', '.join(sorted(map(str, unknown)))}.")
+    fleet['capacity_tons'] = pd.to_numeric(fleet['capacity_tons'], errors='coerce')
+    if not (fleet['capacity_tons'] > 0).all():
+        raise ValueError("Vehicle capacities must be positive.")
+    fleet = fleet.sort_values('capacity_tons', ignore_index=True)
+    factor = fleet['mode'].map(EMISSION_FACTORS).to_numpy(dtype=float)
+    # CO2 per km = fixed (running empty) + variable (per ton carried)
+    fleet['fixed_kg_per_km'] = factor * LOAD_EMPTY_SHARE * fleet['capacity_tons'].to_numpy()
+    fleet['kg_per_ton_km'] = factor * (1 - LOAD_EMPTY_SHARE)
+    return fleet
+
+def _trip_co2_per_km(loads, fleet):
+    """CO2 per km of the best vehicle for each load; returns (vehicle index, kg/km)."""
+    loads = np.asarray(loads, dtype=float)
+    capacity = fleet['capacity_tons'].to_numpy()
+    cost = fleet['fixed_kg_per_km'].to_numpy() + np.multiply.outer(loads, fleet['kg_per_ton_km'].to_numpy())
+    cost[loads[:, None] > capacity + LOAD_TOLERANCE_TONS] = np.inf
+    vehicle = cost.argmin(axis=1)
+    return vehicle, cost[np.arange(len(loads)), vehicle]
+
+def _best_fit_decreasing(items, weights, capacity):
+    """Pack items (sorted heaviest first) into bins of one capacity, then empty the lightest bins."""
+    bins, loads, open_slack = [], [], []  # open_slack: sorted (slack, bin) pairs
+    for item in items:
+        w = weights[item]
+        i = bisect.bisect_left(open_slack, (w - LOAD_TOLERANCE_TONS, -1))
+        if i < len(open_slack):
+            slack, b = open_slack.pop(i)
+        else:
+            slack, b = capacity, len(bins)
+            bins.append([])
+            loads.append(0.0)
+        bins[b].append(item)
+        loads[b] += w
+        if slack - w > LOAD_TOLERANCE_TONS:
+            bisect.insort(open_slack, (slack - w, b))
+    # Local search: move every item of the lightest bin into the others' slack, until one does not fit
+    alive = sorted(range(len(bins)), key=loads.__getitem__)
+    while len(alive) > 1:
+        lightest = alive[0]
+        slack = sorted((capacity - loads[b], b) for b in alive[1:])
+        moves = []
+        for item in bins[lightest]:
+            w = weights[item]
+            i = bisect.bisect_left(slack, (w - LOAD_TOLERANCE_TONS, -1))
+            if i == len(slack):
+                break
+            free, b = slack.pop(i)
+            moves.append((item, b))
+            bisect.insort(slack, (free - w, b))
+        else:
+            for item, b in moves:
+                bins[b].append(item)
+                loads[b] += weights[item]
+            alive = sorted(alive[1:], key=loads.__getitem__)
+            continue
+        break
+    return [bins[b] for b in alive], [loads[b] for b in alive]
+
+def _pack_lowest_co2(groups, weights, distance, fleet):
+    """
+    Pack each dispatch group (item indexes, heaviest first) best-fit-decreasing once per vehicle capacity and keep,
+    per group, the packing with the lowest CO2. A trip that would emit more than its items travelling alone is split
+    back into solo trips, so no group is planned above its solo baseline. Returns (trip items, loads, group position).
+    """
+    weights = np.asarray(weights, dtype=float)
+    weight_list = weights.tolist()  # the packer indexes single items, which is faster on a list
+    solo_co2 = np.round(_trip_co2_per_km(weights, fleet)[1] * distance, 2)
+    best_co2 = np.full(len(groups), np.inf)
+    best_trips = [None] * len(groups)
+    for capacity in sorted(set(fleet['capacity_tons']), reverse=True):
+        trips, owner = [], []
+        for g, items in enumerate(groups):
+            fits = [item for item in items if weight_list[item] <= capacity + LOAD_TOLERANCE_TONS]
+            packed = _best_fit_decreasing(fits, weight_list, capacity)[0] if fits else []
+            if len(fits) < len(items):
+                packed += [[item] for item in items if weight_list[item] > capacity + LOAD_TOLERANCE_TONS]
+            trips.extend(packed)
+            owner.extend([g] * len(packed))
+        flat = np.fromiter(itertools.chain.from_iterable(trips), dtype=np.int64)
+        starts = np.cumsum([0] + [len(items) for items in trips[:-1]])
+        co2 = np.round(_trip_co2_per_km(np.add.reduceat(weights[flat], starts), fleet)[1] * distance[flat[starts]], 2)
+        alone = np.add.reduceat(solo_co2[flat], starts)
+        owner = np.asarray(owner)
+        totals = np.bincount(owner, np.minimum(co2, alone), minlength=len(groups))
+        bounds = np.searchsorted(owner, np.arange(len(groups) + 1))
+        for g in np.flatnonzero(totals < best_co2).tolist():
+            best_co2[g] = totals[g]
+            best_trips[g] = [items if co2[t] <= alone[t] else [[item] for item in items]
+                             for t, items in zip(range(bounds[g], bounds[g + 1]), trips[bounds[g]:bounds[g + 1]])]
+    trip_items, trip_group = [], []
+    for g, trips in enumerate(best_trips):
+        for items in trips:
+            split = isinstance(items[0], list)
+            trip_items.extend(items if split else [items])
+            trip_group.extend([g] * (len(items) if split else 1))
+    return trip_items, [sum(weight_list[item] for item in items) for items in trip_items], trip_group
+
+def plan_consolidation(consignments, fleet=None):
+    """Consolidate consignments into trips with a heterogeneous fleet.
+    
+    consignments needs source, destination, weight_tons and distance_km, plus optional
+    earliest/latest dispatch times. Consignments on the same lane whose windows share a
+    common dispatch time travel together; each dispatch is packed best-fit-decreasing once
+    per vehicle capacity (lightest trips emptied where possible) and the packing with the
+    lowest CO2 is kept, never merging consignments that would emit less travelling alone.
+    Every trip is then assigned the lowest-CO2 vehicle that fits its load. Returns (trips, summary).
+    """
+    fleet = _fleet_table(DEFAULT_FLEET if fleet is None else fleet)
+    required = ['source', 'destination', 'weight_tons', 'distance_km']
+    missing = [c for c in required if c not in consignments.columns]
+    if missing:
+        raise ValueError(f"Consignments are missing column(s): {', '.join(missing)}.")
+    weight = pd.to_numeric(consignments['weight_tons'], errors='coerce').to_numpy(dtype=float)
+    distance = pd.to_numeric(consignments['distance_km'], errors='coerce').to_numpy(dtype=float)
+    if not ((weight > 0) & (distance > 0)).all():
+        raise ValueError("Consignment weights and distances must be positive.")
+    n = len(consignments)
+    timed = 'earliest' in consignments.columns and 'latest' in consignments.columns
+    if timed:
+        as_datetime = not pd.api.types.is_numeric_dtype(consignments['earliest'])
+        convert = (lambda c: pd.to_datetime(c).to_numpy('datetime64[ns]').astype(np.int64)) if as_datetime else (lambda c: c.to_numpy(dtype=float))
+        earliest, latest = convert(consignments['earliest']), convert(consignments['latest'])
+        if (earliest > latest).any():
+            raise ValueError("Consignment windows must not end before they start.")
+    else:
+        earliest = latest = np.zeros(n)
+    lane = consignments.groupby(['source', 'destination'], sort=False, observed=True).ngroup().to_numpy()
+    
+    # Consignments heavier than the largest vehicle ship as full loads plus a remainder
+    max_capacity = fleet['capacity_tons'].iloc[-1]
+    full_loads = np.floor(weight / max_capacity + LOAD_TOLERANCE_TONS).astype(np.int64)
+    remainder = weight - full_loads * max_capacity
+    remainder[remainder < LOAD_TOLERANCE_TONS] = 0.0
+    full_co2_per_km = _trip_co2_per_km([max_capacity], fleet)[1][0]
+    
+    # Dispatch groups: per lane, sweep by deadline and join while the window is still open
+    order = np.lexsort((latest, lane))
+    group = np.empty(n, dtype=np.int64)
+    g, prev_lane, cutoff = -1, None, None
+    for i, l, start, end in zip(order.tolist(), lane[order].tolist(), earliest[order].tolist(), latest[order].tolist()):
+        if l != prev_lane or start > cutoff:
+            g, prev_lane, cutoff = g + 1, l, end
+        group[i] = g
+    
+    packed = np.flatnonzero(remainder > 0)
+    by_group = packed[np.lexsort((-remainder[packed], group[packed]))]
+    bounds = np.flatnonzero(np.diff(group[by_group])) + 1
+    groups = [items.tolist() for items in np.split(by_group, bounds)] if len(by_group) else []
+    trip_items, trip_loads, trip_group = _pack_lowest_co2(groups, remainder, distance, fleet) if groups else ([], [], [])
+    trip_group = [group[groups[g][0]] for g in trip_group]
+    
+    vehicle, co2_per_km = _trip_co2_per_km(trip_loads, fleet)
+    first_item = np.array([items[0] for items in trip_items], dtype=np.int64)
+    index = consignments.index.to_numpy()
+    departure = pd.Series(earliest).groupby(group).max()
+    trips = pd.DataFrame({
+        'source': consignments['source'].to_numpy()[first_item],
+        'destination': consignments['destination'].to_numpy()[first_item],
+        'departure': departure.reindex(trip_group).to_numpy(),
+        'vehicle': fleet['vehicle'].to_numpy()[vehicle],
+        'mode': fleet['mode'].to_numpy()[vehicle],
+        'capacity_tons': fleet['capacity_tons'].to_numpy()[vehicle],
+        'load_tons': np.round(trip_loads, 3),
+        'consignments': [index[items].tolist() for items in trip_items],
+        'distance_km': distance[first_item],
+        'co2_kg': np.round(co2_per_km * distance[first_item], 2)
+    })
+    heavy = np.flatnonzero(full_loads)
+    if len(heavy):
+        full = pd.DataFrame({
+            'source': consignments['source'].to_numpy()[heavy],
+            'destination': consignments['destination'].to_numpy()[heavy],
+            'departure': departure.reindex(group[heavy]).to_numpy(),
+            'vehicle': fleet['vehicle'].iloc[-1],
+            'mode': fleet['mode'].iloc[-1],
+            'capacity_tons': max_capacity,
+            'load_tons': max_capacity,
+            'consignments': [[i] for i in index[heavy].tolist()],
+            'distance_km': distance[heavy],
+            'co2_kg': np.round(full_co2_per_km * distance[heavy], 2)
+        }).loc[lambda df: df.index.repeat(full_loads[heavy])]
+        trips = pd.concat([full, trips], ignore_index=True)
+    if timed and as_datetime:
+        trips['departure'] = pd.to_datetime(trips['departure'])
+    elif not timed:
+        trips = trips.drop(columns='departure')
+    trips['utilisation'] = (trips['load_tons'] / trips['capacity_tons']).round(4)
+    
+    # Baseline: every consignment dispatched on its own in the lowest-CO2 vehicle that fits, rounded per trip like the plan
+    baseline_trips = int(full_loads.sum() + (remainder > 0).sum())
+    baseline_co2 = np.round(full_co2_per_km * distance, 2) * full_loads
+    has_remainder = remainder > 0
+    baseline_co2[has_remainder] += np.round(distance[has_remainder] * _trip_co2_per_km(remainder[has_remainder], fleet)[1], 2)
+    planned_co2 = float(trips['co2_kg'].sum())
+    summary = {
+        'consignments': n,
+        'trips': len(trips),
+        'baseline_trips': baseline_trips,
+        'trips_saved': baseline_trips - len(trips),
+        'utilisation': float(trips['load_tons'].sum() / trips['capacity_tons'].sum()) if len(trips) else 0.0,
+        'co2_kg': round(planned_co2, 2),
+        'baseline_co2_kg': round(float(baseline_co2.sum()), 2),
+        'co2_saved_kg': round(float(baseline_co2.sum()) - planned_co2, 2)
+    }
+    return trips, summary
+
+def recorded_consignments(window_hours=LOAD_WINDOW_HOURS):
+    """Recorded shipments as consignments, each dispatchable within window_hours of its timestamp."""
+    emissions = get_emissions(columns=['source', 'destination', 'weight_tons', 'distance_km', 'timestamp'])
+    consignments = emissions.rename(columns={'timestamp': 'earliest'})
+    consignments['weight_tons'] = exact_values(consignments['weight_tons'])
+    consignments['distance_km'] = exact_values(consignments['distance_km'])
+    consignments['latest'] = consignments['earliest'] + pd.Timedelta(hours=window_hours)
+    return consignments
 
 # Optimized map rendering with clustering
+@instrumented
 def render_map(emissions):
     """Render a Folium map with clustered markers and limited routes for performance."""
-    valid_coords = []
-    for _, row in emissions.iterrows():
-        src_coords = get_coordinates(row['source_country'], row['source_city'])
-        dst_coords = get_coordinates(row['dest_country'], row['dest_city'])
-        if src_coords != (0, 0):
-            valid_coords.append(src_coords)
-        if dst_coords != (0, 0):
-            valid_coords.append(dst_coords)
+    source_coords_all = get_coordinates_many(zip(emissions['source_country'], emissions['source_city']))
+    dest_coords_all = get_coordinates_many(zip(emissions['dest_country'], emissions['dest_city']))
+    all_coords = np.concatenate([source_coords_all, dest_coords_all])
+    valid_coords = all_coords[(all_coords != 0).any(axis=1)]
     
-    if valid_coords:
-        avg_lat = sum(coord[0] for coord in valid_coords) / len(valid_coords)
-        avg_lon = sum(coord[1] for coord in valid_coords) / len(valid_coords)
+    if len(valid_coords):
+        avg_lat, avg_lon = valid_coords.mean(axis=0)
     else:
         avg_lat, avg_lon = 48.8566, 2.3522
     
+    from folium.plugins import MarkerCluster
     m = folium.Map(location=[avg_lat, avg_lon], zoom_start=2, tiles='OpenStreetMap')
     marker_cluster = MarkerCluster().add_to(m)
     
     # Limit to top 100 routes by CO2
-    emissions = emissions.nlargest(100, 'co2_kg')
-    for _, row in emissions.iterrows():
-        source_coords = get_coordinates(row['source_country'], row['source_city'])
-        dest_coords = get_coordinates(row['dest_country'], row['dest_city'])
+    top_routes = np.argsort(-emissions['co2_kg'].to_numpy(), kind='stable')[:100]
+    for position in top_routes:
+        row = emissions.iloc[position]
+        source_coords = tuple(source_coords_all[position].tolist())
+        dest_coords = tuple(dest_coords_all[position].tolist())
         if source_coords != (0, 0) and dest_coords != (0, 0):
             color = 'red' if row['co2_kg'] > 1000 else 'orange' if row['co2_kg'] > 500 else 'green'
             folium.PolyLine(
@@ -466,6 +2802,79 @@ def render_map(emissions):
     m.get_root().html.add_child(folium.Element(legend_html))
     return m
 
+# Aggregated lane map: one GeoJSON feature per origin/destination pair
+LANE_MAP_MAX_WEIGHT = 10
+
+@instrumented
+def render_lane_map(lanes):
+    """Render each lane once as a GeoJSON line, width scaled by total CO2 and colour by CO2 per shipment."""
+    lanes = split_locations(lanes)
+    source_coords = get_coordinates_many(zip(lanes['source_country'], lanes['source_city']))
+    dest_coords = get_coordinates_many(zip(lanes['dest_country'], lanes['dest_city']))
+    drawable = (source_coords != 0).any(axis=1) & (dest_coords != 0).any(axis=1)
+    
+    if drawable.any():
+        shipments = lanes['shipments'].to_numpy()[drawable]
+        endpoints = np.concatenate([source_coords[drawable], dest_coords[drawable]])
+        avg_lat, avg_lon = np.average(endpoints, axis=0, weights=np.concatenate([shipments, shipments]))
+    else:
+        avg_lat, avg_lon = 48.8566, 2.3522
+    
+    m = folium.Map(location=[avg_lat, avg_lon], zoom_start=2, tiles='OpenStreetMap')
+    
+    co2 = lanes['co2_kg'].to_numpy(dtype=float)
+    max_co2 = co2[drawable].max() if drawable.any() else 0
+    per_shipment = co2 / lanes['shipments'].to_numpy()
+    features = []
+    for position in np.flatnonzero(drawable):
+        color = 'red' if per_shipment[position] > 1000 else 'orange' if per_shipment[position] > 500 else 'green'
+        features.append({
+            'type': 'Feature',
+            'geometry': {
+                'type': 'LineString',
+                'coordinates': [source_coords[position, ::-1].tolist(), dest_coords[position, ::-1].tolist()]
+            },
+            'properties': {
+                'lane': f"{lanes['source'].iat[position]} to {lanes['destination'].iat[position]}",
+                'shipments': int(lanes['shipments'].iat[position]),
+                'co2_kg': round(float(co2[position]), 2),
+                'color': color,
+                'weight': 1 + (LANE_MAP_MAX_WEIGHT - 1) * math.sqrt(co2[position] / max_co2) if max_co2 > 0 else 1
+            }
+        })
+    if features:
+        folium.GeoJson(
+            {'type': 'FeatureCollection', 'features': features},
+            name='Lanes',
+            style_function=lambda feature: {
+                'color': feature['properties']['color'],
+                'weight': feature['properties']['weight'],
+                'opacity': 0.7
+            },
+            tooltip=folium.GeoJsonTooltip(fields=['lane', 'shipments', 'co2_kg'], aliases=['Lane', 'Shipments', 'Total CO2 (kg)'])
+        ).add_to(m)
+    
+    legend_html = '''
+    <div style="position: fixed; bottom: 50px; left: 50px; z-index: 1000; padding: 10px; background-color: white; border: 2px solid black; border-radius: 5px;">
+        <p><strong>CO2 per Shipment</strong></p>
+        <p><span style="color: green;">■</span> Low (<500 kg)</p>
+        <p><span style="color: orange;">■</span> Medium (500-1000 kg)</p>
+        <p><span style="color: red;">■</span> High (>1000 kg)</p>
+        <p>Line width: total lane CO2</p>
+    </div>
+    '''
+    m.get_root().html.add_child(folium.Element(legend_html))
+    return m
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def _lane_map_html(db_path, data_version):
+    """Rendered lane map HTML; the data version stamp invalidates it when emissions or coordinates change."""
+    return render_lane_map(get_lane_totals()).get_root().render()
+
+def lane_map_html():
+    """Return the aggregated lane map HTML, re-rendered only after a relevant write."""
+    return _lane_map_html(DB_PATH, get_data_version('emissions', 'coordinates'))
+
 # Reset input functions
 def reset_calculate_emissions_inputs():
     """Reset inputs for Calculate Emissions page."""
@@ -537,8 +2946,10 @@ def main():
         </style>
     """, unsafe_allow_html=True)
     
-    init_db()
-    cleanup_old_records()
+    try:
+        ensure_database()
+    except sqlite3.Error as e:
+        handle_error(f"Database initialization failed: {e}")
 
     # Initialize session state
     if 'page' not in st.session_state:
@@ -587,7 +2998,8 @@ def main():
                 "Sustainable Packaging",
                 "Carbon Offsetting",
                 "Efficient Load Management",
-                "Energy Conservation"
+                "Energy Conservation",
+                "Diagnostics"
             ],
             index=[
                 "Calculate Emissions",
@@ -599,10 +3011,18 @@ def main():
                 "Sustainable Packaging",
                 "Carbon Offsetting",
                 "Efficient Load Management",
-                "Energy Conservation"
+                "Energy Conservation",
+                "Diagnostics"
             ].index(st.session_state.page),
         )
         st.session_state.page = page
+        
+        use_snapshot = False
+        if snapshot_available():
+            use_snapshot = st.checkbox(
+                "Read from Parquet snapshot",
+                help="Load emission and packaging history from the last exported snapshot (read-only) instead of the live database."
+            )
 
     # Main content logo
     st.markdown(
@@ -683,7 +3103,7 @@ def main():
             if st.button("Calculate Emissions") and distance_km > 0:
                 try:
                     co2_kg = calculate_co2(source_country, source_city, dest_country, dest_city, transport_mode, distance_km, weight_tons)
-                    carbon_cost_eur = co2_kg / 1000 * CARBON_PRICE_EUR_PER_TON
+                    carbon_cost_eur = co2_kg / 1000 * get_carbon_price()
                     source = f"{source_city}, {source_country}"
                     destination = f"{dest_city}, {dest_country}"
                     trees_equivalent = co2_kg * 0.04
@@ -699,9 +3119,9 @@ def main():
                     with col6:
                         st.metric("Trees to Offset", f"{int(trees_equivalent)}")
                     
-                    save_emission(source, destination, transport_mode, distance_km, co2_kg, weight_tons)
+                    save_emission(source_country, source_city, dest_country, dest_city, transport_mode, distance_km, co2_kg, weight_tons)
                     
-                    m = folium.Map(location=[get_coordinates(source_country, source_city)], zoom_start=4)
+                    m = folium.Map(location=get_coordinates(source_country, source_city), zoom_start=4)
                     folium.PolyLine(
                         locations=[get_coordinates(source_country, source_city), get_coordinates(dest_country, dest_city)],
                         color='blue',
@@ -715,20 +3135,66 @@ def main():
             if st.button("Reset Inputs"):  # NEW: Reset button
                 reset_calculate_emissions_inputs()
                 st.experimental_rerun()
+        
+        with st.expander("Bulk Import Shipments"):
+            uploaded = st.file_uploader(
+                "Shipment file (CSV or Parquet)",
+                type=['csv', 'parquet'],
+                help="Columns: " + ", ".join(INGEST_COLUMNS) + " and an optional timestamp."
+            )
+            uploaded_coordinates = st.file_uploader(
+                "Coordinates file (optional CSV)",
+                type=['csv'],
+                help="Columns: " + ", ".join(COORDINATE_COLUMNS) + ". Locations listed here are not geocoded, "
+                     "e.g. the coordinates.csv written by generate_data.py --csv."
+            )
+            if uploaded is not None and st.button("Import Shipments"):
+                try:
+                    with st.spinner("Importing shipments..."):
+                        if uploaded_coordinates is not None:
+                            import_coordinates(uploaded_coordinates)
+                        report = ingest_shipments(uploaded)
+                    col_imp1, col_imp2, col_imp3 = st.columns(3)
+                    with col_imp1:
+                        st.metric("Rows Imported", f"{report['inserted']:,}")
+                    with col_imp2:
+                        st.metric("Rows Rejected", f"{len(report['rejected']):,}")
+                    with col_imp3:
+                        st.metric("Throughput", f"{report['rows_per_second']:,.0f} rows/s")
+                    if not report['rejected'].empty:
+                        st.warning("Some rows were rejected. See the error column for details.")
+                        st.dataframe(report['rejected'].head(1000))
+                        st.download_button(
+                            label="Download Rejected Rows as CSV",
+                            data=report['rejected'].to_csv(index=False),
+                            file_name="rejected_shipments.csv",
+                            mime="text/csv"
+                        )
+                except (ValueError, sqlite3.Error) as e:
+                    handle_error(f"Bulk import failed: {e}", f"Cannot import shipments: {str(e)}.")
     
     elif page == "Route Visualizer":
         st.header("Emission Hotspot Visualizer")
         try:
-            emissions = get_emissions()
+            emissions = get_emissions(snapshot=use_snapshot, columns=ROUTE_COLUMNS)
             
             if not emissions.empty:
-                emissions['source_country'] = emissions['source'].apply(lambda x: x.split(', ')[1])
-                emissions['source_city'] = emissions['source'].apply(lambda x: x.split(', ')[0])
-                emissions['dest_country'] = emissions['destination'].apply(lambda x: x.split(', ')[1])
-                emissions['dest_city'] = emissions['destination'].apply(lambda x: x.split(', ')[0])
+                emissions = split_locations(emissions)
                 
+                map_mode = st.radio(
+                    "Map View",
+                    ["Aggregated Lanes", "Top 100 Routes"],
+                    horizontal=True,
+                    help="Aggregated Lanes draws each origin/destination pair once, weighted by total CO2."
+                )
                 with st.spinner("Loading map..."):
-                    folium_static(render_map(emissions), width=1200, height=600)
+                    if map_mode == "Aggregated Lanes":
+                        components.html(lane_map_html(), width=1200, height=610)
+                    else:
+                        folium_static(render_map(emissions), width=1200, height=600)
+                pending_locations = geocoding_queue().pending_count()
+                if pending_locations:
+                    st.info(f"Looking up coordinates for {pending_locations} new locations. Their routes will appear on the map once resolved.")
                 
                 st.subheader("Route Analytics Dashboard")
                 routes = [f"Route {idx + 1}: {row['source']} to {row['destination']}" for idx, row in emissions.iterrows()]
@@ -745,9 +3211,9 @@ def main():
                 source_city = row['source_city']
                 dest_country = row['dest_country']
                 dest_city = row['dest_city']
-                distance_km = row['distance_km']
-                weight_tons = row['weight_tons']
-                current_co2 = row['co2_kg']
+                distance_km = round(float(row['distance_km']), FLOAT_DECIMALS)
+                weight_tons = round(float(row['weight_tons']), FLOAT_DECIMALS)
+                current_co2 = round(float(row['co2_kg']), FLOAT_DECIMALS)
                 current_mode = row['transport_mode']
                 
                 try:
@@ -907,45 +3373,47 @@ def main():
     elif page == "Reports":
         st.header("Emission Reports")
         try:
-            emissions = get_emissions()
+            mode_summary = get_emission_totals('mode')
             
-            if not emissions.empty:
-                total_co2 = emissions['co2_kg'].sum()
-                avg_co2 = emissions['co2_kg'].mean()
-                total_shipments = len(emissions)
+            if not mode_summary.empty:
+                total_co2 = mode_summary['co2_kg'].sum()
+                total_shipments = int(mode_summary['shipments'].sum())
+                avg_co2 = total_co2 / total_shipments
                 
-                total_savings = 0
-                route_data = []
-                for _, row in emissions.iterrows():
-                    source_country = row['source'].split(', ')[1]
-                    source_city = row['source'].split(', ')[0]
-                    dest_country = row['destination'].split(', ')[1]
-                    dest_city = row['destination'].split(', ')[0]
-                    distance_km = row['distance_km']
-                    weight_tons = row['weight_tons']
-                    current_co2 = row['co2_kg']
-                    current_mode = row['transport_mode']
-                    
-                    try:
-                        best_option, min_co2, breakdown, distances, _ = optimize_route(source_country, source_city, dest_country, dest_city, distance_km, weight_tons, prioritize_green=True)
-                        mode1, ratio1, mode2, ratio2 = best_option
-                        co2_1, co2_2 = breakdown
-                        dist1, dist2 = distances
-                        savings = current_co2 - min_co2
-                        total_savings += savings
-                        
-                        route_data.append({
-                            'Route': f"{source_city}, {source_country} to {dest_city}, {dest_country}",
-                            'Old Mode': current_mode,
-                            'Old Distance': distance_km,
-                            'Old CO2': current_co2,
-                            'New Modes': f"{mode1} + {mode2 if mode2 else 'None'}",
-                            'New Distances': f"{dist1:.2f} km ({mode1}) + {dist2:.2f} km ({mode2 if mode2 else 'N/A'})",
-                            'New CO2': min_co2,
-                            'Savings': savings
-                        })
-                    except ValueError as e:
-                        st.warning(f"Skipping route optimization for {source_city} to {dest_city}: {e}")
+                # Route figures come from the lane rollup, so their cost follows the number of lanes, not of shipments.
+                # A lane's shipments are optimized together: its ton-km over its tons is the lane distance.
+                lanes = get_lane_totals()
+                routes = lanes.assign(distance_km=lanes['ton_km'] / lanes['weight_tons'].where(lanes['weight_tons'] > 0))
+                optimized = optimize_routes_bulk(routes, prioritize_green=True)
+                skipped = optimized['error'].notna()
+                if skipped.any():
+                    st.warning(f"Skipping route optimization for {int(skipped.sum())} lanes: {', '.join(optimized.loc[skipped, 'error'].unique())}")
+                routes, optimized = routes[~skipped], optimized[~skipped]
+                savings = routes['co2_kg'].to_numpy() - optimized['optimized_co2']
+                total_savings = savings.sum()
+                mode2_label = optimized['mode2'].fillna('None')
+                pareto = pareto_routes_bulk(routes, prioritize_green=True)
+                share = lambda mode, ratio: mode + ' (' + (ratio * 100).round().astype('Int64').astype(str) + '%)'
+                balanced_label = share(pareto['balanced_mode1'], pareto['balanced_ratio1']).where(
+                    pareto['balanced_mode2'].isna(),
+                    share(pareto['balanced_mode1'], pareto['balanced_ratio1']) + ' + ' + share(pareto['balanced_mode2'], pareto['balanced_ratio2']))
+                route_data = pd.DataFrame({
+                    'Route': routes['source'].astype(str) + ' to ' + routes['destination'].astype(str),
+                    'Shipments': routes['shipments'],
+                    'Distance': routes['distance_km'].round(2),
+                    'Tons Shipped': routes['weight_tons'].round(2),
+                    'Old CO2': routes['co2_kg'].round(2),
+                    'New Modes': optimized['mode1'] + ' + ' + mode2_label,
+                    'New Distances': (optimized['dist1'].map('{:.2f}'.format) + ' km (' + optimized['mode1'] + ') + '
+                                      + optimized['dist2'].map('{:.2f}'.format) + ' km (' + optimized['mode2'].fillna('N/A') + ')'),
+                    'New CO2': optimized['optimized_co2'],
+                    'Savings': savings,
+                    'Pareto Options': pareto['pareto_options'],
+                    'Balanced Option': balanced_label,
+                    'Balanced CO2': pareto['balanced_co2'],
+                    'Balanced Cost (EUR)': pareto['balanced_cost_eur'],
+                    'Balanced Transit (h)': pareto['balanced_hours']
+                }).sort_values('Savings', ascending=False)
                 
                 tab1, tab2, tab3, tab4 = st.tabs(["Summary", "CO2 Insights", "Route Optimization", "Detailed Data"])
                 
@@ -962,9 +3430,16 @@ def main():
                         st.metric("Total CO2 Savings", f"{total_savings:.2f} kg")
                     
                     st.subheader("Emission Breakdown by Transport Mode")
-                    mode_summary = emissions.groupby('transport_mode')['co2_kg'].sum().reset_index()
                     fig = px.pie(mode_summary, values='co2_kg', names='transport_mode', title="CO2 by Mode")
                     st.plotly_chart(fig, use_container_width=True, key=f"emission_breakdown_{time.time()}")
+                    
+                    st.subheader("Emissions Over Time")
+                    granularity = st.radio("Granularity", ["Month", "Day"], horizontal=True, key="emission_trend_granularity")
+                    period = granularity.lower()
+                    trend = get_emission_totals(period).sort_values(period)
+                    fig = px.bar(trend, x=period, y='co2_kg', hover_data=['shipments'], title=f"CO2 by {granularity}",
+                                 labels={period: granularity, 'co2_kg': 'CO2 (kg)', 'shipments': 'Shipments'})
+                    st.plotly_chart(fig, use_container_width=True, key=f"emission_trend_{time.time()}")
                 
                 with tab2:
                     st.subheader("CO2 Impact Insights")
@@ -977,24 +3452,73 @@ def main():
                     st.write(f"- Be offset by planting {int(trees_needed):,} trees.")
                     
                     st.subheader("Cost Savings Analysis")
-                    for currency, rate in EXCHANGE_RATES.items():
-                        cost_savings = total_savings / 1000 * CARBON_PRICE_EUR_PER_TON * rate
+                    for currency in EXCHANGE_RATES:
+                        cost_savings = total_savings / 1000 * get_carbon_price() * exchange_rate(currency)
                         st.write(f"- **{currency}**: {cost_savings:.2f}")
+                    
+                    st.subheader("Carbon Cost at Historical Prices")
+                    currency = st.selectbox("Currency", list(EXCHANGE_RATES), key="carbon_cost_currency")
+                    daily = get_emission_totals('day')
+                    costs = shipment_costs(daily.assign(timestamp=pd.to_datetime(daily['day'], errors='coerce')), currency)
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        st.metric(f"Carbon Cost When Shipped ({currency})", f"{costs.sum():,.2f}")
+                    with col2:
+                        st.metric(f"At Today's Price ({currency})", f"{total_co2 / 1000 * get_carbon_price() * exchange_rate(currency):,.2f}")
+                    monthly = pd.DataFrame({'month': daily['day'].str[:7], 'cost': costs})
+                    monthly = monthly.groupby('month', as_index=False)['cost'].sum()
+                    fig = px.bar(monthly, x='month', y='cost', title=f"Carbon Cost by Month ({currency})",
+                                 labels={'month': 'Month', 'cost': f'Carbon Cost ({currency})'})
+                    st.plotly_chart(fig, use_container_width=True, key=f"carbon_cost_trend_{time.time()}")
+                    history = get_price_history(CARBON_PRICE_SYMBOL)
+                    if not history.empty:
+                        fig = px.line(history, x='observed_at', y='price', title="Carbon Price History",
+                                      labels={'observed_at': 'Observed (UTC)', 'price': 'EUR per ton CO2'})
+                        st.plotly_chart(fig, use_container_width=True, key=f"carbon_price_history_{time.time()}")
+                    as_of = market_data().as_of()
+                    st.caption(f"Carbon price {get_carbon_price():.2f} EUR/t"
+                               + (f", quoted {as_of:%Y-%m-%d %H:%M} UTC." if as_of else " (default, awaiting first quote).")
+                               + " Historical costs price each day's emissions at the quote in force at the start of that day.")
                 
                 with tab3:
                     st.subheader("Route Optimization Summary")
-                    st.dataframe(pd.DataFrame(route_data))
+                    st.dataframe(route_data)
                 
                 with tab4:
                     st.subheader("Detailed Emission Data")
-                    st.dataframe(emissions)
-                    csv = emissions.to_csv(index=False)
-                    st.download_button(
-                        label="Download Emission Data as CSV",
-                        data=csv,
-                        file_name="emissions_data.csv",
-                        mime="text/csv"
-                    )
+                    # Stack of page keys: the last entry is the key the current page starts after
+                    page_keys = st.session_state.setdefault('emission_page_keys', [None])
+                    page_df, next_key = get_emissions_page(page_keys[-1])
+                    st.dataframe(page_df, use_container_width=True)
+                    col_prev, col_page, col_next = st.columns([1, 2, 1])
+                    with col_prev:
+                        st.button("Previous", disabled=len(page_keys) == 1, key="emission_page_prev",
+                                  on_click=lambda: page_keys.pop())
+                    with col_page:
+                        st.caption(f"Page {len(page_keys)} of {max(1, math.ceil(total_shipments / EMISSIONS_PAGE_SIZE))} "
+                                   f"({EMISSIONS_PAGE_SIZE} rows per page, newest first)")
+                    with col_next:
+                        st.button("Next", disabled=next_key is None, key="emission_page_next",
+                                  on_click=lambda: page_keys.append(next_key))
+                    
+                    if st.button("Prepare CSV Export"):
+                        with st.spinner("Exporting emission data..."):
+                            st.download_button(
+                                label="Download Emission Data as CSV (gzip)",
+                                data=export_emissions_csv_gz(),
+                                file_name="emissions_data.csv.gz",
+                                mime="application/gzip"
+                            )
+                    
+                    if st.button("Update Parquet Snapshot", help="Write month-partitioned Parquet files of all tables; unchanged months are skipped."):
+                        try:
+                            with st.spinner("Writing snapshot..."):
+                                summary = export_snapshots()
+                            written = sum(counts['written'] for counts in summary.values())
+                            unchanged = sum(counts['unchanged'] for counts in summary.values())
+                            st.success(f"Snapshot updated in {_snapshot_dir()}: {written} partitions written, {unchanged} unchanged.")
+                        except (ValueError, OSError, sqlite3.Error) as e:
+                            handle_error(f"Snapshot export failed: {e}", f"Cannot export snapshot: {str(e)}.")
             else:
                 st.info("No emission data available. Calculate some emissions first!")
         except Exception as e:
@@ -1073,10 +3597,10 @@ def main():
                 dist1, dist2 = distances
                 savings = current_co2 - min_co2
                 savings_pct = (savings / current_co2 * 100) if current_co2 != 0 else 0
-                cost_savings_eur = savings / 1000 * CARBON_PRICE_EUR_PER_TON
+                cost_savings_eur = savings / 1000 * get_carbon_price()
                 trees_equivalent = savings * 0.04
                 
-                m = folium.Map(location=[get_coordinates(source_country, source_city)], zoom_start=4)
+                m = folium.Map(location=get_coordinates(source_country, source_city), zoom_start=4)
                 folium.PolyLine(
                     locations=[get_coordinates(source_country, source_city), get_coordinates(dest_country, dest_city)],
                     color='blue',
@@ -1096,7 +3620,7 @@ def main():
                 with col4:
                     st.metric("Trees Equivalent", f"{int(trees_equivalent)}")
                 
-                tab1, tab2, tab3 = st.tabs(["Route Breakdown", "CO2 Comparison", "Mode Contribution"])
+                tab1, tab2, tab3, tab4, tab5 = st.tabs(["Route Breakdown", "CO2 Comparison", "Mode Contribution", "Hub Network Path", "CO2 / Cost / Time"])
                 
                 with tab1:
                     st.write("**Optimized Route Breakdown**")
@@ -1123,6 +3647,46 @@ def main():
                         gauge={'axis': {'range': [0, 100]}, 'bar': {'color': "#36A2EB"}}
                     ))
                     st.plotly_chart(fig, use_container_width=True, key=f"efficiency_gauge_{time.time()}")
+                
+                with tab4:
+                    try:
+                        network = optimize_route_graph(source_country, source_city, dest_country, dest_city, weight_tons, prioritize_green)
+                        st.write(f"**Lowest-CO2 path through ports, rail terminals and airports**: {network['co2_kg']:.2f} kg CO2 "
+                                 f"over {network['distance_km']:.2f} km network distance in {len(network['legs'])} leg(s).")
+                        st.caption("Legs follow real hub connections and network detours, so totals can differ from the straight-line two-leg split above.")
+                        st.dataframe(pd.DataFrame(network['legs']).rename(columns={
+                            'from': 'From', 'to': 'To', 'mode': 'Mode', 'distance_km': 'Distance (km)', 'co2_kg': 'CO2 (kg)'}))
+                        path = network['path']
+                        m = folium.Map(location=path[0], zoom_start=2)
+                        folium.PolyLine(locations=path, color='green', weight=4,
+                                        popup=f"Hub network path: {network['co2_kg']:.2f} kg CO2").add_to(m)
+                        for leg, point in zip(network['legs'], path):
+                            folium.Marker(location=point, popup=f"{leg['from']}: {leg['mode']}").add_to(m)
+                        folium_static(m, width=1200, height=400)
+                    except ValueError as e:
+                        st.info(f"No hub network path available: {str(e)}")
+                
+                with tab5:
+                    frontier = pareto_routes(source_country, dest_country, distance_km, weight_tons, prioritize_green)
+                    frontier['option'] = frontier['mode1'] + ' ' + (frontier['ratio1'] * 100).round().astype(int).astype(str) + '%' + \
+                        np.where(frontier['mode2'].isna(), '', ' + ' + frontier['mode2'].fillna('') + ' ' + (frontier['ratio2'] * 100).round().astype(int).astype(str) + '%')
+                    balanced = frontier[frontier['balanced']].iloc[0]
+                    st.write(f"**{len(frontier)} Pareto-optimal splits** (none is better on CO2, cost and transit time at once). "
+                             f"Balanced choice: **{balanced['option']}** at {balanced['co2_kg']:.2f} kg CO2, "
+                             f"{balanced['cost_eur']:.2f} EUR and {balanced['transit_hours']:.1f} h.")
+                    fig = px.scatter(
+                        frontier,
+                        x='cost_eur',
+                        y='co2_kg',
+                        color='transit_hours',
+                        symbol='balanced',
+                        hover_data=['option'],
+                        title="Pareto Frontier: CO2 vs Cost (colour: transit time)",
+                        labels={'cost_eur': 'Cost incl. carbon (EUR)', 'co2_kg': 'CO2 Emissions (kg)', 'transit_hours': 'Transit (h)'}
+                    )
+                    st.plotly_chart(fig, use_container_width=True, key=f"pareto_frontier_{time.time()}")
+                    st.dataframe(frontier[['option', 'co2_kg', 'cost_eur', 'transit_hours']].rename(columns={
+                        'option': 'Option', 'co2_kg': 'CO2 (kg)', 'cost_eur': 'Cost (EUR)', 'transit_hours': 'Transit (h)'}))
             except ValueError as e:
                 handle_error(f"Route optimization failed: {e}", f"Cannot optimize route: {str(e)}.")
     
@@ -1176,7 +3740,7 @@ def main():
         with col_btn1:
             if st.button("Calculate Savings"):
                 try:
-                    tab1, tab2 = st.tabs(["Savings Breakdown", "Trend Analysis"])
+                    tab1, tab2, tab3 = st.tabs(["Savings Breakdown", "Trend Analysis", "Sensitivity Heatmap"])
                     
                     with tab1:
                         fig = px.bar(
@@ -1188,8 +3752,9 @@ def main():
                         st.plotly_chart(fig, use_container_width=True, key=f"warehouse_savings_{time.time()}")
                     
                     with tab2:
-                        sizes = range(100, int(warehouse_size_m2) + 1000, 1000)
-                        savings = [calculate_warehouse_savings(size, led_percentage, solar_percentage)[0] for size in sizes]
+                        sizes = np.linspace(100, warehouse_size_m2 + 1000, SWEEP_LINE_POINTS)
+                        savings = sweep_scenarios('warehouse', warehouse_size_m2=sizes, led_percentage=led_percentage,
+                                                  solar_percentage=solar_percentage)['co2_savings_kg']
                         fig = px.line(
                             x=sizes,
                             y=savings,
@@ -1197,6 +3762,22 @@ def main():
                             labels={'x': 'Warehouse Size (m²)', 'y': 'CO2 Savings (kg)'}
                         )
                         st.plotly_chart(fig, use_container_width=True, key=f"warehouse_trend_{time.time()}")
+                    
+                    with tab3:
+                        sizes = np.linspace(100, 2 * warehouse_size_m2, SWEEP_HEATMAP_POINTS)
+                        shares = np.linspace(0, 1, SWEEP_HEATMAP_POINTS)
+                        savings = sweep_scenarios('warehouse', led_percentage=shares, warehouse_size_m2=sizes,
+                                                  solar_percentage=solar_percentage)['co2_savings_kg']
+                        fig = px.imshow(
+                            savings,
+                            x=sizes,
+                            y=shares * 100,
+                            origin='lower',
+                            aspect='auto',
+                            title=f"CO2 Savings by Warehouse Size and LED Usage (Solar {solar_percentage:.0%})",
+                            labels={'x': 'Warehouse Size (m²)', 'y': 'LED Lighting Usage (%)', 'color': 'CO2 Savings (kg)'}
+                        )
+                        st.plotly_chart(fig, use_container_width=True, key=f"warehouse_heatmap_{time.time()}")
                 except ValueError as e:
                     handle_error(f"Warehouse visualization failed: {e}", f"Visualization failed: {str(e)}.")
         with col_btn2:
@@ -1249,7 +3830,7 @@ def main():
         with col_btn1:
             if st.button("Analyze Packaging"):
                 try:
-                    packaging = get_packaging()
+                    packaging = get_packaging(snapshot=use_snapshot, columns=['timestamp', 'co2_kg'])
                     tab1, tab2 = st.tabs(["Material Comparison", "Historical Trends"])
                     
                     with tab1:
@@ -1321,13 +3902,13 @@ def main():
         with col_btn1:
             if st.button("Plan Offset"):
                 try:
-                    offsets = get_offsets()
+                    offsets = get_offset_totals()
                     tab1, tab2 = st.tabs(["Project Distribution", "Cost vs Offset"])
                     
                     with tab1:
                         if not offsets.empty:
                             fig = px.pie(
-                                offsets.groupby('project_type')['co2_offset_tons'].sum().reset_index(),
+                                offsets,
                                 values='co2_offset_tons',
                                 names='project_type',
                                 title="CO2 Offset by Project"
@@ -1408,7 +3989,7 @@ def main():
         with col_btn1:
             if st.button("Optimize Load"):
                 try:
-                    tab1, tab2 = st.tabs(["Savings Breakdown", "Weight Sensitivity"])
+                    tab1, tab2, tab3 = st.tabs(["Savings Breakdown", "Weight Sensitivity", "Sensitivity Heatmap"])
                     
                     with tab1:
                         fig = px.bar(
@@ -1420,8 +4001,9 @@ def main():
                         st.plotly_chart(fig, use_container_width=True, key=f"load_savings_{time.time()}")
                     
                     with tab2:
-                        weights = range(int(weight_tons / 2), int(weight_tons * 2), int(weight_tons / 10))
-                        savings = [calculate_load_optimization(w, vehicle_capacity_tons, avg_trip_distance_km)[1] for w in weights]
+                        weights = np.linspace(weight_tons / 2, weight_tons * 2, SWEEP_LINE_POINTS)
+                        savings = sweep_scenarios('load', weight_tons=weights, vehicle_capacity_tons=vehicle_capacity_tons,
+                                                  avg_trip_distance_km=avg_trip_distance_km)['co2_savings_kg']
                         fig = px.line(
                             x=weights,
                             y=savings,
@@ -1429,12 +4011,87 @@ def main():
                             labels={'x': 'Total Weight (tons)', 'y': 'CO2 Savings (kg)'}
                         )
                         st.plotly_chart(fig, use_container_width=True, key=f"load_sensitivity_{time.time()}")
+                    
+                    with tab3:
+                        weights = np.linspace(weight_tons / 2, weight_tons * 2, SWEEP_HEATMAP_POINTS)
+                        capacities = np.linspace(vehicle_capacity_tons / 2, vehicle_capacity_tons * 2, SWEEP_HEATMAP_POINTS)
+                        savings = sweep_scenarios('load', vehicle_capacity_tons=capacities, weight_tons=weights,
+                                                  avg_trip_distance_km=avg_trip_distance_km)['co2_savings_kg']
+                        fig = px.imshow(
+                            savings,
+                            x=weights,
+                            y=capacities,
+                            origin='lower',
+                            aspect='auto',
+                            title="CO2 Savings by Total Weight and Vehicle Capacity",
+                            labels={'x': 'Total Weight (tons)', 'y': 'Vehicle Capacity (tons)', 'color': 'CO2 Savings (kg)'}
+                        )
+                        st.plotly_chart(fig, use_container_width=True, key=f"load_heatmap_{time.time()}")
                 except ValueError as e:
                     handle_error(f"Load visualization failed: {e}", f"Visualization failed: {str(e)}.")
         with col_btn2:
             if st.button("Reset Inputs"):
                 reset_load_inputs()
                 st.experimental_rerun()
+        
+        with st.expander("Fleet Consolidation Planner"):
+            consignment_source = st.radio(
+                "Consignments",
+                ["Recorded Shipments", "Upload File"],
+                horizontal=True,
+                help="Upload columns: source, destination, weight_tons, distance_km and optional earliest/latest dispatch times."
+            )
+            if consignment_source == "Upload File":
+                uploaded = st.file_uploader("Consignment file (CSV or Parquet)", type=['csv', 'parquet'], key="consignment_upload")
+            else:
+                window_hours = st.number_input(
+                    "Dispatch Window (hours)",
+                    min_value=1,
+                    max_value=720,
+                    value=LOAD_WINDOW_HOURS,
+                    help="How long after it was recorded each shipment may wait to be consolidated."
+                )
+            fleet = st.data_editor(pd.DataFrame(DEFAULT_FLEET), num_rows="dynamic", key="fleet_editor")
+            if st.button("Plan Consolidation"):
+                try:
+                    if consignment_source == "Upload File":
+                        if uploaded is None:
+                            raise ValueError("Upload a consignment file first.")
+                        consignments = pd.read_parquet(uploaded) if uploaded.name.endswith('.parquet') else pd.read_csv(uploaded)
+                    else:
+                        consignments = recorded_consignments(window_hours)
+                    if consignments.empty:
+                        raise ValueError("No consignments to plan.")
+                    with st.spinner("Planning trips..."):
+                        trips, summary = plan_consolidation(consignments, fleet.dropna(how='all'))
+                    col_plan1, col_plan2, col_plan3, col_plan4 = st.columns(4)
+                    with col_plan1:
+                        st.metric("Trips", f"{summary['trips']:,}")
+                    with col_plan2:
+                        st.metric("Trips Saved", f"{summary['trips_saved']:,}")
+                    with col_plan3:
+                        st.metric("Average Utilisation", f"{summary['utilisation']:.1%}")
+                    with col_plan4:
+                        st.metric("CO2 Saved", f"{summary['co2_saved_kg']:,.2f} kg")
+                    fig = px.histogram(
+                        trips,
+                        x='utilisation',
+                        color='vehicle',
+                        nbins=20,
+                        title="Trip Utilisation by Vehicle",
+                        labels={'utilisation': 'Utilisation'}
+                    )
+                    st.plotly_chart(fig, use_container_width=True, key=f"load_plan_{time.time()}")
+                    trips['consignments'] = trips['consignments'].map(lambda items: ' '.join(map(str, items)))
+                    st.dataframe(trips.head(1000))
+                    st.download_button(
+                        label="Download Trip Plan as CSV",
+                        data=trips.to_csv(index=False),
+                        file_name="trip_plan.csv",
+                        mime="text/csv"
+                    )
+                except (ValueError, sqlite3.Error) as e:
+                    handle_error(f"Load consolidation failed: {e}", f"Cannot plan consolidation: {str(e)}.")
     
     elif page == "Energy Conservation":
         st.header("Energy Conservation Analysis")
@@ -1463,9 +4120,7 @@ def main():
         
         with col2:
             try:
-                traditional_energy_kwh = facility_size_m2 * 150
-                energy_savings_kwh = traditional_energy_kwh * smart_system_usage * 0.4
-                co2_savings_kg = energy_savings_kwh * 0.5
+                co2_savings_kg, energy_savings_kwh = calculate_energy_savings(facility_size_m2, smart_system_usage)
                 cost_savings = energy_savings_kwh * 0.15
                 household_equivalent = energy_savings_kwh / 10000
                 
@@ -1481,7 +4136,7 @@ def main():
         with col_btn1:
             if st.button("Analyze Energy Savings"):
                 try:
-                    tab1, tab2 = st.tabs(["Savings Breakdown", "Size Sensitivity"])
+                    tab1, tab2, tab3 = st.tabs(["Savings Breakdown", "Size Sensitivity", "Sensitivity Heatmap"])
                     
                     with tab1:
                         fig = px.bar(
@@ -1493,8 +4148,8 @@ def main():
                         st.plotly_chart(fig, use_container_width=True, key=f"energy_savings_{time.time()}")
                     
                     with tab2:
-                        sizes = range(100, int(facility_size_m2) + 1000, 1000)
-                        savings = [facility_size * 150 * smart_system_usage * 0.4 * 0.5 for facility_size in sizes]
+                        sizes = np.linspace(100, facility_size_m2 + 1000, SWEEP_LINE_POINTS)
+                        savings = sweep_scenarios('energy', facility_size_m2=sizes, smart_system_usage=smart_system_usage)['co2_savings_kg']
                         fig = px.line(
                             x=sizes,
                             y=savings,
@@ -1502,12 +4157,97 @@ def main():
                             labels={'x': 'Facility Size (m²)', 'y': 'CO2 Savings (kg)'}
                         )
                         st.plotly_chart(fig, use_container_width=True, key=f"energy_sensitivity_{time.time()}")
+                    
+                    with tab3:
+                        sizes = np.linspace(100, 2 * facility_size_m2, SWEEP_HEATMAP_POINTS)
+                        shares = np.linspace(0, 1, SWEEP_HEATMAP_POINTS)
+                        savings = sweep_scenarios('energy', smart_system_usage=shares, facility_size_m2=sizes)['co2_savings_kg']
+                        fig = px.imshow(
+                            savings,
+                            x=sizes,
+                            y=shares * 100,
+                            origin='lower',
+                            aspect='auto',
+                            title="CO2 Savings by Facility Size and Smart System Usage",
+                            labels={'x': 'Facility Size (m²)', 'y': 'Smart System Usage (%)', 'color': 'CO2 Savings (kg)'}
+                        )
+                        st.plotly_chart(fig, use_container_width=True, key=f"energy_heatmap_{time.time()}")
                 except ValueError as e:
                     handle_error(f"Energy visualization failed: {e}", f"Visualization failed: {str(e)}.")
         with col_btn2:
             if st.button("Reset Inputs"):
                 reset_energy_inputs()
                 st.experimental_rerun()
+    
+    elif page == "Diagnostics":
+        st.header("Diagnostics")
+        registry = metrics()
+        snapshot = registry.snapshot()
+        st.caption(f"Process metrics since {datetime.datetime.fromtimestamp(registry.started_at):%Y-%m-%d %H:%M:%S}. "
+                   f"Percentiles cover the last {METRICS_WINDOW:,} calls of each timer.")
+        
+        if snapshot['timers']:
+            timers = pd.DataFrame.from_dict(snapshot['timers'], orient='index')
+            timers = timers.rename_axis('Operation').reset_index().sort_values('total_s', ascending=False)
+            timers = pd.DataFrame({
+                'Operation': timers['Operation'],
+                'Calls': timers['count'],
+                'Total (s)': timers['total_s'].round(3),
+                **{f"p{round(q * 100)} (ms)": (timers[f"p{round(q * 100)}_s"] * 1000).round(2) for q in METRICS_QUANTILES},
+                'Max (ms)': (timers['max_s'] * 1000).round(2)
+            })
+            st.subheader("Timings")
+            st.dataframe(timers, hide_index=True, use_container_width=True)
+            fig = px.bar(
+                timers.head(15),
+                x='Operation',
+                y='Total (s)',
+                title="Time Spent by Operation",
+                labels={'Total (s)': 'Total Time (s)'}
+            )
+            st.plotly_chart(fig, use_container_width=True, key=f"diagnostics_timings_{time.time()}")
+        else:
+            st.info("No timings recorded yet. Use the other pages and come back.")
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            st.subheader("Counters")
+            counters = pd.DataFrame(list(snapshot['counters'].items()), columns=['Counter', 'Value'])
+            coordinate_lookups = sum(snapshot['counters'].get(name, 0) for name in
+                                     ('coordinate_cache_hits', 'coordinate_db_hits', 'coordinate_static_hits', 'coordinate_cache_misses'))
+            if coordinate_lookups:
+                st.metric("Coordinate Cache Hit Rate", f"{snapshot['counters'].get('coordinate_cache_hits', 0) / coordinate_lookups:.1%}")
+            st.dataframe(counters, hide_index=True, use_container_width=True)
+        with col2:
+            st.subheader("Caches")
+            stats = query_cache().stats()
+            lookups = stats['hits'] + stats['misses']
+            st.metric("Query Cache Hit Rate", f"{stats['hits'] / lookups:.1%}" if lookups else "n/a")
+            st.metric("Query Cache Memory", f"{stats['bytes'] / 2**20:,.1f} / {stats['max_bytes'] / 2**20:,.0f} MB ({stats['entries']} entries)")
+            st.metric("Cached Coordinates", f"{len(coordinate_cache()):,}")
+            st.metric("Pending Geocodes", f"{geocoding_queue().pending_count():,}")
+        
+        col_btn1, col_btn2, col_btn3 = st.columns(3)
+        with col_btn1:
+            st.download_button(
+                label="Download Metrics (Prometheus)",
+                data=registry.prometheus(),
+                file_name="carbonx9_metrics.prom",
+                mime="text/plain"
+            )
+        with col_btn2:
+            st.download_button(
+                label="Download Metrics (JSON)",
+                data=json.dumps(snapshot, indent=2),
+                file_name="carbonx9_metrics.json",
+                mime="application/json"
+            )
+        with col_btn3:
+            if st.button("Reset Metrics"):
+                registry.reset()
+                st.experimental_rerun()
+        if METRICS_DUMP_PATH:
+            st.caption(f"Metrics are also written to {METRICS_DUMP_PATH} every {METRICS_DUMP_INTERVAL_SECONDS}s.")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,315 @@
+"""
+Benchmark suite for CarbonX9's calculation and data-access hot paths.
+
+Seeds SQLite databases with synthetic emissions (1k, 100k and 1M rows by default), then times
+calculate_distance, optimize_route, get_emissions, get_suppliers and render_map against each one
+and records peak traced memory. Geocoding is stubbed, so the suite runs offline. Results are
+written as JSON; pass --compare with an earlier results file to see per-case speed ratios.
+
+Every run also imports app in fresh interpreters and fails (exit code 1) when the median import
+time exceeds the startup budget or a deferred library was imported eagerly.
+
+    python benchmark.py
+    python benchmark.py --sizes 1000 100000 --repeat 3 --output results.json
+    python benchmark.py --compare baseline.json
+    python benchmark.py --startup-only --startup-budget 1.0
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import logging
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import streamlit.logger
+streamlit.logger.set_log_level('error')  # silence bare-mode cache warnings
+import app  # noqa: E402
+
+DEFAULT_SIZES = [1000, 100000, 1000000]
+DEFAULT_REPEAT = 5
+DEFAULT_SEED = 42
+DEFAULT_WORKDIR = 'benchmark_data'
+DEFAULT_OUTPUT = 'benchmark_results.json'
+SYNTHETIC_COUNTRIES = 20
+SYNTHETIC_CITIES_PER_COUNTRY = 10
+SUPPLIERS_PER_EMISSION = 0.01
+HISTORY_DAYS = 300  # stays inside the retention window
+CALLS_PER_CASE = 1000
+STARTUP_BUDGET_SECONDS = 1.5  # median cold `import app`, what a freshly scaled-up container pays first
+STARTUP_RUNS = 5
+DEFERRED_MODULES = ('folium', 'streamlit_folium', 'plotly.express', 'geopy')
+STARTUP_PROBE = f"""
+import sys, time
+started = time.perf_counter()
+import app
+seconds = time.perf_counter() - started
+try:
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+except ImportError:
+    rss = 0
+print(seconds, rss, ','.join(m for m in {DEFERRED_MODULES!r} if m in sys.modules))
+"""
+
+class OfflineGeocoder:
+    """Deterministic geopy-style geocoder so nothing reaches the network."""
+
+    class Location:
+        def __init__(self, latitude, longitude):
+            self.latitude = latitude
+            self.longitude = longitude
+
+    def geocode(self, query, timeout=None):
+        digest = hashlib.sha256(query.encode('utf-8')).digest()
+        lat = int.from_bytes(digest[:4], 'big') / 2**32 * 140 - 60
+        lon = int.from_bytes(digest[4:8], 'big') / 2**32 * 360 - 180
+        return self.Location(round(lat, 4), round(lon, 4))
+
+def synthetic_locations(rng):
+    """LOCATIONS plus a grid of synthetic cities, as a list of (country, city, lat, lon)."""
+    locations = [(country, city, lat, lon) for country, cities in app.LOCATIONS.items() for city, (lat, lon) in cities.items()]
+    lats = rng.uniform(-50, 70, SYNTHETIC_COUNTRIES * SYNTHETIC_CITIES_PER_COUNTRY).round(4)
+    lons = rng.uniform(-170, 170, SYNTHETIC_COUNTRIES * SYNTHETIC_CITIES_PER_COUNTRY).round(4)
+    for i, (lat, lon) in enumerate(zip(lats.tolist(), lons.tolist())):
+        country = f"Country {i // SYNTHETIC_CITIES_PER_COUNTRY:02d}"
+        locations.append((country, f"City {i:03d}", lat, lon))
+    return locations
+
+def synthetic_shipments(rng, rows, locations):
+    """Random shipments between distinct locations with timestamps spread over HISTORY_DAYS."""
+    source = rng.integers(0, len(locations), rows)
+    dest = (source + rng.integers(1, len(locations), rows)) % len(locations)
+    countries = np.array([loc[0] for loc in locations], dtype=object)
+    cities = np.array([loc[1] for loc in locations], dtype=object)
+    modes = np.array(list(app.EMISSION_FACTORS), dtype=object)
+    now = pd.Timestamp.now(tz='UTC').floor('s')
+    return pd.DataFrame({
+        'source_country': countries[source],
+        'source_city': cities[source],
+        'dest_country': countries[dest],
+        'dest_city': cities[dest],
+        'transport_mode': modes[rng.integers(0, len(modes), rows)],
+        'weight_tons': rng.gamma(2.0, 5.0, rows).round(2) + 0.01,
+        'timestamp': now - pd.to_timedelta(rng.integers(0, HISTORY_DAYS * 86400, rows), unit='s')
+    })
+
+def synthetic_suppliers(rng, count, locations):
+    """Random supplier rows for the suppliers table."""
+    materials = ['Steel', 'Electronics', 'Textiles', 'Chemicals']
+    practices = ['Renewable energy', 'Recycling', 'Sustainable sourcing', 'Carbon offsetting', 'Waste reduction']
+    picks = rng.integers(0, len(locations), count)
+    return [
+        (f"bench-supplier-{i}", f"Supplier {i}", locations[p][0], locations[p][1],
+         materials[i % len(materials)], int(rng.integers(40, 100)), int(rng.integers(1000, 100000)),
+         practices[i % len(practices)])
+        for i, p in enumerate(picks.tolist())
+    ]
+
+def use_database(db_path):
+    """Point the app at db_path and migrate it, without starting background maintenance."""
+    app.DB_PATH = db_path
+    app.migrate_db()
+
+def seed_database(db_path, rows, seed):
+    """Create (or reuse) a benchmark database with `rows` emissions. Returns the locations used."""
+    rng = np.random.default_rng(seed)
+    locations = synthetic_locations(rng)
+    if os.path.exists(db_path):
+        with sqlite3.connect(db_path) as conn:
+            existing = conn.execute('SELECT COUNT(*) FROM emissions').fetchone()[0]
+        if existing == rows:
+            use_database(db_path)
+            return locations
+        os.remove(db_path)
+    use_database(db_path)
+    with app.db_connection() as conn:
+        conn.executemany('INSERT OR REPLACE INTO coordinates (country, city, lat, lon) VALUES (?, ?, ?, ?)', locations)
+        conn.executemany('INSERT INTO suppliers (id, supplier_name, country, city, material, green_score, annual_capacity_tons, sustainable_practices) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                         synthetic_suppliers(rng, max(int(rows * SUPPLIERS_PER_EMISSION), 1), locations))
+        app._bump_data_version(conn, 'coordinates', 'suppliers')
+    app.coordinate_cache().preload()
+    report = app.ingest_shipments(synthetic_shipments(rng, rows, locations))
+    if report['inserted'] != rows:
+        raise RuntimeError(f"Seeding {db_path} inserted {report['inserted']} of {rows} rows.")
+    logging.info(f"Seeded {db_path} with {rows:,} emissions in {report['seconds']:.1f}s")
+    return locations
+
+def measure(fn, repeat, setup=None, calls=1):
+    """Time fn() `repeat` times, then trace one more run for peak memory."""
+    seconds = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        fn()
+        seconds.append(time.perf_counter() - started)
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        'calls': calls,
+        'min_s': min(seconds),
+        'median_s': statistics.median(seconds),
+        'mean_s': statistics.fmean(seconds),
+        'per_call_s': statistics.median(seconds) / calls,
+        'peak_memory_bytes': peak
+    }
+
+def benchmark_cases(locations, seed):
+    """The hot paths to time, as (name, fn, setup, calls)."""
+    rng = np.random.default_rng(seed + 1)
+    pairs = [(locations[a], locations[b]) for a, b in rng.integers(0, len(locations), (CALLS_PER_CASE, 2)).tolist() if a != b]
+    weights = rng.uniform(0.5, 50, len(pairs)).round(2).tolist()
+    distances = [app.calculate_distance(s[0], s[1], d[0], d[1]) for s, d in pairs]
+    clear_query_cache = app.query_cache().clear
+
+    def distances_cold():
+        app._distance_matrix.clear()
+
+    def calculate_distance():
+        for s, d in pairs:
+            app.calculate_distance(s[0], s[1], d[0], d[1])
+
+    def optimize_route():
+        for (s, d), km, tons in zip(pairs, distances, weights):
+            app.optimize_route(s[0], s[1], d[0], d[1], km, tons)
+
+    def get_suppliers():
+        for country in app.LOCATIONS:
+            app.get_suppliers(country=country, min_green_score=50)
+
+    def render_map():
+        emissions = app.split_locations(app.get_emissions(columns=app.ROUTE_COLUMNS))
+        app.render_map(emissions).get_root().render()
+
+    return [
+        ('calculate_distance_cold', calculate_distance, distances_cold, len(pairs)),
+        ('calculate_distance_warm', calculate_distance, None, len(pairs)),
+        ('optimize_route', optimize_route, None, len(pairs)),
+        ('get_emissions_cold', app.get_emissions, clear_query_cache, 1),
+        ('get_emissions_warm', app.get_emissions, None, 1),
+        ('get_suppliers_cold', get_suppliers, clear_query_cache, len(app.LOCATIONS)),
+        ('get_suppliers_warm', get_suppliers, None, len(app.LOCATIONS)),
+        ('render_map', render_map, clear_query_cache, 1)
+    ]
+
+def measure_startup(runs=STARTUP_RUNS):
+    """Import app in `runs` fresh interpreters; reports import time, peak RSS and eagerly imported deferred modules."""
+    seconds, rss, eager = [], [], set()
+    for _ in range(runs):
+        probe = subprocess.run([sys.executable, '-c', STARTUP_PROBE], capture_output=True, text=True, check=True,
+                               cwd=os.path.dirname(os.path.abspath(__file__)))
+        elapsed, peak, modules = (probe.stdout.strip().splitlines()[-1].split(' ') + [''])[:3]
+        seconds.append(float(elapsed))
+        rss.append(int(peak))
+        eager.update(filter(None, modules.split(',')))
+    return {
+        'case': 'startup_import',
+        'rows': 0,
+        'repeat': runs,
+        'calls': 1,
+        'min_s': min(seconds),
+        'median_s': statistics.median(seconds),
+        'mean_s': statistics.fmean(seconds),
+        'per_call_s': statistics.median(seconds),
+        'peak_memory_bytes': max(rss),
+        'eager_modules': sorted(eager)
+    }
+
+def check_startup(result, budget_seconds):
+    """Log the startup result against the budget; returns True when it is within budget."""
+    ok = result['median_s'] <= budget_seconds and not result['eager_modules']
+    logging.info(f"{'startup_import':<26} {'':>9}       median {result['median_s'] * 1000:10.2f} ms  "
+                 f"budget {budget_seconds * 1000:.0f} ms  {'OK' if ok else 'OVER BUDGET'}")
+    if result['eager_modules']:
+        logging.error(f"Deferred modules imported at startup: {', '.join(result['eager_modules'])}")
+    return ok
+
+def environment():
+    """Versions and machine details stored alongside the results."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'sqlite': sqlite3.sqlite_version
+    }
+
+def run(sizes, repeat, seed, workdir, startup_budget=STARTUP_BUDGET_SECONDS):
+    """Check the startup budget, then seed each database size and time every case against it."""
+    app.GEOCODER = OfflineGeocoder()
+    os.makedirs(workdir, exist_ok=True)
+    startup = measure_startup()
+    startup['budget_s'] = startup_budget
+    startup['within_budget'] = check_startup(startup, startup_budget)
+    results = [startup]
+    for rows in sizes:
+        locations = seed_database(os.path.join(workdir, f"emissions_{rows}.db"), rows, seed)
+        for name, fn, setup, calls in benchmark_cases(locations, seed):
+            result = {'case': name, 'rows': rows, 'repeat': repeat, **measure(fn, repeat, setup, calls)}
+            results.append(result)
+            logging.info(f"{name:<26} {rows:>9,} rows  median {result['median_s'] * 1000:10.2f} ms  "
+                         f"peak {result['peak_memory_bytes'] / 2**20:8.1f} MiB")
+    return {'environment': environment(), 'seed': seed, 'results': results}
+
+def compare(current, baseline):
+    """Print median-time and peak-memory ratios (current / baseline) for cases present in both runs."""
+    previous = {(r['case'], r['rows']): r for r in baseline['results']}
+    print(f"{'case':<26} {'rows':>9}  {'time x':>8}  {'memory x':>8}")
+    for result in current['results']:
+        old = previous.get((result['case'], result['rows']))
+        if old is None:
+            continue
+        time_ratio = result['median_s'] / old['median_s'] if old['median_s'] else float('nan')
+        memory_ratio = result['peak_memory_bytes'] / old['peak_memory_bytes'] if old['peak_memory_bytes'] else float('nan')
+        print(f"{result['case']:<26} {result['rows']:>9,}  {time_ratio:8.2f}  {memory_ratio:8.2f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark CarbonX9 calculation and data-access paths.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="Emissions rows per seeded database.")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help="Timed runs per case.")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help="Random seed for the synthetic data.")
+    parser.add_argument('--workdir', default=DEFAULT_WORKDIR, help="Directory for seeded databases (reused across runs).")
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help="JSON file to write results to.")
+    parser.add_argument('--compare', help="Earlier results file to compare against.")
+    parser.add_argument('--startup-budget', type=float, default=STARTUP_BUDGET_SECONDS, help="Maximum median cold import time in seconds.")
+    parser.add_argument('--startup-only', action='store_true', help="Only run the startup budget check.")
+    args = parser.parse_args(argv)
+    if args.repeat < 1 or any(rows < 1 for rows in args.sizes):
+        parser.error("--repeat and --sizes must be positive.")
+
+    report = run([] if args.startup_only else args.sizes, args.repeat, args.seed, args.workdir, args.startup_budget)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    logging.info(f"Wrote {len(report['results'])} results to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+    return 0 if report['results'][0]['within_budget'] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,345 @@
+"""
+Seeded synthetic workload generator for scale-testing the CarbonX9 database.
+
+Generates coordinates, suppliers, emissions, packaging and offsets whose distributions follow
+LOCATIONS, EMISSION_FACTORS, PACKAGING_EMISSIONS and OFFSET_COSTS, and either bulk-writes them into
+a SQLite database (keeping the rollup tables and data versions in step) or writes CSV files, with
+shipments in the ingest_shipments column layout. Import the coordinates.csv written alongside them
+first (Bulk Import's coordinates file, or app.import_coordinates) so depot cities are not geocoded.
+
+    python generate_data.py --db emissions.db --emissions 10000000
+    python generate_data.py --csv synthetic_csv --emissions 1000000 --start 2025-01-01 --end 2026-01-01
+"""
+import argparse
+import contextlib
+import logging
+import os
+import sqlite3
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import streamlit.logger
+streamlit.logger.set_log_level('error')  # silence bare-mode cache warnings
+import app  # noqa: E402
+
+DEFAULT_SEED = 7
+DEFAULT_DAYS = 365
+BATCH_SIZE = 250000
+CSV_ROWS_PER_FILE = 1000000
+
+# Locations: LOCATIONS cities plus depots scattered around them
+DEPOT_JITTER_DEGREES = 1.5
+LOCATION_POPULARITY_EXPONENT = 0.8  # Zipf-like: a few hubs carry most of the traffic
+
+# Transport mix for lanes inside one land region and between regions, and typical consignment weights
+DOMESTIC_MODE_SHARES = {'Truck': 0.55, 'Train': 0.20, 'Electric Truck': 0.10, 'Biofuel Truck': 0.10, 'Hydrogen Truck': 0.05}
+INTERCONTINENTAL_MODE_SHARES = {'Ship': 0.75, 'Plane': 0.25}
+MODE_WEIGHT_TONS = {  # lognormal (median, sigma)
+    'Truck': (8.0, 0.6),
+    'Train': (15.0, 0.7),
+    'Ship': (20.0, 0.8),
+    'Plane': (2.0, 0.7),
+    'Electric Truck': (5.0, 0.5),
+    'Biofuel Truck': (8.0, 0.6),
+    'Hydrogen Truck': (8.0, 0.6)
+}
+WEEKEND_ACTIVITY = 0.35  # weekend volume relative to a weekday
+
+PACKAGING_SHARES = {'Cardboard': 0.50, 'Plastic': 0.30, 'Biodegradable': 0.12, 'Reusable': 0.08}
+PACKAGING_WEIGHT_KG = (5.0, 1.0)
+OFFSET_SHARES = {'Reforestation': 0.50, 'Renewable Energy': 0.35, 'Methane Capture': 0.15}
+OFFSET_TONS = (10.0, 1.0)
+SUPPLIER_GREEN_SCORE = (70, 10)  # normal (mean, sd), clipped to 0-100
+SUPPLIER_CAPACITY_TONS = (40000, 0.5)
+
+def _lognormal(rng, median_sigma, size):
+    median, sigma = median_sigma
+    return rng.lognormal(np.log(median), sigma, size)
+
+def _choice(rng, shares, size):
+    """Sample labels from a {label: share} mapping."""
+    labels = np.array(list(shares), dtype=object)
+    p = np.array(list(shares.values()), dtype=float)
+    return labels[rng.choice(len(labels), size, p=p / p.sum())]
+
+def _money(values):
+    """Round to cents and keep strictly positive."""
+    return np.maximum(np.round(values, 2), 0.01)
+
+def generate_locations(rng, depots_per_city=0):
+    """LOCATIONS plus depots_per_city jittered depots around each city, with popularity weights."""
+    rows = []
+    for country, cities in app.LOCATIONS.items():
+        for city, (lat, lon) in cities.items():
+            rows.append((country, city, lat, lon))
+            for k in range(1, depots_per_city + 1):
+                dlat, dlon = rng.uniform(-DEPOT_JITTER_DEGREES, DEPOT_JITTER_DEGREES, 2)
+                rows.append((country, f"{city} Depot {k}", round(lat + dlat, 4), round(lon + dlon, 4)))
+    locations = pd.DataFrame(rows, columns=['country', 'city', 'lat', 'lon'])
+    rank = rng.permutation(len(locations)) + 1
+    locations['popularity'] = 1.0 / rank ** LOCATION_POPULARITY_EXPONENT
+    locations['popularity'] /= locations['popularity'].sum()
+    return locations
+
+def daily_timeline(start, end):
+    """Days in [start, end) with relative activity (weekdays busier than weekends)."""
+    days = pd.date_range(pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize(), freq='D', inclusive='left')
+    if len(days) == 0:
+        raise ValueError("The date range must span at least one day.")
+    activity = np.where(days.dayofweek >= 5, WEEKEND_ACTIVITY, 1.0)
+    return days, activity / activity.sum()
+
+def iter_timestamps(rng, n, days, activity, batch_size):
+    """Yield batches of n timestamps distributed over days by activity, in ascending order."""
+    per_day = rng.multinomial(n, activity)
+    ends = np.cumsum(per_day)
+    base = days.to_numpy().astype('datetime64[s]').astype(np.int64)
+    for offset in range(0, n, batch_size):
+        rows = np.arange(offset, min(offset + batch_size, n))
+        day = np.searchsorted(ends, rows, side='right')
+        seconds = np.sort(base[day] + rng.integers(0, 86400, len(rows)))
+        yield pd.Series(pd.to_datetime(seconds, unit='s'))
+
+def generate_emissions(rng, locations, timestamps):
+    """A batch of shipments between popular locations, priced like calculate_emissions_bulk."""
+    n = len(timestamps)
+    popularity = locations['popularity'].to_numpy()
+    source = rng.choice(len(locations), n, p=popularity)
+    dest = rng.choice(len(locations), n, p=popularity)
+    same = source == dest
+    dest[same] = (dest[same] + rng.integers(1, len(locations), same.sum())) % len(locations)
+
+    countries = locations['country'].to_numpy()
+    regions = pd.Series(countries).map(app.LAND_REGIONS).fillna(pd.Series(countries)).to_numpy()
+    domestic = regions[source] == regions[dest]
+    transport_mode = np.empty(n, dtype=object)
+    transport_mode[domestic] = _choice(rng, DOMESTIC_MODE_SHARES, domestic.sum())
+    transport_mode[~domestic] = _choice(rng, INTERCONTINENTAL_MODE_SHARES, (~domestic).sum())
+    weight_tons = np.empty(n)
+    for mode, params in MODE_WEIGHT_TONS.items():
+        rows = transport_mode == mode
+        weight_tons[rows] = _lognormal(rng, params, rows.sum())
+    weight_tons = _money(weight_tons)
+
+    lat, lon = locations['lat'].to_numpy(), locations['lon'].to_numpy()
+    distance_km = app._round_like_builtin(app.haversine_km(lat[source], lon[source], lat[dest], lon[dest]))
+    factor = pd.Series(transport_mode).map(app.EMISSION_FACTORS).to_numpy(dtype=float)
+    return pd.DataFrame({
+        'source_country': countries[source],
+        'source_city': locations['city'].to_numpy()[source],
+        'dest_country': countries[dest],
+        'dest_city': locations['city'].to_numpy()[dest],
+        'source_index': source,
+        'dest_index': dest,
+        'transport_mode': transport_mode,
+        'weight_tons': weight_tons,
+        'distance_km': distance_km,
+        'co2_kg': app._round_like_builtin(distance_km * weight_tons * factor),
+        'timestamp': timestamps
+    })
+
+def generate_packaging(rng, timestamps):
+    """A batch of packaging records; CO2 follows PACKAGING_EMISSIONS."""
+    material_type = _choice(rng, PACKAGING_SHARES, len(timestamps))
+    weight_kg = _money(_lognormal(rng, PACKAGING_WEIGHT_KG, len(timestamps)))
+    factor = pd.Series(material_type).map(app.PACKAGING_EMISSIONS).to_numpy(dtype=float)
+    return pd.DataFrame({'material_type': material_type, 'weight_kg': weight_kg,
+                         'co2_kg': np.round(weight_kg * factor, 2), 'timestamp': timestamps})
+
+def generate_offsets(rng, timestamps):
+    """A batch of offset purchases; cost follows OFFSET_COSTS."""
+    project_type = _choice(rng, OFFSET_SHARES, len(timestamps))
+    co2_offset_tons = _money(_lognormal(rng, OFFSET_TONS, len(timestamps)))
+    price = pd.Series(project_type).map(app.OFFSET_COSTS).to_numpy(dtype=float)
+    return pd.DataFrame({'project_type': project_type, 'co2_offset_tons': co2_offset_tons,
+                         'cost_usd': np.round(co2_offset_tons * price, 2), 'timestamp': timestamps})
+
+def generate_suppliers(rng, locations, timestamps):
+    """A batch of suppliers at the generated locations, using the materials and practices of SAMPLE_SUPPLIERS."""
+    n = len(timestamps)
+    materials = sorted({s[3] for s in app.SAMPLE_SUPPLIERS})
+    practices = sorted({s[6] for s in app.SAMPLE_SUPPLIERS})
+    at = rng.choice(len(locations), n, p=locations['popularity'].to_numpy())
+    material = np.array(materials, dtype=object)[rng.integers(0, len(materials), n)]
+    city = locations['city'].to_numpy()[at]
+    serial = rng.integers(0, 10**6, n).astype(str)
+    return pd.DataFrame({
+        'supplier_name': city + ' ' + material + ' Supplier ' + serial,
+        'country': locations['country'].to_numpy()[at],
+        'city': city,
+        'material': material,
+        'green_score': np.clip(np.round(rng.normal(*SUPPLIER_GREEN_SCORE, n)), 0, 100).astype(int),
+        'annual_capacity_tons': np.round(_lognormal(rng, SUPPLIER_CAPACITY_TONS, n)).astype(int),
+        'sustainable_practices': np.array(practices, dtype=object)[rng.integers(0, len(practices), n)],
+        'created_at': timestamps
+    })
+
+def _uuid7_batch(timestamps):
+    """
+    Version-7 (time-ordered) UUID strings, so ascending timestamps append to the primary-key index. The random bits
+    come from os.urandom, not the data generator, so ids never repeat across runs and the data depends only on the seed.
+    """
+    n = len(timestamps)
+    millis = timestamps.to_numpy().astype('datetime64[ms]').astype(np.int64).astype('>u8')
+    raw = np.empty((n, 16), dtype=np.uint8)
+    raw[:, :6] = millis.view(np.uint8).reshape(n, 8)[:, 2:]
+    raw[:, 6:] = np.frombuffer(os.urandom(10 * n), dtype=np.uint8).reshape(n, 10)
+    raw[:, 6] = (raw[:, 6] & 0x0F) | 0x70
+    raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80
+    hex_chars = np.frombuffer(raw.tobytes().hex().encode('ascii'), dtype=np.uint8).reshape(n, 32)
+    chars = np.full((n, 36), ord('-'), dtype=np.uint8)
+    chars[:, app._UUID_HEX_POSITIONS] = hex_chars
+    return chars.view('S36').ravel().astype(str).tolist()
+
+ROLLUPS = {'emissions': app._rollup_emissions, 'offsets': app._rollup_offsets}
+
+class DatabaseWriter:
+    """
+    Bulk-writes generated batches into the app database, one transaction per batch.
+    While a table loads its secondary indexes are dropped; they are rebuilt, and the rollups
+    updated, once at the end. Stop the app while loading large volumes.
+    """
+
+    def __init__(self, db_path, locations):
+        app.DB_PATH = db_path
+        app.migrate_db()
+        with app.db_connection() as conn:
+            conn.executemany('INSERT OR REPLACE INTO coordinates (country, city, lat, lon) VALUES (?, ?, ?, ?)',
+                             locations[['country', 'city', 'lat', 'lon']].itertuples(index=False, name=None))
+            self.location_ids = np.array(app._location_ids(conn, zip(locations['country'], locations['city'])), dtype=np.int64)
+            app._bump_data_version(conn, 'coordinates')
+        self.labels = (locations['city'] + ', ' + locations['country']).to_numpy()
+
+    @contextlib.contextmanager
+    def loading(self, table):
+        with app.db_connection() as conn:
+            first_rowid = conn.execute(f'SELECT COALESCE(MAX(rowid), 0) FROM {table}').fetchone()[0]
+            indexes = conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+                                   (table,)).fetchall()
+            for name, _ in indexes:
+                conn.execute(f'DROP INDEX {name}')
+        try:
+            yield
+        finally:
+            # Batches committed before any failure are still indexed and rolled up
+            with app.db_connection() as conn:
+                for _, sql in indexes:
+                    conn.execute(sql)
+                if table in ROLLUPS:
+                    ROLLUPS[table](conn, 'rowid > ?', (first_rowid,))
+                app._bump_data_version(conn, table)
+
+    def write(self, table, frame):
+        time_column = 'created_at' if table == 'suppliers' else 'timestamp'
+        ids = _uuid7_batch(frame[time_column])
+        frame = frame.assign(**{time_column: app._format_timestamps(frame[time_column])})
+        if table == 'emissions':
+            frame = pd.DataFrame({
+                'source': self.labels[frame['source_index']],
+                'destination': self.labels[frame['dest_index']],
+                'source_location_id': self.location_ids[frame['source_index']],
+                'dest_location_id': self.location_ids[frame['dest_index']],
+                **{c: frame[c] for c in ['transport_mode', 'distance_km', 'co2_kg', 'weight_tons', 'timestamp']}
+            })
+        columns = list(frame.columns)
+        placeholders = ', '.join('?' * (len(columns) + 1))
+        with app.db_connection() as conn:
+            conn.executemany(f"INSERT INTO {table} (id, {', '.join(columns)}) VALUES ({placeholders})",
+                             zip(ids, *(frame[c].tolist() for c in columns)))
+
+class CsvWriter:
+    """
+    Writes generated batches as CSV files; shipments use the ingest_shipments column layout and
+    coordinates.csv the import_coordinates layout.
+    """
+
+    def __init__(self, directory, locations, rows_per_file=CSV_ROWS_PER_FILE):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.rows_per_file = rows_per_file
+        self.files = {}
+        locations[app.COORDINATE_COLUMNS].to_csv(os.path.join(directory, 'coordinates.csv'), index=False)
+
+    @contextlib.contextmanager
+    def loading(self, table):
+        yield
+
+    def write(self, table, frame):
+        if table == 'emissions':
+            name = 'shipments'
+            frame = frame[app.INGEST_COLUMNS + ['timestamp']]
+        else:
+            name = table
+        part, rows = self.files.get(name, (0, 0))
+        if rows >= self.rows_per_file:
+            part, rows = part + 1, 0
+        path = os.path.join(self.directory, f"{name}-{part:04d}.csv")
+        frame.to_csv(path, mode='a' if rows else 'w', header=rows == 0, index=False, date_format='%Y-%m-%d %H:%M:%S')
+        self.files[name] = (part, rows + len(frame))
+
+def generate(writer, rng, locations, counts, start, end, batch_size=BATCH_SIZE):
+    """Generate counts[table] rows per table between start and end, handing batches to writer."""
+    days, activity = daily_timeline(start, end)
+    makers = {
+        'suppliers': lambda ts: generate_suppliers(rng, locations, ts),
+        'emissions': lambda ts: generate_emissions(rng, locations, ts),
+        'packaging': lambda ts: generate_packaging(rng, ts),
+        'offsets': lambda ts: generate_offsets(rng, ts)
+    }
+    report = {}
+    for table, make in makers.items():
+        if not counts.get(table):
+            continue
+        started = time.perf_counter()
+        with writer.loading(table):
+            for timestamps in iter_timestamps(rng, counts[table], days, activity, batch_size):
+                writer.write(table, make(timestamps))
+        seconds = time.perf_counter() - started
+        report[table] = {'rows': counts[table], 'seconds': seconds}
+        logging.info(f"Generated {counts[table]:,} {table} rows in {seconds:.1f}s ({counts[table] / seconds:,.0f} rows/s)")
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic CarbonX9 data.")
+    parser.add_argument('--db', help="SQLite database to bulk-write into (created and migrated if needed).")
+    parser.add_argument('--csv', help="Directory to write CSV files to instead of (or as well as) a database.")
+    parser.add_argument('--emissions', type=int, default=100000, help="Emissions rows.")
+    parser.add_argument('--packaging', type=int, default=None, help="Packaging rows (default: emissions / 10).")
+    parser.add_argument('--offsets', type=int, default=None, help="Offset rows (default: emissions / 100).")
+    parser.add_argument('--suppliers', type=int, default=None, help="Supplier rows (default: emissions / 1000).")
+    parser.add_argument('--depots', type=int, default=10, help="Synthetic depots around each LOCATIONS city.")
+    today = pd.Timestamp.now().normalize()
+    parser.add_argument('--start', default=str((today - pd.Timedelta(days=DEFAULT_DAYS)).date()), help="First day (YYYY-MM-DD).")
+    parser.add_argument('--end', default=str(today.date()), help="Day after the last day (YYYY-MM-DD).")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help="Random seed.")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="Rows per generated batch and transaction.")
+    args = parser.parse_args(argv)
+    if not args.db and not args.csv:
+        parser.error("Give --db, --csv or both.")
+    counts = {
+        'emissions': args.emissions,
+        'packaging': args.emissions // 10 if args.packaging is None else args.packaging,
+        'offsets': args.emissions // 100 if args.offsets is None else args.offsets,
+        'suppliers': args.emissions // 1000 if args.suppliers is None else args.suppliers
+    }
+    if any(n < 0 for n in counts.values()) or args.depots < 0 or args.batch_size < 1:
+        parser.error("Row counts and --depots must not be negative and --batch-size must be positive.")
+
+    try:
+        for target, make_writer in (('db', DatabaseWriter), ('csv', CsvWriter)):
+            if getattr(args, target):
+                rng = np.random.default_rng(args.seed)
+                locations = generate_locations(rng, args.depots)
+                generate(make_writer(getattr(args, target), locations), rng, locations, counts,
+                         args.start, args.end, args.batch_size)
+    except ValueError as e:
+        parser.error(str(e))
+    except sqlite3.Error as e:
+        parser.error(f"Writing to {args.db} failed: {e}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,44 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import streamlit.logger  # noqa: E402
+streamlit.logger.set_log_level('error')  # silence bare-mode cache warnings
+import app  # noqa: E402
+
+# Known coordinates, so no test depends on the geocoder: two countries with several cities each give domestic
+# lanes in every distance band, and intercontinental ones between them
+TEST_LOCATIONS = pd.DataFrame([
+    ('Germany', 'Berlin', 52.52, 13.405),
+    ('Germany', 'Munich', 48.137, 11.575),
+    ('Germany', 'Hamburg', 53.551, 9.993),
+    ('USA', 'Los Angeles', 34.052, -118.244),
+    ('USA', 'Chicago', 41.878, -87.630),
+    ('USA', 'Anchorage', 61.218, -149.900),
+    ('USA', 'Honolulu', 21.307, -157.858),
+    ('Brazil', 'Sao Paulo', -23.551, -46.633),
+], columns=app.COORDINATE_COLUMNS)
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A freshly migrated database in tmp_path, with TEST_LOCATIONS imported."""
+    monkeypatch.setattr(app, 'DB_PATH', str(tmp_path / 'emissions.db'))
+    assert app.init_db()
+    app.import_coordinates(TEST_LOCATIONS)
+    return app.DB_PATH
+
+@pytest.fixture
+def locations(db):
+    """Every (country, city) with known coordinates in the test database."""
+    static = [(country, city) for country, cities in app.LOCATIONS.items() for city in cities]
+    return static + list(zip(TEST_LOCATIONS['country'], TEST_LOCATIONS['city']))
+
+@pytest.fixture
+def carbon_price(monkeypatch):
+    """Pin the carbon price, which otherwise follows live quotes."""
+    monkeypatch.setattr(app, 'get_carbon_price', lambda: 80.0)
+    return 80.0
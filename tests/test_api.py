@@ -0,0 +1,151 @@
+"""The batch API: result order and indexes, per-item errors, and how failures are reported."""
+import asyncio
+import json
+
+import pytest
+import tornado.httpclient
+import tornado.httpserver
+import tornado.testing
+
+import api
+import app
+
+class InlineRunner:
+    """BatchRunner stand-in that runs chunks on the event loop, and finishes later chunks first."""
+    workers = 1
+
+    def __init__(self):
+        self.offsets = []
+
+    async def run(self, name, chunk, offset, options):
+        self.offsets.append(offset)
+        await asyncio.sleep(0.05 / (1 + len(self.offsets)))
+        return api.run_chunk(name, chunk, offset, options)
+
+def post(path, body, ndjson=True, chunk_items=2, runner=None):
+    """
+    POST to a test server and return the response. body is bytes, or a list of byte strings sent as separate
+    writes so the handler sees them arrive piece by piece.
+    """
+    async def request():
+        sock, port = tornado.testing.bind_unused_port()
+        server = tornado.httpserver.HTTPServer(api.make_application(runner or InlineRunner(), chunk_items))
+        server.add_sockets([sock])
+        client = tornado.httpclient.AsyncHTTPClient(force_instance=True)
+        try:
+            async def produce(write):
+                for piece in body:
+                    await write(piece)
+            return await client.fetch(
+                f'http://127.0.0.1:{port}{path}', method='POST', raise_error=False, request_timeout=120,
+                headers={'Content-Type': 'application/x-ndjson' if ndjson else 'application/json'},
+                **({'body': body} if isinstance(body, bytes) else {'body_producer': produce}))
+        finally:
+            client.close()
+            server.stop()
+    return asyncio.run(request())
+
+def lines(response):
+    return [json.loads(line) for line in response.body.decode().splitlines()]
+
+def ndjson(items):
+    return [json.dumps(item).encode() + b'\n' for item in items]
+
+ENERGY_ITEMS = [{'id': f"site-{i}", 'facility_size_m2': 1000 + 250 * i, 'smart_system_usage': i / 10} for i in range(7)]
+
+def test_results_follow_input_order_across_chunks():
+    runner = InlineRunner()
+    response = post('/v1/energy-savings', ndjson(ENERGY_ITEMS), runner=runner)
+
+    assert response.code == 200
+    assert len(runner.offsets) == 4
+    results = lines(response)
+    assert [result['index'] for result in results] == list(range(len(ENERGY_ITEMS)))
+    assert [result['id'] for result in results] == [item['id'] for item in ENERGY_ITEMS]
+    for item, result in zip(ENERGY_ITEMS, results):
+        assert (result['co2_savings_kg'], result['energy_savings_kwh']) == \
+            app.calculate_energy_savings(item['facility_size_m2'], item['smart_system_usage'])
+        assert result['error'] is None
+
+def test_ndjson_index_is_the_line_number():
+    pieces = [b'\n', *ndjson(ENERGY_ITEMS[:2]), b'  \n', *ndjson(ENERGY_ITEMS[2:4]), b'\n\n', ndjson(ENERGY_ITEMS[4:5])[0].rstrip()]
+    results = lines(post('/v1/energy-savings', pieces))
+
+    assert [result['index'] for result in results] == [1, 2, 4, 5, 8]
+    assert [result['id'] for result in results] == [item['id'] for item in ENERGY_ITEMS[:5]]
+
+def test_json_bodies_are_indexed_by_position():
+    results = lines(post('/v1/energy-savings', json.dumps({'items': ENERGY_ITEMS}).encode(), ndjson=False))
+
+    assert [result['index'] for result in results] == list(range(len(ENERGY_ITEMS)))
+
+def test_invalid_items_get_their_own_error():
+    items = [
+        {'warehouse_size_m2': 1000, 'led_percentage': 0.5, 'solar_percentage': 0.2},
+        {'warehouse_size_m2': -10, 'led_percentage': 0.5, 'solar_percentage': 0.2},
+        {'warehouse_size_m2': 2000, 'led_percentage': 0.1, 'solar_percentage': 0.9},
+        {'warehouse_size_m2': 3000, 'led_percentage': 0.4, 'solar_percentage': 0.3},
+        {'warehouse_size_m2': 4000, 'led_percentage': 1.5, 'solar_percentage': 0.3},
+    ]
+    results = lines(post('/v1/warehouse-savings', ndjson(items), chunk_items=len(items)))
+
+    for item, result in zip(items, results):
+        try:
+            expected, error = app.calculate_warehouse_savings(**item), None
+        except ValueError as e:
+            expected, error = (None, None), str(e)
+        assert result['error'] == error
+        assert (result['co2_savings_kg'], result['energy_savings_kwh']) == expected
+
+def test_bisection_finds_every_invalid_item():
+    items = api.pd.DataFrame({'facility_size_m2': [100.0] * 64, 'smart_system_usage': [0.5] * 64})
+    bad = [0, 17, 18, 63]
+    items.loc[bad, 'smart_system_usage'] = 2.0
+
+    result = api.ENDPOINTS['energy-savings'](items, {})
+
+    assert list(result.index[result['error'].notna()]) == bad
+    assert result['co2_savings_kg'].notna().sum() == 64 - len(bad)
+
+@pytest.mark.parametrize('body, ndjson_body', [
+    (b'{"facility_size_m2": 10}\n', True),
+    (b'not json\n', True),
+    (b'[{"facility_size_m2": 10', False),
+    (b'[1, 2]', False),
+    (b'{"rows": []}', False),
+])
+def test_errors_before_any_result_are_a_400(body, ndjson_body):
+    response = post('/v1/energy-savings', body, ndjson=ndjson_body)
+
+    assert response.code == 400
+    assert response.headers['Content-Type'] == 'application/json'
+    assert set(json.loads(response.body)) == {'error'}
+
+def test_errors_after_results_have_streamed_end_the_stream():
+    items = ENERGY_ITEMS[:2] + [{'id': 'broken', 'smart_system_usage': 0.5}]
+    response = post('/v1/energy-savings', json.dumps(items).encode(), ndjson=False)
+
+    assert response.code == 200
+    *results, last = lines(response)
+    assert [result['index'] for result in results] == [0, 1]
+    assert last == {'error': 'Missing fields: facility_size_m2'}
+
+def test_unknown_endpoint_is_a_404():
+    assert post('/v1/teleport', b'{}\n').code == 404
+
+def test_emissions_are_calculated_and_saved_by_worker_processes(db):
+    items = [{'source_country': 'France', 'source_city': 'Paris', 'dest_country': 'Japan', 'dest_city': 'Tokyo',
+              'transport_mode': mode, 'weight_tons': 2.0} for mode in ('Ship', 'Plane', 'Teleporter')]
+    runner = api.BatchRunner(1, db)
+    try:
+        results = lines(post('/v1/emissions?save=true', ndjson(items), runner=runner))
+    finally:
+        runner.shutdown()
+
+    distance_km = app.calculate_distance('France', 'Paris', 'Japan', 'Tokyo')
+    assert [result['index'] for result in results] == [0, 1, 2]
+    assert [result['co2_kg'] for result in results[:2]] == \
+        [app.calculate_co2('France', 'Paris', 'Japan', 'Tokyo', mode, distance_km, 2.0) for mode in ('Ship', 'Plane')]
+    assert results[2]['error'] == "Invalid transport mode: Teleporter"
+    with app.db_connection() as conn:
+        assert conn.execute('SELECT COUNT(*) FROM emissions').fetchone()[0] == 2
@@ -0,0 +1,78 @@
+"""Schema migrations applied to a database created before migrations existed."""
+import sqlite3
+
+import pytest
+
+import app
+
+# The schema the app created before schema migrations, and shipments recorded with "City, Country" labels
+BASELINE_SCHEMA = '''
+CREATE TABLE suppliers (id TEXT PRIMARY KEY, supplier_name TEXT, country TEXT, city TEXT, material TEXT, green_score INTEGER,
+                        annual_capacity_tons INTEGER, sustainable_practices TEXT, created_at DATETIME DEFAULT CURRENT_TIMESTAMP);
+CREATE TABLE emissions (id TEXT PRIMARY KEY, source TEXT, destination TEXT, transport_mode TEXT, distance_km REAL, co2_kg REAL,
+                        weight_tons REAL, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP);
+CREATE TABLE packaging (id TEXT PRIMARY KEY, material_type TEXT, weight_kg REAL, co2_kg REAL, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP);
+CREATE TABLE offsets (id TEXT PRIMARY KEY, project_type TEXT, co2_offset_tons REAL, cost_usd REAL, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP);
+CREATE TABLE coordinates (country TEXT, city TEXT, lat REAL, lon REAL, PRIMARY KEY (country, city));
+CREATE INDEX idx_suppliers_country ON suppliers(country);
+CREATE INDEX idx_emissions_timestamp ON emissions(timestamp);
+CREATE INDEX idx_packaging_timestamp ON packaging(timestamp);
+CREATE INDEX idx_offsets_timestamp ON offsets(timestamp);
+'''
+BASELINE_EMISSIONS = [
+    ('e1', 'Paris, France', 'Tokyo, Japan', 'Ship', 9714.7, 388.59, 2.0, '2026-01-05 10:00:00'),
+    ('e2', 'Paris, France', 'Tokyo, Japan', 'Plane', 9714.7, 9714.7, 2.0, '2026-01-06 10:00:00'),
+    ('e3', 'New York, USA', 'Paris, France', 'Ship', 5837.2, 350.23, 3.0, '2026-02-01 09:30:00'),
+    ('e4', 'Washington, D.C., USA', 'New York, USA', 'Truck', 328.0, 32.8, 1.0, '2026-02-02 08:00:00'),
+    ('e5', 'Atlantis', 'Paris, France', 'Ship', 1000.0, 20.0, 1.0, '2026-02-03 08:00:00'),
+]
+
+@pytest.fixture
+def baseline_db(tmp_path, monkeypatch):
+    path = str(tmp_path / 'baseline.db')
+    with sqlite3.connect(path) as conn:
+        conn.executescript(BASELINE_SCHEMA)
+        conn.executemany('INSERT INTO emissions VALUES (?, ?, ?, ?, ?, ?, ?, ?)', BASELINE_EMISSIONS)
+    monkeypatch.setattr(app, 'DB_PATH', path)
+    return path
+
+def test_migrations_bring_a_baseline_database_up_to_date(baseline_db):
+    assert app.init_db()
+
+    with sqlite3.connect(baseline_db) as conn:
+        assert conn.execute('PRAGMA user_version').fetchone()[0] == app.SCHEMA_MIGRATIONS[-1][0]
+        assert conn.execute('SELECT COUNT(*) FROM suppliers').fetchone()[0] == len(app.SAMPLE_SUPPLIERS)
+
+def test_locations_are_split_from_the_legacy_labels(baseline_db):
+    assert app.init_db()
+
+    with sqlite3.connect(baseline_db) as conn:
+        linked = conn.execute('''SELECT e.id, s.city, s.country, d.city, d.country FROM emissions e
+                                 JOIN locations s ON s.id = e.source_location_id JOIN locations d ON d.id = e.dest_location_id
+                                 ORDER BY e.id''').fetchall()
+        locations = conn.execute('SELECT COUNT(*) FROM locations').fetchone()[0]
+    assert linked == [
+        ('e1', 'Paris', 'France', 'Tokyo', 'Japan'),
+        ('e2', 'Paris', 'France', 'Tokyo', 'Japan'),
+        ('e3', 'New York', 'USA', 'Paris', 'France'),
+        ('e4', 'Washington, D.C.', 'USA', 'New York', 'USA'),
+        ('e5', 'Atlantis', '', 'Paris', 'France'),
+    ]
+    assert locations == 5
+
+def test_lane_rollup_is_rekeyed_on_location_ids(baseline_db):
+    assert app.init_db()
+
+    lanes = app.get_lane_totals().set_index(['source', 'destination'])
+    assert lanes.loc[('Paris, France', 'Tokyo, Japan'), 'shipments'] == 2
+    assert lanes.loc[('Paris, France', 'Tokyo, Japan'), 'co2_kg'] == pytest.approx(388.59 + 9714.7)
+    assert lanes['shipments'].sum() == len(BASELINE_EMISSIONS)
+
+def test_new_shipments_reuse_migrated_locations(baseline_db):
+    assert app.init_db()
+    app.save_emission('France', 'Paris', 'Japan', 'Tokyo', 'Train', 9714.7, 271.99, 1.0)
+
+    with sqlite3.connect(baseline_db) as conn:
+        assert conn.execute('SELECT COUNT(*) FROM locations').fetchone()[0] == 5
+    lanes = app.get_lane_totals().set_index(['source', 'destination'])
+    assert lanes.loc[('Paris, France', 'Tokyo, Japan'), 'shipments'] == 3
@@ -0,0 +1,41 @@
+"""Keyset pagination and chunked CSV export of the emissions table."""
+import gzip
+import io
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import app
+
+@pytest.fixture
+def emissions(db):
+    """250 stored shipments on 40 distinct timestamps, so pages have to break ties on rowid."""
+    lanes = [('France', 'Paris', 'Japan', 'Tokyo'), ('USA', 'New York', 'United Kingdom', 'London')]
+    frame = pd.DataFrame([(*lanes[i % 2], 'Ship', 1 + i % 7, f"2026-01-{1 + i % 20:02d} 0{i % 2}:00:00") for i in range(250)],
+                         columns=app.INGEST_COLUMNS + ['timestamp'])
+    assert app.ingest_shipments(frame)['inserted'] == len(frame)
+    with sqlite3.connect(app.DB_PATH) as conn:
+        return pd.read_sql(f'SELECT {", ".join(app.EMISSION_COLUMNS)} FROM emissions ORDER BY timestamp DESC, rowid DESC', conn)
+
+@pytest.mark.parametrize('page_size', [1, 40, 250, 1000])
+def test_pages_cover_every_row_once_newest_first(emissions, page_size):
+    pages, key = [], None
+    while True:
+        page, key = app.get_emissions_page(key, page_size)
+        assert len(page) <= page_size
+        pages.append(page)
+        if key is None:
+            break
+
+    pd.testing.assert_frame_equal(pd.concat(pages, ignore_index=True), emissions)
+    assert len(pages) == -(-len(emissions) // page_size)
+
+def test_csv_export_matches_the_table_in_chunks(emissions):
+    chunks = list(app.iter_emissions_csv(chunk_rows=37))
+    exported = pd.read_csv(io.BytesIO(b''.join(chunks)))
+
+    assert len(chunks) == len(emissions) // 37 + 1
+    assert list(exported.columns) == app.EMISSION_COLUMNS
+    assert sorted(exported['id']) == sorted(emissions['id'])
+    assert gzip.decompress(app.export_emissions_csv_gz(chunk_rows=37)) == b''.join(chunks)
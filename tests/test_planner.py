@@ -0,0 +1,43 @@
+"""The fleet consolidation planner."""
+import numpy as np
+import pandas as pd
+
+import app
+
+def consignments(n, low, high, seed=0):
+    rng = np.random.default_rng(seed)
+    frame = pd.DataFrame({
+        'source': rng.choice(['London', 'Paris', 'Berlin'], n),
+        'destination': rng.choice(['Madrid', 'Rome'], n),
+        'weight_tons': rng.uniform(low, high, n).round(3),
+        'distance_km': 0.0,
+        'earliest': rng.uniform(0, 240, n),
+    })
+    frame['distance_km'] = frame['source'].str.len() * 100.0 + frame['destination'].str.len() * 50.0
+    frame['latest'] = frame['earliest'] + 24
+    return frame
+
+def test_light_consignments_are_not_merged_into_a_dirtier_vehicle():
+    pair = pd.DataFrame({'source': 'A', 'destination': 'B', 'weight_tons': [3.0, 3.0], 'distance_km': 100.0})
+    trips, summary = app.plan_consolidation(pair)
+
+    assert list(trips['vehicle']) == ['Electric Van', 'Electric Van']
+    assert summary['co2_kg'] == summary['baseline_co2_kg']
+    assert summary['co2_saved_kg'] == 0
+
+def test_plan_never_emits_more_than_shipping_each_consignment_alone():
+    frame = consignments(3000, 0.2, 3.4)
+    trips, summary = app.plan_consolidation(frame, app.DEFAULT_FLEET)
+
+    assert summary['co2_saved_kg'] >= 0
+    assert summary['trips'] < summary['baseline_trips']
+    assert (trips['load_tons'] <= trips['capacity_tons'] + 1e-6).all()
+    assert sorted(item for items in trips['consignments'] for item in items) == list(frame.index)
+
+def test_heavy_consignments_ship_as_full_loads_plus_a_remainder():
+    frame = pd.DataFrame({'source': 'A', 'destination': 'B', 'weight_tons': [50.0], 'distance_km': 400.0})
+    trips, summary = app.plan_consolidation(frame)
+
+    assert sorted(trips['load_tons']) == [2.0, 24.0, 24.0]
+    assert trips['load_tons'].sum() == 50.0
+    assert summary['co2_saved_kg'] >= 0
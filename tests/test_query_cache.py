@@ -0,0 +1,40 @@
+"""Data-version-stamped caching of dashboard queries."""
+import app
+
+COUNT = 'SELECT COUNT(*) AS n FROM emissions'
+
+def count():
+    return int(app.cached_query(COUNT, tables=('emissions',))['n'].iat[0])
+
+def test_repeated_queries_are_served_from_the_cache(db):
+    cache = app.query_cache()
+    assert count() == 0
+    misses = cache.stats()['misses']
+
+    assert count() == 0
+    assert cache.stats()['misses'] == misses
+
+def test_writes_to_a_table_invalidate_its_queries(db):
+    assert count() == 0
+    app.save_emission('France', 'Paris', 'Japan', 'Tokyo', 'Ship', 9714.7, 388.59, 2.0)
+
+    assert count() == 1
+    assert app.get_emission_totals('mode')['shipments'].sum() == 1
+
+def test_writes_to_other_tables_keep_cached_results(db):
+    cache = app.query_cache()
+    count()
+    hits = cache.stats()['hits']
+    app.save_packaging('Cardboard', 10.0, 8.0)
+
+    assert count() == 0
+    assert cache.stats()['hits'] == hits + 1
+
+def test_cache_stays_within_its_byte_budget(db):
+    cache = app.QueryCache(max_bytes=4096)
+    for i in range(50):
+        cache.frame(f'SELECT {i} AS value, zeroblob(100) AS padding', tables=('emissions',))
+
+    stats = cache.stats()
+    assert 0 < stats['bytes'] <= 4096
+    assert stats['entries'] < 50
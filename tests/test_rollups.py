@@ -0,0 +1,94 @@
+"""The rollup tables against totals recomputed from the emissions and offsets tables."""
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import app
+
+def emission_rollup_mismatches():
+    """(table, expected, stored) for each emission rollup that differs from a GROUP BY over the emissions table."""
+    mismatches = []
+    with sqlite3.connect(app.DB_PATH) as conn:
+        for table, keys, expressions in app.EMISSION_ROLLUPS:
+            expected = pd.read_sql(f'''SELECT {', '.join(f'{e} AS {k}' for k, e in zip(keys, expressions))}, COUNT(*) AS shipments,
+                                              SUM(co2_kg) AS co2_kg, SUM(weight_tons) AS weight_tons, SUM(distance_km * weight_tons) AS ton_km
+                                       FROM emissions GROUP BY {', '.join(expressions)} ORDER BY {', '.join(keys)}''', conn)
+            stored = pd.read_sql(f'''SELECT {', '.join(keys)}, shipments, co2_kg, weight_tons, ton_km FROM {table}
+                                     ORDER BY {', '.join(keys)}''', conn)
+            try:
+                pd.testing.assert_frame_equal(stored, expected, check_dtype=False, rtol=1e-9)
+            except AssertionError:
+                mismatches.append((table, expected, stored))
+    return mismatches
+
+def offset_rollup_mismatches():
+    with sqlite3.connect(app.DB_PATH) as conn:
+        expected = pd.read_sql('''SELECT project_type, COUNT(*) AS projects, SUM(co2_offset_tons) AS co2_offset_tons,
+                                         SUM(cost_usd) AS cost_usd FROM offsets GROUP BY project_type ORDER BY project_type''', conn)
+        stored = pd.read_sql('SELECT project_type, projects, co2_offset_tons, cost_usd FROM offset_totals_by_project ORDER BY project_type', conn)
+    try:
+        pd.testing.assert_frame_equal(stored, expected, check_dtype=False, rtol=1e-9)
+    except AssertionError:
+        return [('offset_totals_by_project', expected, stored)]
+    return []
+
+def shipments(locations, n, seed=0):
+    """n shipments between locations spread over the last 800 days, with some invalid rows mixed in."""
+    rng = np.random.default_rng(seed)
+    source, dest = rng.integers(len(locations), size=(2, n))
+    frame = pd.DataFrame({
+        'source_country': [locations[i][0] for i in source],
+        'source_city': [locations[i][1] for i in source],
+        'dest_country': [locations[i][0] for i in dest],
+        'dest_city': [locations[i][1] for i in dest],
+        'transport_mode': rng.choice(list(app.EMISSION_FACTORS) + ['Rocket'], n),
+        'weight_tons': rng.uniform(-1, 20, n).round(3),
+        'timestamp': (pd.Timestamp.now(tz='UTC').floor('s') - pd.to_timedelta(rng.integers(0, 800 * 86400, n), unit='s'))
+                     .strftime('%Y-%m-%d %H:%M:%S'),
+    })
+    frame.loc[rng.random(n) < 0.05, 'timestamp'] = 'not a date'
+    return frame
+
+def test_ingest_shipments_keeps_rollups_consistent(locations):
+    batch = shipments(locations, 600)
+    summary = app.ingest_shipments(batch, batch_size=128)
+
+    assert summary['inserted'] > 0 and len(summary['rejected']) > 0
+    assert summary['inserted'] + len(summary['rejected']) == len(batch)
+    assert 'Invalid timestamp.' in set(summary['rejected']['error'])
+    assert emission_rollup_mismatches() == []
+
+def test_store_emissions_stores_exactly_the_rows_without_errors(locations):
+    result = app.store_emissions(app.calculate_emissions_bulk(shipments(locations, 200, seed=1)))
+
+    with sqlite3.connect(app.DB_PATH) as conn:
+        stored = conn.execute('SELECT COUNT(*), SUM(co2_kg) FROM emissions').fetchone()
+    valid = result['error'].isna()
+    assert stored == (int(valid.sum()), pytest.approx(result.loc[valid, 'co2_kg'].sum()))
+    assert emission_rollup_mismatches() == []
+
+def test_save_emission_keeps_rollups_consistent(db):
+    app.save_emission('France', 'Paris', 'Japan', 'Tokyo', 'Ship', 9714.7, 388.59, 2.0)
+    app.save_emission('France', 'Paris', 'Japan', 'Tokyo', 'Plane', 9714.7, 9714.7, 2.0)
+
+    assert emission_rollup_mismatches() == []
+
+@pytest.mark.parametrize('chunk_size', [1, 7, app.RETENTION_CHUNK_SIZE])
+def test_purge_expired_keeps_rollups_consistent(locations, chunk_size):
+    app.ingest_shipments(shipments(locations, 400, seed=2))
+    for i in range(30):
+        app.save_offset(f"Project {i % 4}", 1.5 + i, 10.0 * i)
+    with app.db_connection() as conn:
+        conn.execute("UPDATE offsets SET timestamp = datetime('now', '-' || (rowid * 29) || ' days')")
+
+    deleted = app._purge_expired(retention_days=365, chunk_size=chunk_size)
+
+    with sqlite3.connect(app.DB_PATH) as conn:
+        remaining = conn.execute('SELECT COUNT(*) FROM emissions').fetchone()[0]
+        expired = sum(conn.execute(f"SELECT COUNT(*) FROM {table} WHERE timestamp < datetime('now', '-365 days')").fetchone()[0]
+                      for table in app.RETENTION_TABLES)
+    assert deleted > 0 and remaining > 0 and expired == 0
+    assert emission_rollup_mismatches() == []
+    assert offset_rollup_mismatches() == []
@@ -0,0 +1,58 @@
+"""Parquet snapshots of the database tables."""
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import app
+
+pytest.importorskip('pyarrow')
+
+@pytest.fixture
+def emissions(db):
+    frame = pd.DataFrame([('France', 'Paris', 'Japan', 'Tokyo', mode, 1.5 + i, f"2026-{1 + i % 3:02d}-{1 + i % 28:02d} 12:00:00")
+                          for i, mode in enumerate(['Ship', 'Plane', 'Train', 'Truck'] * 15)],
+                         columns=app.INGEST_COLUMNS + ['timestamp'])
+    app.ingest_shipments(frame)
+    return frame
+
+def stored(table, columns):
+    with sqlite3.connect(app.DB_PATH) as conn:
+        return pd.read_sql(f'SELECT {", ".join(columns)} FROM {table} ORDER BY id', conn)
+
+def test_snapshot_round_trips_every_table(emissions):
+    summary = app.export_snapshots()
+
+    assert summary['emissions'] == {'written': 3, 'unchanged': 0, 'removed': 0}
+    for table, (time_column, columns) in app.SNAPSHOT_TABLES.items():
+        names = [name for name, _ in columns]
+        expected = stored(table, names)
+        snapshot = app.read_snapshot(table).sort_values('id', ignore_index=True)
+        expected[time_column] = pd.to_datetime(expected[time_column])
+        pd.testing.assert_frame_equal(snapshot[names], expected, check_dtype=False)
+
+def test_snapshot_rewrites_only_changed_months(emissions):
+    app.export_snapshots()
+    with app.db_connection() as conn:
+        app._rollup_emissions(conn, "timestamp < '2026-02-01'", sign=-1)
+        conn.execute("DELETE FROM emissions WHERE timestamp < '2026-02-01'")
+    app.ingest_shipments(emissions.iloc[:1].assign(timestamp='2026-03-05 08:00:00'))
+
+    summary = app.export_snapshots(tables=['emissions'])
+
+    assert summary['emissions'] == {'written': 1, 'unchanged': 1, 'removed': 1}
+    assert sorted(app.read_snapshot('emissions')['id']) == sorted(stored('emissions', ['id'])['id'])
+
+def test_get_emissions_reads_the_snapshot(emissions):
+    app.export_snapshots(tables=['emissions'])
+    columns = ['source_country', 'dest_city', 'transport_mode', 'co2_kg']
+
+    from_snapshot = app.get_emissions(snapshot=True, columns=columns)
+    from_database = app.get_emissions(columns=columns)
+
+    assert sorted(map(tuple, from_snapshot.astype(str).to_numpy())) == sorted(map(tuple, from_database.astype(str).to_numpy()))
+
+def test_reading_without_a_snapshot_is_an_error(db):
+    assert not app.snapshot_available()
+    with pytest.raises(ValueError):
+        app.read_snapshot('emissions')
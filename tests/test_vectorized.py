@@ -0,0 +1,99 @@
+"""The vectorized bulk functions against the scalar functions they batch."""
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import app
+
+def scalar(fn, *args):
+    """fn(*args), or the message of the ValueError it raises."""
+    try:
+        return fn(*args), None
+    except ValueError as e:
+        return None, str(e)
+
+def test_calculate_emissions_bulk_matches_scalar(locations):
+    rows = [(source, dest, mode, weight)
+            for source, dest in itertools.product(locations, repeat=2)
+            for mode, weight in (('Truck', 2.5), ('Ship', 10.0), ('Plane', 0.0), ('Rocket', 1.0))]
+    shipments = pd.DataFrame([(*source, *dest, mode, weight) for source, dest, mode, weight in rows],
+                             columns=app.INGEST_COLUMNS)
+    result = app.calculate_emissions_bulk(shipments)
+
+    for i, (source, dest, mode, weight) in enumerate(rows):
+        distance_km, error = scalar(app.calculate_distance, *source, *dest)
+        co2_kg = None
+        if error is None:
+            co2_kg, error = scalar(app.calculate_co2, *source, *dest, mode, distance_km, weight)
+        assert result['error'][i] == error, rows[i]
+        if error is None:
+            assert (result['distance_km'][i], result['co2_kg'][i]) == (distance_km, co2_kg), rows[i]
+
+ROUTE_CASES = [
+    (country1, country2, distance_km, weight_tons)
+    for country1, country2 in (('France', 'France'), ('France', 'Japan'))
+    for distance_km in (0.0, 250.0, 999.99, 1000.0, 2500.5, 4999.99, 5000.0, 12000.0)
+    for weight_tons in (0.0, 1.0, 7.3)
+]
+
+@pytest.mark.parametrize('prioritize_green', [False, True])
+def test_optimize_routes_bulk_matches_scalar(prioritize_green):
+    routes = pd.DataFrame(ROUTE_CASES, columns=['source_country', 'dest_country', 'distance_km', 'weight_tons'])
+    result = app.optimize_routes_bulk(routes, prioritize_green)
+
+    for i, (country1, country2, distance_km, weight_tons) in enumerate(ROUTE_CASES):
+        expected, error = scalar(app.optimize_route, country1, 'A', country2, 'B', distance_km, weight_tons, prioritize_green)
+        assert result['error'][i] == error, ROUTE_CASES[i]
+        if error is None:
+            option, optimized_co2, _, _, current_co2 = expected
+            row = result.iloc[i]
+            assert (row['mode1'], row['ratio1'], row['mode2']) == option[:3], ROUTE_CASES[i]
+            assert (row['optimized_co2'], row['current_co2']) == (optimized_co2, current_co2), ROUTE_CASES[i]
+
+@pytest.mark.parametrize('prioritize_green', [False, True])
+def test_pareto_routes_bulk_matches_scalar(carbon_price, prioritize_green):
+    routes = pd.DataFrame(ROUTE_CASES, columns=['source_country', 'dest_country', 'distance_km', 'weight_tons'])
+    result = app.pareto_routes_bulk(routes, prioritize_green)
+
+    for i, (country1, country2, distance_km, weight_tons) in enumerate(ROUTE_CASES):
+        frontier, error = scalar(app.pareto_routes, country1, country2, distance_km, weight_tons, prioritize_green)
+        assert result['error'][i] == error, ROUTE_CASES[i]
+        if error is None:
+            balanced = frontier[frontier['balanced']].iloc[0]
+            row = result.iloc[i]
+            assert row['pareto_options'] == len(frontier), ROUTE_CASES[i]
+            assert (row['balanced_mode1'], row['balanced_co2'], row['balanced_cost_eur'], row['balanced_hours']) == \
+                (balanced['mode1'], balanced['co2_kg'], balanced['cost_eur'], balanced['transit_hours']), ROUTE_CASES[i]
+
+def test_pareto_frontier_depends_on_distance_band(carbon_price):
+    short = app.pareto_routes('France', 'France', 300, 1.0)
+    long = app.pareto_routes('France', 'Japan', 9000, 1.0)
+    assert not {'Ship', 'Plane'} & (set(short['mode1']) | set(short['mode2'].dropna()))
+    assert set(long['mode1']) <= {'Ship', 'Plane'}
+
+def test_pareto_frontier_is_not_shared_between_callers(carbon_price):
+    app.pareto_routes('France', 'France', 300, 1.0)['co2_kg'] = -1
+    assert (app.pareto_routes('France', 'France', 300, 1.0)['co2_kg'] > 0).all()
+
+SAVINGS_CASES = [
+    (app.warehouse_savings_model, app.calculate_warehouse_savings,
+     [(1000, 0.5, 0.2), (12345.6, 1.0, 0.0), (-5, 0.5, 0.5), (800, 1.5, 0.1), (2500, 0.333, 0.667)]),
+    (app.load_optimization_model, app.calculate_load_optimization,
+     [(100, 20, 150), (57.5, 9, 100), (0, 20, 100), (19.7, 2, 35.5)]),
+    (app.energy_savings_model, app.calculate_energy_savings,
+     [(5000, 0.25), (1234.5, 0.999), (100, -0.1), (0, 0.5)]),
+]
+
+@pytest.mark.parametrize('model, calculate, cases', SAVINGS_CASES, ids=lambda value: getattr(value, '__name__', ''))
+def test_savings_models_match_scalar(model, calculate, cases):
+    valid = [case for case in cases if scalar(calculate, *case)[1] is None]
+    savings = {name: app._round_like_builtin(values) for name, values in model(*np.array(valid, dtype=float).T).items()}
+    for i, case in enumerate(valid):
+        if 'trips_saved' in savings:
+            assert (int(savings['trips_saved'][i]), savings['co2_savings_kg'][i]) == calculate(*case)
+        else:
+            assert (savings['co2_savings_kg'][i], savings['energy_savings_kwh'][i]) == calculate(*case)
+    with pytest.raises(ValueError):
+        model(*np.array(cases, dtype=float).T)